@@ -92,6 +92,7 @@ API_PREFIX = "/api/v1"
 
 app.include_router(system.router, prefix=API_PREFIX + "/system", tags=["System"])
 app.include_router(chat.router, prefix=API_PREFIX + "/chat", tags=["Chat"], dependencies=[Depends(verify_api_key)])
+app.include_router(chat.ws_router, prefix=API_PREFIX + "/chat", tags=["Chat"])
 app.include_router(audio.router, prefix=API_PREFIX + "/audio", tags=["Audio"], dependencies=[Depends(verify_api_key)])
 app.include_router(profile.router, prefix=API_PREFIX + "/profile", tags=["Profile"], dependencies=[Depends(verify_api_key)])
 app.include_router(config.router, prefix=API_PREFIX + "/config", tags=["Config"], dependencies=[Depends(verify_api_key)])
@@ -104,6 +105,22 @@ async def startup_event():
     from server.core.monitor import monitor_hub
     await monitor_hub.start()
     await monitor_hub.start_broadcasting()
+    from server.core.memory.vector_store import vector_store
+    vector_store.ensure_indexes()
+    vector_store.migrate_embeddings_async()
+    from server.core.memory.consolidation import memory_consolidator
+    memory_consolidator.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from server.core.memory.ingestion import active_recall_ingestor
+    from server.core.memory.vector_store import vector_store
+    from server.core.memory.consolidation import memory_consolidator
+    from server.core.memory import memory_manager
+    memory_consolidator.stop()
+    active_recall_ingestor.stop()
+    memory_manager.legacy.flush_ltm()
+    vector_store.save_indexes()
 app.include_router(search_router.router, prefix=API_PREFIX, tags=["Search"])
 app.include_router(vision_api.router, prefix=API_PREFIX, tags=["Vision"])
 app.include_router(files.router, prefix=API_PREFIX, tags=["Files"])
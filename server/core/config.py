@@ -13,10 +13,32 @@ class Settings(BaseModel):
     models_root_dir: str = str(BASE_DIR / "Models" / "llm")
     model_path: str = str(LLM_DIR / "qwen2.5-1.5b-instruct-q4_k_m.gguf")
     default_model_name: str = "server-qwen2.5-7b"  # Logical name used in projects
+    model_aliases: dict = {}  # Logical model name -> GGUF path (absolute or relative to models_root_dir)
+    llm_pool_ram_mb: int = 8192  # Budget for all resident models, estimated from GGUF file sizes
+    # Logical model name -> {"draft": small GGUF of the same family, or omitted for prompt lookup,
+    # "num_pred_tokens": 8, "mode": "off" to disable}
+    speculative_decoding: dict = {}
     n_ctx: int = 4096
+    model_use_mmap: bool = True
+    model_use_mlock: bool = False  # Pin weights in RAM so the OS never pages them out
+    model_warmup: bool = True  # Evaluate one token after loading, before the model takes requests
     n_threads: int = 4
+    n_batch: int = 512
     temperature: float = 0.7
     top_p: float = 0.9
+
+    # Context Budget: shares of n_ctx (after the response reserve) per prompt source.
+    # Chat history gets whatever the other sources leave.
+    context_response_reserve: int = 1024
+    context_budgets: dict = {"persona": 0.15, "search": 0.2, "memory": 0.15, "agent_context": 0.4, "report": 0.7}
+
+    # LLM Scheduler Settings
+    llm_queue_size: int = 64  # Max requests waiting for a model across all lanes
+    llm_lane_limits: dict = {"interactive": 2, "classification": 1, "background": 1}
+
+    # Prompt Prefix Cache (llama.cpp KV state snapshots)
+    prompt_cache_mb: int = 512  # 0 disables the cache
+    prompt_cache_block_tokens: int = 64
     
     # Server Settings
     host: str = "0.0.0.0"
@@ -26,6 +48,17 @@ class Settings(BaseModel):
     # Search Settings
     enable_search: bool = True
 
+    # Semantic Response Cache (opt-in)
+    enable_response_cache: bool = False
+    response_cache_threshold: float = 0.95  # Cosine similarity needed to reuse a response
+    response_cache_ttl_seconds: int = 86400
+    response_cache_max_entries: int = 1000
+
+    # Turn Classifier Settings (search / recall intent)
+    turn_classifier_k: int = 5
+    turn_classifier_min_confidence: float = 0.6  # Below this the kNN vote defers to one LLM call
+    turn_classifier_llm_fallback: bool = True
+
     # Audio Settings
     enable_audio: bool = False
     tts_api_url: str = "http://127.0.0.1:9880"  # Default GPT-SoVITS port
@@ -58,10 +91,24 @@ class Settings(BaseModel):
     # Paths
     memory_path: str = str(DATA_DIR / "memory.json")
     user_profile_path: str = str(DATA_DIR / "user_profile.json")
+    long_term_memory_path: str = str(DATA_DIR / "long_term_memory.json")
+    secret_key_path: str = str(DATA_DIR / "secret.key")
 
     # Database Settings
     database_url: str = "sqlite:///./server/data/projects.db"  # Default to SQLite
     vector_dim: int = 384 # Default for all-MiniLM-L6-v2
+    embedding_storage_dtype: str = "float32"  # SQLite embedding BLOBs: float32, float16 or int8
+    ann_index_enabled: bool = True  # In-process IVF index for the SQLite vector store
+    ann_nprobe: int = 16  # Inverted lists scanned per query once a layer is clustered
+    ann_min_train_rows: int = 2048  # Below this a layer is searched exactly
+    ann_save_interval_seconds: int = 10
+    ann_quantization: str = "none"  # "int8" or "binary": search on compact codes, re-rank exactly from the database
+    ann_rerank_factor: int = 16  # Candidates re-ranked per requested result when quantized
+    hybrid_search_enabled: bool = True  # Fuse FTS5 BM25 with vector similarity (SQLite)
+    hybrid_search_layers: list = ["subconscious"]  # Layers searched hybrid; "active_recall" is also supported
+    hybrid_candidates: int = 50  # Candidates taken from each of the lexical and dense sides
+    hybrid_rrf_k: int = 60  # Reciprocal rank fusion constant
+    memory_layer_budgets_ms: dict = {"instinct": 150, "subconscious": 300, "active_recall": 500}  # Per-layer search deadline within a turn
     
     # OpenAI Settings (for Embeddings/LLM Triggers)
     openai_api_key: str = ""
@@ -69,8 +116,19 @@ class Settings(BaseModel):
     embedding_model: str = "text-embedding-3-small"
 
     # Local Embedding Settings
-    embedding_provider: str = "local" # local or openai
+    embedding_provider: str = "local" # local, onnx (int8 export of the local model) or openai
+    embedding_cache_size: int = 4096  # Texts whose embeddings are kept in memory (LRU)
+    memory_ingest_queue_size: int = 1000  # Active recall messages waiting to be written
+    memory_ingest_batch_size: int = 32  # Rows embedded and inserted per transaction
+    memory_ingest_flush_seconds: float = 1.0  # Longest a queued message waits for a batch to fill
+    consolidation_enabled: bool = True  # Periodically fold repeated active memories into subconscious patterns
+    consolidation_interval_seconds: int = 3600
+    consolidation_llm_summaries: bool = True  # Summarize clusters with the LLM (background priority)
+    consolidation_max_leaders: int = 5000  # New memories compared per run, the oldest first; the rest wait for the next run
     local_embedding_model: str = "all-MiniLM-L6-v2" # sentence-transformers model
+    onnx_embedding_dir: str = str(BASE_DIR / "Models" / "embeddings" / "all-MiniLM-L6-v2-onnx")  # Written by scripts/export_onnx_embedding.py
+    onnx_threads: int = 0  # onnxruntime intra-op threads, 0 lets it decide
+    onnx_max_length: int = 256  # Tokens per text, longer texts are truncated
 
     def save(self, path=None):
         target = Path(path) if path else (CONFIG_DIR / "settings.json")
@@ -0,0 +1,182 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat template adds around each message (role markers, separators)
+MESSAGE_OVERHEAD = 8
+# Rough characters per token, used when no model is loaded to tokenize with
+CHARS_PER_TOKEN = 4
+
+class ContextAssembler:
+    """
+    Fits prompts into the model's context window.
+
+    Every source of prompt text (persona, chat history, memory layers, search
+    results, agent context) gets a share of the window from
+    `settings.context_budgets`, after `settings.context_response_reserve` tokens
+    are kept free for the reply. Chat history is not budgeted up front: it
+    fills whatever the other sources leave, newest messages first.
+
+    Token counts come from the loaded model's tokenizer and are cached per
+    (model file, text), so history messages are only tokenized once across
+    turns and counts survive reloads of the same file.
+    Without a loaded model a characters-per-token estimate is used.
+    """
+
+    def __init__(self, cache_size: int = 4096):
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self.stats = {"tokenized": 0, "cache_hits": 0, "truncated": 0, "dropped_messages": 0}
+
+    # --- Token accounting ---
+
+    @staticmethod
+    def _tokenize(model, text: str) -> List[int]:
+        return model.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+
+    def count(self, model, text: str) -> int:
+        if not text:
+            return 0
+        if model is None:
+            return len(text) // CHARS_PER_TOKEN + 1
+
+        # Keyed by file rather than id(model): ids are reused once a model is unloaded
+        path = getattr(model, "model_path", None)
+        key = (path, text)
+        if path:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    return cached
+
+        try:
+            n = len(self._tokenize(model, text))
+        except Exception as e:
+            logger.debug(f"Tokenization failed, estimating: {e}")
+            return len(text) // CHARS_PER_TOKEN + 1
+
+        with self._lock:
+            self.stats["tokenized"] += 1
+            if path:
+                self._cache[key] = n
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return n
+
+    def count_message(self, model, message: Dict[str, str]) -> int:
+        return self.count(model, message.get("content") or "") + MESSAGE_OVERHEAD
+
+    def prompt_budget(self, model) -> int:
+        n_ctx = settings.n_ctx
+        if model is not None:
+            try:
+                n_ctx = model.n_ctx()
+            except Exception:
+                pass
+        return max(0, n_ctx - settings.context_response_reserve)
+
+    def budget(self, source: str, model) -> int:
+        return int(self.prompt_budget(model) * settings.context_budgets.get(source, 0.0))
+
+    # --- Fitting ---
+
+    def fit(self, model, text: str, budget: int, keep: str = "head") -> str:
+        """
+        Trim `text` to at most `budget` tokens. `keep="head"` keeps the start
+        (ranked content such as search results, memory layers in priority order),
+        `keep="tail"` keeps the end (running logs such as agent context).
+        """
+        if not text or self.count(model, text) <= budget:
+            return text
+        with self._lock:
+            self.stats["truncated"] += 1
+        if budget <= 0:
+            return ""
+
+        if model is not None:
+            try:
+                tokens = self._tokenize(model, text)
+                tokens = tokens[:budget] if keep == "head" else tokens[-budget:]
+                trimmed = model.detokenize(tokens).decode("utf-8", errors="ignore")
+            except Exception:
+                trimmed = self._fit_chars(text, budget, keep)
+        else:
+            trimmed = self._fit_chars(text, budget, keep)
+
+        # Prefer cutting at a line boundary so entries are not left half-written
+        if keep == "head":
+            cut = trimmed.rfind("\n")
+            return trimmed[:cut] if cut > len(trimmed) // 2 else trimmed
+        cut = trimmed.find("\n")
+        return trimmed[cut + 1:] if 0 <= cut < len(trimmed) // 2 else trimmed
+
+    @staticmethod
+    def _fit_chars(text: str, budget: int, keep: str) -> str:
+        limit = budget * CHARS_PER_TOKEN
+        return text[:limit] if keep == "head" else text[-limit:]
+
+    def assemble_chat(self, model, system_prompt: str, history: List[Dict[str, str]],
+                      turn_context: Optional[str], user_input: str) -> List[Dict[str, str]]:
+        """
+        Build [persona, history..., turn context, user] within the prompt budget.
+        The user turn is always kept; history is dropped oldest-first.
+        """
+        # The current user turn is already recorded in history; it is sent once, last
+        if history and history[-1].get("role") == "user" and history[-1].get("content") == user_input:
+            history = history[:-1]
+
+        total = self.prompt_budget(model)
+        persona = self.fit(model, system_prompt, self.budget("persona", model))
+        context_budget = self.budget("search", model) + self.budget("memory", model)
+        turn_context = self.fit(model, turn_context, context_budget) if turn_context else ""
+        user_input = self.fit(model, user_input, max(0, total // 2))
+
+        used = self.count(model, persona) + self.count(model, user_input) + 2 * MESSAGE_OVERHEAD
+        if turn_context:
+            used += self.count(model, turn_context) + MESSAGE_OVERHEAD
+        remaining = total - used
+
+        kept: List[Dict[str, str]] = []
+        for message in reversed(history):
+            cost = self.count_message(model, message)
+            if cost > remaining:
+                break
+            kept.append(message)
+            remaining -= cost
+        kept.reverse()
+
+        dropped = len(history) - len(kept)
+        if dropped:
+            with self._lock:
+                self.stats["dropped_messages"] += dropped
+            logger.debug(f"Context budget: dropped {dropped} oldest history messages")
+
+        messages = [{"role": "system", "content": persona}]
+        messages.extend(kept)
+        if turn_context:
+            messages.append({"role": "system", "content": turn_context})
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def fit_entries(self, model, entries: List[str], budget: int) -> List[str]:
+        """Share `budget` evenly between entries (e.g. agent outputs for a report), trimming each from the end."""
+        if not entries:
+            return entries
+        if sum(self.count(model, e) for e in entries) <= budget:
+            return entries
+        share = budget // len(entries)
+        return [self.fit(model, e, share) for e in entries]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "cached_texts": len(self._cache)}
+
+context_assembler = ContextAssembler()
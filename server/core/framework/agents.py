@@ -7,7 +7,9 @@ from datetime import datetime
 from .agent import BaseAgent
 from .events import Event
 from .bus import message_bus
-from server.core.llm import llm_engine
+from server.core.llm_pool import llm_pool
+from server.core.llm_scheduler import llm_scheduler, Priority
+from server.core.context_budget import context_assembler
 from server.core.tools import get_tool_descriptions, execute_tool
 from server.core.framework.planning import decompose_tasks
 from server.core.database import SessionLocal
@@ -49,6 +51,10 @@ class GenericLLMAgent(BaseAgent):
         )
 
         try:
+            engine = await asyncio.to_thread(llm_pool.get, self.model_name)
+            # The orchestrator context grows with every finished task; keep the most recent outputs
+            context = context_assembler.fit(engine.model, context, context_assembler.budget("agent_context", engine.model), keep="tail")
+
             # Build Prompt
             tool_descriptions = get_tool_descriptions()
             full_prompt = f"""
@@ -64,9 +70,8 @@ class GenericLLMAgent(BaseAgent):
 {I18N.t('agent_instruction')}
 {I18N.t('agent_instruction_detail')}
 """
-            # Call LLM
-            # Note: In real system, we should pass model_name to llm_engine
-            gen = await asyncio.to_thread(llm_engine.generate_response, full_prompt)
+            # Call LLM on this agent's model (loaded into the pool on first use)
+            gen = await llm_scheduler.submit(engine.generate_response, full_prompt, priority=Priority.BACKGROUND)
             
             # Tool Execution Logic (Simplified)
             # In a robust system, this should be a loop or handled by a ToolManager
@@ -244,7 +249,7 @@ class OrchestratorAgent(BaseAgent):
             "workflow_id": self.workflow_id
         }, correlation_id=self.correlation_id)
 
-        self.tasks = await decompose_tasks(message)
+        self.tasks = await decompose_tasks(message, model_name=self.lead_model_name())
         # Initialize task status
         for i, t in enumerate(self.tasks):
             t['status'] = 'pending'
@@ -471,10 +476,14 @@ class OrchestratorAgent(BaseAgent):
             "api_key": self.api_key
         }, correlation_id=self.correlation_id)
         
-        report_text = "\n".join([f"[{o['role']}] {o['task']}: {o['content']}" for o in self.outputs])
+        engine = await asyncio.to_thread(llm_pool.get, self.lead_model_name())
+        # Every role gets an equal share of the report budget
+        entries = [f"[{o['role']}] {o['task']}: {o['content']}" for o in self.outputs]
+        entries = context_assembler.fit_entries(engine.model, entries, context_assembler.budget("report", engine.model))
+        report_text = "\n".join(entries)
         prompt = f"作为总负责人，请根据以下各角色的工作输出，生成一份最终的总结报告：\n{report_text}"
         
-        report = await asyncio.to_thread(llm_engine.generate_response, prompt)
+        report = await llm_scheduler.submit(engine.generate_response, prompt, priority=Priority.BACKGROUND)
 
         await self.send_event("monitor", "orchestration.status", {
             "type": "orchestration",
@@ -492,6 +501,12 @@ class OrchestratorAgent(BaseAgent):
         else:
             await super()._handle_direct(event)
 
+    def lead_model_name(self) -> Optional[str]:
+        # Planning and the final report run on the lead agent's model (first agent, usually the coordinator)
+        if not self.agents_metadata:
+            return None
+        return self.agents_metadata[0].get("model_name")
+
     def match_agent(self, target_role: str) -> dict:
         if not self.agents_metadata:
             return {"role_name": "System"}
@@ -1,8 +1,7 @@
-import json
-import re
 import asyncio
 from typing import List, Optional
-from server.core.llm import llm_engine
+from server.core.llm_pool import llm_pool
+from server.core.llm_scheduler import llm_scheduler, Priority
 from server.core.i18n import I18N
 
 def get_planning_prompt(message: str) -> str:
@@ -21,28 +20,36 @@ def get_planning_prompt(message: str) -> str:
 ]
 """
 
-def parse_json_from_llm(text: str) -> Optional[List[dict]]:
-    """Try to parse JSON from LLM response, handling code blocks."""
-    try:
-        # Strip markdown code blocks if present
-        text = text.strip()
-        if text.startswith("```"):
-            text = re.sub(r"^```(json)?", "", text)
-            text = re.sub(r"```$", "", text)
-        return json.loads(text.strip())
-    except Exception as e:
-        print(f"JSON Parse Error: {e}, Text: {text}")
-        return None
+# Output schema for decomposition; the engine constrains generation to it
+PLAN_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 8,
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string", "maxLength": 16},
+            "title": {"type": "string", "maxLength": 60},
+            "content": {"type": "string", "maxLength": 300},
+            "target_role": {"type": "string", "maxLength": 40},
+            "dependencies": {"type": "array", "maxItems": 4, "items": {"type": "string", "maxLength": 16}}
+        },
+        "required": ["id", "title", "content", "target_role", "dependencies"],
+        "additionalProperties": False
+    }
+}
 
-async def decompose_tasks(message: str) -> List[dict]:
+async def decompose_tasks(message: str, model_name: Optional[str] = None) -> List[dict]:
     """
     Dynamically decompose tasks using LLM.
     Fallback to hardcoded steps if LLM fails.
     """
     prompt = get_planning_prompt(message)
     try:
-        response = await asyncio.to_thread(llm_engine.generate_response, prompt)
-        steps = parse_json_from_llm(response)
+        engine = await asyncio.to_thread(llm_pool.get, model_name)
+        steps = await llm_scheduler.submit(
+            engine.generate_json, [{"role": "user", "content": prompt}], schema=PLAN_SCHEMA, priority=Priority.BACKGROUND
+        )
         if steps and isinstance(steps, list):
             return steps
     except Exception as e:
@@ -1,5 +1,7 @@
 import os
+import time
 import logging
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,104 +14,197 @@ except ImportError:
 
 from .config import settings
 from .memory import memory_manager
+from .llm_cache import PrefixStateCache
+from .context_budget import context_assembler
+from . import structured_output
+from .llm_speculative import build_draft_model
 
 import datetime
 
 class LLMEngine:
-    def __init__(self):
+    def __init__(self, model_path: str = None, background: bool = False, model_name: str = None):
+        # None follows settings.model_path (the default model); pooled engines pin a file
+        self.pinned_path = model_path
+        self.model_name = model_name or settings.default_model_name  # Logical name, selects per-model options
         self.model = None
         self.loaded_at = None
-        self.status = "initializing" # initializing, ready, error
+        self.loaded_path = None  # File behind self.model; differs from model_path while swapping
+        self.status = "initializing" # initializing, loading, ready, error
         self.last_error = None
-        self.load_model()
+        self.prompt_cache = None
+        self.draft_model = None
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        self.swapping = False
+        self._load_lock = threading.Lock()
+        self._load_generation = 0
+        if background:
+            self.load_async()
+        else:
+            self.load_model()
 
-    def load_model(self):
-        self.model = None
-        self.loaded_at = None
-        self.status = "loading"
-        self.last_error = None
-        
+    @property
+    def model_path(self) -> str:
+        return self.pinned_path or settings.model_path
+
+    def _build_model(self, path: str):
+        """Load a GGUF into a new Llama with its own prompt cache and draft model. Raises on failure."""
         if not Llama:
-            self.status = "error"
-            self.last_error = "llama-cpp-python not installed"
-            logger.warning("llama-cpp-python not installed. LLM will not work.")
-            return
+            raise RuntimeError("llama-cpp-python not installed")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model not found at {path}")
 
-        if not os.path.exists(settings.model_path):
-            self.status = "error"
-            self.last_error = f"Model not found at {settings.model_path}"
-            logger.warning(f"Model not found at {settings.model_path}. Please download a GGUF model.")
-            return
+        draft_model = build_draft_model(self.model_name)
+        model = Llama(
+            model_path=path,
+            n_ctx=settings.n_ctx,
+            n_threads=settings.n_threads,
+            n_batch=settings.n_batch,
+            use_mmap=settings.model_use_mmap,
+            use_mlock=settings.model_use_mlock,
+            draft_model=draft_model,
+            verbose=False
+        )
+        if settings.model_warmup:
+            # One tiny evaluation pages the weights in and initialises compute
+            # buffers, so the first real request doesn't pay for it
+            model.create_completion("Hello", max_tokens=1)
+            model.reset()
 
-        try:
-            self.model = Llama(
-                model_path=settings.model_path,
-                n_ctx=settings.n_ctx,
-                n_threads=settings.n_threads,
-                verbose=False
+        cache = None
+        if settings.prompt_cache_mb > 0:
+            # A fresh cache per model: saved states are only valid for the model that produced them
+            cache = PrefixStateCache(
+                capacity_bytes=settings.prompt_cache_mb * 1024 * 1024,
+                block_size=settings.prompt_cache_block_tokens
             )
+            model.set_cache(cache)
+        return model, cache, draft_model
+
+    def _load(self, path: str, generation: int):
+        try:
+            model, cache, draft_model = self._build_model(path)
+        except Exception as e:
+            with self._load_lock:
+                if generation != self._load_generation:
+                    return
+                self.swapping = False
+                self.last_error = str(e)
+                # Keep serving the previous model if there is one
+                self.status = "ready" if self.model is not None else "error"
+            logger.error(f"Error loading model {path}: {e}")
+            return
+
+        with self._load_lock:
+            if generation != self._load_generation:
+                # A newer load was requested meanwhile; it wins
+                return
+            # Requests already running keep their reference to the old model
+            self.model = model
+            self.prompt_cache = cache
+            self.draft_model = draft_model
+            self.generated_tokens = 0
+            self.generation_seconds = 0.0
+            self.loaded_path = path
             self.loaded_at = datetime.datetime.now().isoformat()
+            self.last_error = None
+            self.swapping = False
             self.status = "ready"
-            logger.info(f"Model loaded from {settings.model_path}")
-        except Exception as e:
-            self.status = "error"
-            self.last_error = str(e)
-            logger.error(f"Error loading model: {e}")
+        logger.info(f"Model loaded from {path}")
+
+    def _begin_load(self) -> int:
+        with self._load_lock:
+            self._load_generation += 1
+            self.last_error = None
+            if self.model is None:
+                self.status = "loading"
+            else:
+                self.swapping = True
+            return self._load_generation
+
+    def load_model(self):
+        """Load (or swap to) `model_path` in the calling thread."""
+        self._load(self.model_path, self._begin_load())
+
+    def load_async(self) -> threading.Thread:
+        """
+        Load (or swap to) `model_path` in a background thread. Until the new
+        model is ready the current one, if any, keeps serving requests.
+        """
+        generation = self._begin_load()
+        thread = threading.Thread(target=self._load, args=(self.model_path, generation), name="llm-loader", daemon=True)
+        thread.start()
+        return thread
 
     def reload_model(self):
         logger.info("Reloading model...")
-        self.load_model()
+        self.load_async()
 
-    def generate_response(self, user_input: str, system_prompt: str = None) -> str:
-        if not self.model:
-            return f"System Alert: Neural Cloud Model not found or failed to load.\nPath: {settings.model_path}\nPlease configure the model path in SETTINGS."
+    def unload(self):
+        with self._load_lock:
+            self._load_generation += 1
+            self.model = None
+            self.prompt_cache = None
+            self.draft_model = None
+            self.loaded_path = None
+            self.swapping = False
+            self.status = "unloaded"
 
-        if not system_prompt:
-            system_prompt = memory_manager.get_context_prompt()
+    def get_status(self) -> dict:
+        return {
+            "status": self.status,
+            "swapping": self.swapping,
+            "model_path": self.loaded_path,
+            "target_path": self.model_path,
+            "loaded_at": self.loaded_at,
+            "error": self.last_error
+        }
 
-        # Prepare messages including history
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(memory_manager.get_history())
-        messages.append({"role": "user", "content": user_input})
-        
-        return self.generate_completion(messages)
+    def _record_generation(self, tokens: int, seconds: float):
+        self.generated_tokens += tokens
+        self.generation_seconds += seconds
 
-    def stream_response(self, user_input: str, system_prompt: str = None):
-        if not self.model:
-            yield f"System Alert: Neural Cloud Model not found or failed to load.\nPath: {settings.model_path}\nPlease configure the model path in SETTINGS."
-            return
+    def get_speculative_stats(self) -> dict:
+        """Draft acceptance and effective decode speed, to compare against the tuned baseline."""
+        from .llm_tuner import llm_tuner
+
+        stats = self.draft_model.get_stats() if self.draft_model else {"mode": "off"}
+        tuned = llm_tuner.get_result(self.loaded_path) if self.loaded_path else None
+        stats.update({
+            "model": self.model_name,
+            "generated_tokens": self.generated_tokens,
+            "effective_tokens_per_sec": round(self.generated_tokens / self.generation_seconds, 2) if self.generation_seconds else 0.0,
+            "baseline_tokens_per_sec": tuned["best"]["gen_tps"] if tuned else None
+        })
+        return stats
 
+    def build_messages(self, user_input: str, system_prompt: str = None, turn_context: str = None) -> list:
+        """
+        Persona prompt first, then history, then anything specific to this turn.
+        Keeping per-turn context (search results, recalled memories) out of the
+        leading system prompt keeps the prompt prefix identical between turns,
+        so the prefix state cache can skip re-evaluating it.
+        Everything is fitted to the context window by the context assembler.
+        """
         if not system_prompt:
             system_prompt = memory_manager.get_context_prompt()
 
-        # Prepare messages including history
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(memory_manager.get_history())
-        messages.append({"role": "user", "content": user_input})
-        
-        try:
-            # Enable stream=True
-            stream = self.model.create_chat_completion(
-                messages=messages,
-                temperature=settings.temperature,
-                top_p=settings.top_p,
-                max_tokens=2048, 
-                stream=True
-            )
-            
-            for chunk in stream:
-                if "content" in chunk["choices"][0]["delta"]:
-                    yield chunk["choices"][0]["delta"]["content"]
-                    
-        except Exception as e:
-            logger.error(f"Error streaming response: {e}")
-            yield f"Error: {e}"
+        return context_assembler.assemble_chat(
+            self.model, system_prompt, memory_manager.get_history(), turn_context, user_input
+        )
+
+    def generate_response(self, user_input: str, system_prompt: str = None, turn_context: str = None) -> str:
+        if not self.model:
+            return f"System Alert: Neural Cloud Model not found or failed to load.\nPath: {self.model_path}\nPlease configure the model path in SETTINGS."
+
+        return self.generate_completion(self.build_messages(user_input, system_prompt, turn_context))
 
     def generate_completion(self, messages: list) -> str:
         if not self.model:
              return "Error: LLM model is not loaded."
 
         try:
+            started = time.perf_counter()
             # Set max_tokens explicitly to avoid default truncation
             response = self.model.create_chat_completion(
                 messages=messages,
@@ -121,6 +216,7 @@ class LLMEngine:
             
             content = response["choices"][0]["message"]["content"]
             finish_reason = response["choices"][0]["finish_reason"]
+            self._record_generation(response.get("usage", {}).get("completion_tokens", 0), time.perf_counter() - started)
             
             logger.info(f"Response generated. Length: {len(content)}. Finish reason: {finish_reason}")
             
@@ -132,18 +228,45 @@ class LLMEngine:
             logger.error(f"Error generating response: {e}")
             return f"Error generating response: {e}"
 
-    def stream_response(self, user_input: str, system_prompt: str = None):
+    def generate_json(self, messages: list, schema: dict = None, grammar: str = None, max_tokens: int = None):
+        """
+        Structured generation: output is constrained by a JSON schema or a GBNF
+        grammar and returned parsed (None if the model is not loaded or the output
+        cannot be parsed). `max_tokens` defaults to what the schema can need.
+        """
+        if not self.model:
+            return None
+
+        if max_tokens is None:
+            max_tokens = structured_output.max_tokens_for(schema)
+        try:
+            response = self.model.create_chat_completion(
+                messages=messages,
+                temperature=settings.temperature,
+                top_p=settings.top_p,
+                max_tokens=max_tokens,
+                grammar=structured_output.get_grammar(schema, grammar),
+                stream=False
+            )
+            content = response["choices"][0]["message"]["content"]
+        except Exception as e:
+            logger.error(f"Error generating structured response: {e}")
+            return None
+
+        data = structured_output.parse_json(content)
+        if data is None:
+            logger.warning(f"Structured response was not valid JSON: '{content[:200]}'")
+        return data
+
+    def stream_response(self, user_input: str, system_prompt: str = None, turn_context: str = None):
         if not self.model:
             yield "Error: LLM model is not loaded."
             return
 
-        if not system_prompt:
-            system_prompt = memory_manager.get_context_prompt()
-
-        messages = [{"role": "system", "content": system_prompt}]
-        messages.extend(memory_manager.get_history())
-        messages.append({"role": "user", "content": user_input})
+        messages = self.build_messages(user_input, system_prompt, turn_context)
 
+        tokens = 0
+        first_token_at = None
         try:
             stream = self.model.create_chat_completion(
                 messages=messages,
@@ -153,8 +276,16 @@ class LLMEngine:
             )
             for chunk in stream:
                 if "content" in chunk["choices"][0]["delta"]:
+                    # Decode speed is timed from the first token, prompt evaluation excluded
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    tokens += 1
                     yield chunk["choices"][0]["delta"]["content"]
         except Exception as e:
             yield f"Error: {e}"
+        finally:
+            if first_token_at is not None and tokens > 1:
+                self._record_generation(tokens - 1, time.perf_counter() - first_token_at)
 
-llm_engine = LLMEngine()
+# Loads in the background so importing the server does not wait for the weights
+llm_engine = LLMEngine(background=True)
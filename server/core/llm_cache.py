@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class PrefixStateCache:
+    """
+    Prompt-prefix KV state cache for llama-cpp-python (installed with `Llama.set_cache`).
+
+    Llama looks the cache up with the full prompt tokens before evaluation and
+    stores `save_state()` under prompt + completion tokens afterwards. Keys are
+    hashed in fixed-size token blocks, each block hash covering the whole prefix
+    up to that point, so the longest cached prefix of a prompt is found with one
+    dict probe per block instead of comparing token lists against every entry.
+    After `load_state`, llama.cpp only evaluates the tokens past the common prefix.
+
+    Entries are evicted least-recently-used once their total state size exceeds
+    `capacity_bytes`.
+    """
+
+    def __init__(self, capacity_bytes: int, block_size: int = 64):
+        self.capacity_bytes = capacity_bytes
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()  # entry key -> LlamaState
+        self._entry_blocks: Dict[str, List[str]] = {}  # entry key -> its prefix hashes
+        self._prefix_index: Dict[str, str] = {}  # prefix hash -> entry key
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def _prefix_hashes(self, tokens: Sequence[int]) -> List[str]:
+        arr = np.asarray(tokens, dtype=np.int32)
+        full = len(arr) - len(arr) % self.block_size
+        h = hashlib.blake2b(digest_size=16)
+        hashes = []
+        for start in range(0, full, self.block_size):
+            h.update(arr[start:start + self.block_size].tobytes())
+            hashes.append(h.copy().hexdigest())
+        return hashes
+
+    @staticmethod
+    def _state_size(state) -> int:
+        size = getattr(state, "llama_state_size", None)
+        if size is None:
+            size = len(getattr(state, "llama_state", b""))
+        return int(size)
+
+    def _find(self, tokens: Sequence[int]):
+        hashes = self._prefix_hashes(tokens)
+        for n_blocks in range(len(hashes), 0, -1):
+            entry_key = self._prefix_index.get(hashes[n_blocks - 1])
+            if entry_key is not None:
+                return entry_key, n_blocks * self.block_size
+        return None, 0
+
+    def _remove(self, entry_key: str):
+        state = self._entries.pop(entry_key)
+        self.size_bytes -= self._state_size(state)
+        for h in self._entry_blocks.pop(entry_key, []):
+            if self._prefix_index.get(h) == entry_key:
+                del self._prefix_index[h]
+
+    # --- llama-cpp-python cache protocol ---
+
+    def __bool__(self) -> bool:
+        # Llama checks `if self.cache:` before using it, so an empty cache must stay truthy
+        return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        with self._lock:
+            return self._find(key)[0] is not None
+
+    def __getitem__(self, key: Sequence[int]):
+        with self._lock:
+            entry_key, matched = self._find(key)
+            if entry_key is None:
+                self.misses += 1
+                raise KeyError("No cached prefix")
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            self.reused_tokens += matched
+            return self._entries[entry_key]
+
+    def __setitem__(self, key: Sequence[int], value):
+        hashes = self._prefix_hashes(key)
+        if not hashes:
+            return  # Shorter than one block, not worth a state snapshot
+
+        size = self._state_size(value)
+        if size > self.capacity_bytes:
+            logger.debug(f"Prompt state of {size} bytes exceeds cache capacity, skipping")
+            return
+
+        with self._lock:
+            entry_key = hashes[-1]
+            if entry_key in self._entries:
+                self._remove(entry_key)
+
+            self._entries[entry_key] = value
+            self._entry_blocks[entry_key] = hashes
+            self.size_bytes += size
+            # Newest entry wins for shared prefixes, it is also the most likely to be reused
+            for h in hashes:
+                self._prefix_index[h] = entry_key
+
+            while self.size_bytes > self.capacity_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._entry_blocks.clear()
+            self._prefix_index.clear()
+            self.size_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_mb": round(self.size_bytes / (1024 * 1024), 1),
+            "capacity_mb": round(self.capacity_bytes / (1024 * 1024), 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "reused_tokens": self.reused_tokens
+        }
@@ -0,0 +1,172 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any
+
+from .config import settings
+from .llm import LLMEngine, llm_engine
+from .llm_scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+class LLMPool:
+    """
+    Keeps several GGUF models resident and routes requests by logical model name.
+
+    The default engine (`llm_engine`, following `settings.model_path`) is always
+    resident and serves `settings.default_model_name`, empty names and names that
+    cannot be resolved. Other models are loaded on first use and evicted
+    least-recently-used when the estimated footprint of all resident models would
+    exceed `settings.llm_pool_ram_mb`. Engines with requests running or queued
+    in the scheduler are never evicted; if only such engines are left the pool
+    goes over budget until they are idle. A model that failed to load is not
+    retried for `failure_ttl` seconds, its requests go to the default engine.
+    """
+
+    def __init__(self, default_engine: LLMEngine):
+        self.default_engine = default_engine
+        self._engines: "OrderedDict[str, LLMEngine]" = OrderedDict()  # path -> engine, LRU order
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._failed: Dict[str, float] = {}  # path -> time of the last failed load
+        self.failure_ttl = 60.0  # seconds
+        self.loads = 0
+        self.evictions = 0
+        self.failed_loads = 0
+
+    def resolve_path(self, model_name: Optional[str]) -> Optional[str]:
+        """Map a logical model name to a GGUF path. None means the default engine."""
+        if not model_name or model_name == settings.default_model_name:
+            return None
+
+        alias = settings.model_aliases.get(model_name)
+        if alias:
+            path = alias if os.path.isabs(alias) else os.path.join(settings.models_root_dir, alias)
+            return path if os.path.exists(path) else None
+
+        if os.path.isabs(model_name):
+            return model_name if os.path.exists(model_name) else None
+
+        wanted = {model_name.lower(), f"{model_name.lower()}.gguf"}
+        for root, dirs, filenames in os.walk(settings.models_root_dir):
+            for filename in filenames:
+                if filename.lower() in wanted:
+                    return os.path.join(root, filename)
+        return None
+
+    @staticmethod
+    def _estimate_mb(path: str) -> float:
+        # Weights dominate the footprint of a quantized GGUF; the KV cache is extra
+        try:
+            return os.path.getsize(path) / (1024 * 1024)
+        except OSError:
+            return 0.0
+
+    def _resident_mb(self) -> float:
+        total = sum(self._estimate_mb(p) for p in self._engines)
+        if self.default_engine.model is not None:
+            total += self._estimate_mb(self.default_engine.loaded_path)
+        return total
+
+    def _make_room(self, needed_mb: float):
+        budget = settings.llm_pool_ram_mb
+        for path, engine in list(self._engines.items()):
+            if self._resident_mb() + needed_mb <= budget:
+                return
+            if llm_scheduler.in_use(engine):
+                # Unloading would pull the model from under its queued or running requests
+                continue
+            del self._engines[path]
+            engine.unload()
+            self.evictions += 1
+            logger.info(f"Evicted model from pool: {os.path.basename(path)}")
+        if self._resident_mb() + needed_mb > budget:
+            logger.warning(f"Model pool over budget ({settings.llm_pool_ram_mb} MB), resident models are busy")
+
+    def _failed_recently(self, path: str) -> bool:
+        failed_at = self._failed.get(path)
+        if failed_at is None:
+            return False
+        if time.monotonic() - failed_at < self.failure_ttl:
+            return True
+        del self._failed[path]
+        return False
+
+    def get(self, model_name: Optional[str] = None) -> LLMEngine:
+        """
+        Return the engine serving `model_name`, loading it if needed. Loading
+        blocks, so async callers should run this in a thread.
+        """
+        path = self.resolve_path(model_name)
+        if path is None:
+            if model_name and model_name != settings.default_model_name:
+                logger.warning(f"Model '{model_name}' not found, using default model")
+            return self.default_engine
+        if os.path.abspath(path) == os.path.abspath(self.default_engine.model_path):
+            return self.default_engine
+
+        with self._lock:
+            engine = self._engines.get(path)
+            if engine is not None:
+                self._engines.move_to_end(path)
+                return engine
+            if self._failed_recently(path):
+                return self.default_engine
+            load_lock = self._loading.setdefault(path, threading.Lock())
+
+        # Load outside the pool lock so cached lookups are not held up by a load
+        with load_lock:
+            try:
+                with self._lock:
+                    engine = self._engines.get(path)
+                    if engine is not None:
+                        self._engines.move_to_end(path)
+                        return engine
+                    if self._failed_recently(path):
+                        return self.default_engine
+                    self._make_room(self._estimate_mb(path))
+
+                engine = LLMEngine(model_path=path, model_name=model_name)
+                if engine.status != "ready":
+                    logger.error(f"Failed to load pooled model {path}: {engine.last_error}")
+                    with self._lock:
+                        self._failed[path] = time.monotonic()
+                        self.failed_loads += 1
+                    return self.default_engine
+
+                with self._lock:
+                    self._engines[path] = engine
+                    self.loads += 1
+                logger.info(f"Loaded model into pool: {os.path.basename(path)}")
+                return engine
+            finally:
+                with self._lock:
+                    self._loading.pop(path, None)
+
+    def engines(self) -> List[LLMEngine]:
+        with self._lock:
+            return [self.default_engine] + list(self._engines.values())
+
+    def resident_paths(self) -> List[str]:
+        paths = list(self._engines.keys())
+        if self.default_engine.model is not None:
+            paths.append(self.default_engine.loaded_path)
+        return paths
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "resident": [
+                    {"name": os.path.basename(p), "size_mb": round(self._estimate_mb(p), 1)}
+                    for p in self.resident_paths()
+                ],
+                "resident_mb": round(self._resident_mb(), 1),
+                "budget_mb": settings.llm_pool_ram_mb,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "failed_loads": self.failed_loads
+            }
+
+llm_pool = LLMPool(llm_engine)
@@ -0,0 +1,276 @@
+import asyncio
+import functools
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    """Scheduling lanes, lower value is served first."""
+    INTERACTIVE = 0     # User-facing chat generation
+    CLASSIFICATION = 1  # Intent / recall classification on the chat path
+    BACKGROUND = 2      # Agent work, planning, reports, persona analysis
+
+class SchedulerQueueFull(Exception):
+    """Raised when the scheduler already holds `max_queue` waiting requests."""
+    pass
+
+class SchedulerCancelled(Exception):
+    """Raised in the worker thread when a waiting request is cancelled by its caller."""
+    pass
+
+_STREAM_END = object()
+
+class _Job:
+    __slots__ = ("priority", "seq", "resource", "nested", "enqueued_at")
+
+    def __init__(self, priority: Priority, seq: int, resource: int, nested: bool = False):
+        self.priority = priority
+        self.seq = seq
+        self.resource = resource
+        self.nested = nested  # Requested from inside another job
+        self.enqueued_at = time.perf_counter()
+
+class LLMScheduler:
+    """
+    Owns access to the loaded Llama models.
+
+    Every generation goes through the scheduler, which admits at most one
+    request per model at a time (a Llama object is not re-entrant) and picks
+    the next request by lane priority, then arrival order. Each lane also has
+    its own concurrency limit. Generation always runs in a worker thread, so
+    async callers never block the event loop.
+
+    The model a request needs is taken from the bound method passed in, e.g.
+    `submit(llm_engine.generate_response, ...)` locks `llm_engine`.
+
+    A job may call `run_sync` itself. A nested call for the model its thread
+    already holds runs inline, since waiting for it would deadlock. A nested
+    call for another model waits for that model but not for a lane slot,
+    because the outer job's own slot may be the one it would wait for.
+    """
+
+    def __init__(self, max_queue: int = None, lane_limits: Dict[str, int] = None):
+        self.max_queue = max_queue or settings.llm_queue_size
+        limits = lane_limits or settings.llm_lane_limits
+        self.lane_limits = {p: int(limits.get(p.name.lower(), 1)) for p in Priority}
+
+        self._cond = threading.Condition()
+        self._waiting: List[_Job] = []
+        self._running = {p: 0 for p in Priority}
+        self._busy = set()
+        self._seq = itertools.count()
+        self._local = threading.local()  # Resources held by the current thread
+        # Waiting requests park a thread each, so they get their own pool
+        # rather than starving the loop's default executor.
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_queue + sum(self.lane_limits.values()),
+            thread_name_prefix="llm-scheduler"
+        )
+        self._stats = {
+            p: {"admitted": 0, "completed": 0, "cancelled": 0, "rejected": 0, "failed": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for p in Priority
+        }
+
+    # --- Admission ---
+
+    def _eligible(self, job: _Job) -> bool:
+        if job.resource in self._busy:
+            return False
+        return job.nested or self._running[job.priority] < self.lane_limits[job.priority]
+
+    def _is_next(self, job: _Job) -> bool:
+        # A job may start only if no eligible job for the same model is ahead of it
+        if not self._eligible(job):
+            return False
+        for other in sorted(self._waiting, key=lambda j: (j.priority, j.seq)):
+            if other is job:
+                return True
+            if other.resource == job.resource and self._eligible(other):
+                return False
+        return False
+
+    def _acquire(self, priority: Priority, resource: int, cancel_event: threading.Event = None) -> _Job:
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self._stats[priority]["rejected"] += 1
+                raise SchedulerQueueFull(f"LLM queue is full ({self.max_queue} waiting)")
+
+            job = _Job(priority, next(self._seq), resource, nested=bool(self._held()))
+            self._waiting.append(job)
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise SchedulerCancelled()
+                    if self._is_next(job):
+                        break
+                    # Poll while waiting so that cancellation is noticed promptly
+                    self._cond.wait(timeout=0.1 if cancel_event is not None else None)
+            except BaseException:
+                self._waiting.remove(job)
+                self._stats[priority]["cancelled"] += 1
+                self._cond.notify_all()
+                raise
+
+            self._waiting.remove(job)
+            self._running[priority] += 1
+            self._busy.add(resource)
+
+            waited = time.perf_counter() - job.enqueued_at
+            stats = self._stats[priority]
+            stats["admitted"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            return job
+
+    def _release(self, job: _Job, outcome: str = "completed"):
+        with self._cond:
+            self._running[job.priority] -= 1
+            self._busy.discard(job.resource)
+            self._stats[job.priority][outcome] += 1
+            self._cond.notify_all()
+
+    def _held(self) -> set:
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = set()
+        return held
+
+    @staticmethod
+    def _resource_of(fn: Callable) -> int:
+        return id(getattr(fn, "__self__", fn))
+
+    def in_use(self, owner: Any) -> bool:
+        """Whether requests for `owner` (e.g. an engine) are running or waiting."""
+        resource = id(owner)
+        with self._cond:
+            return resource in self._busy or any(j.resource == resource for j in self._waiting)
+
+    # --- Public API ---
+
+    def run_sync(self, fn: Callable, *args, priority: Priority = Priority.BACKGROUND,
+                 cancel_event: threading.Event = None, **kwargs) -> Any:
+        """Blocking call for code that already runs in a worker thread."""
+        resource = self._resource_of(fn)
+        held = self._held()
+        if resource in held:
+            # This thread's job already holds the model and runs one call at a time
+            return fn(*args, **kwargs)
+
+        job = self._acquire(priority, resource, cancel_event)
+        held.add(resource)
+        outcome = "completed"
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            outcome = "failed"
+            raise
+        finally:
+            held.discard(resource)
+            self._release(job, outcome)
+
+    async def submit(self, fn: Callable, *args, priority: Priority = Priority.BACKGROUND, **kwargs) -> Any:
+        """
+        Await a single generation. If the awaiting task is cancelled while the
+        request is still queued, the request is withdrawn; a generation that has
+        already started runs to completion in its thread.
+        """
+        loop = asyncio.get_running_loop()
+        cancel_event = threading.Event()
+        call = functools.partial(self.run_sync, fn, *args, priority=priority, cancel_event=cancel_event, **kwargs)
+        try:
+            return await loop.run_in_executor(self._executor, call)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+    async def stream(self, gen_fn: Callable, *args, priority: Priority = Priority.INTERACTIVE, **kwargs) -> AsyncIterator[Any]:
+        """
+        Async iterator over a streaming generation (e.g. `llm_engine.stream_response`).
+        When the consumer stops iterating, for instance because the client
+        disconnected, generation stops at the next token and the model is released.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancel_event = threading.Event()
+
+        def produce():
+            resource = self._resource_of(gen_fn)
+            try:
+                job = self._acquire(priority, resource, cancel_event)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+                return
+
+            held = self._held()
+            held.add(resource)
+            outcome = "completed"
+            gen = None
+            try:
+                gen = gen_fn(*args, **kwargs)
+                for chunk in gen:
+                    if cancel_event.is_set():
+                        outcome = "cancelled"
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+            except BaseException as e:
+                outcome = "failed"
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                if gen is not None and hasattr(gen, "close"):
+                    gen.close()
+                held.discard(resource)
+                self._release(job, outcome)
+
+        producer = loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            cancel_event.set()
+            # Let the worker release the model before the caller moves on, but
+            # don't leave the producer future's exception unobserved.
+            producer.add_done_callback(lambda f: f.exception())
+
+    # --- Metrics ---
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lanes = {}
+            now = time.perf_counter()
+            for p in Priority:
+                queued = [j for j in self._waiting if j.priority == p]
+                stats = self._stats[p]
+                admitted = stats["admitted"]
+                lanes[p.name.lower()] = {
+                    "queued": len(queued),
+                    "running": self._running[p],
+                    "limit": self.lane_limits[p],
+                    "completed": stats["completed"],
+                    "failed": stats["failed"],
+                    "cancelled": stats["cancelled"],
+                    "rejected": stats["rejected"],
+                    "avg_wait_ms": round(stats["wait_total"] / admitted * 1000, 1) if admitted else 0.0,
+                    "max_wait_ms": round(stats["wait_max"] * 1000, 1),
+                    "oldest_wait_ms": round(max((now - j.enqueued_at for j in queued), default=0.0) * 1000, 1)
+                }
+            return {
+                "queue_depth": len(self._waiting),
+                "max_queue": self.max_queue,
+                "lanes": lanes
+            }
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,135 @@
+import os
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+try:
+    from llama_cpp import Llama
+    from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+except ImportError:
+    Llama = None
+    LlamaDraftModel = object
+    LlamaPromptLookupDecoding = None
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class GGUFDraftModel(LlamaDraftModel):
+    """
+    Drafts tokens with a small GGUF from the same model family (shared tokenizer),
+    greedily. The draft keeps its own KV cache; llama-cpp-python's `generate`
+    reuses the longest common prefix, so each call only evaluates new tokens.
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 8):
+        self.num_pred_tokens = num_pred_tokens
+        self.model = Llama(
+            model_path=model_path,
+            n_ctx=settings.n_ctx,
+            n_threads=settings.n_threads,
+            n_batch=settings.n_batch,
+            use_mmap=settings.model_use_mmap,
+            verbose=False
+        )
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        if len(input_ids) + self.num_pred_tokens >= self.model.n_ctx():
+            return np.array([], dtype=np.intc)
+        draft = []
+        for token in self.model.generate(input_ids.tolist(), top_k=1, temp=0.0):
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens or token == self.model.token_eos():
+                break
+        return np.array(draft, dtype=np.intc)
+
+class MeasuredDraftModel(LlamaDraftModel):
+    """
+    Wraps a draft model and measures how many drafted tokens the target accepts.
+
+    Llama calls the draft with everything evaluated so far, so the accepted
+    part of the previous draft is the part that reappears at the end of the
+    next input.
+    """
+
+    def __init__(self, inner, kind: str):
+        self.inner = inner
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._last_len = None
+        self._last_token = None
+        self._last_draft = None
+        self.calls = 0
+        self.drafted = 0
+        self.scored = 0  # Drafted tokens whose fate is known
+        self.accepted = 0
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        with self._lock:
+            # Only score a draft when this call continues the same sequence
+            continues = (
+                self._last_draft is not None and len(input_ids) > self._last_len
+                and input_ids[self._last_len - 1] == self._last_token
+            )
+            if continues:
+                continued = input_ids[self._last_len:self._last_len + len(self._last_draft)]
+                matches = continued == self._last_draft[:len(continued)]
+                self.scored += len(self._last_draft)
+                self.accepted += int(np.argmin(matches)) if not matches.all() else len(continued)
+
+            draft = self.inner(input_ids, **kwargs)
+            self.calls += 1
+            self.drafted += len(draft)
+            self._last_len = len(input_ids)
+            self._last_token = input_ids[-1]
+            self._last_draft = np.asarray(draft)
+            return draft
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.kind,
+                "draft_calls": self.calls,
+                "drafted_tokens": self.drafted,
+                "accepted_tokens": self.accepted,
+                "acceptance_rate": round(self.accepted / self.scored, 3) if self.scored else 0.0
+            }
+
+def speculative_config(model_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Speculation settings for a logical model name, None when it is disabled."""
+    config = settings.speculative_decoding.get(model_name or settings.default_model_name)
+    if not config or config.get("mode") == "off":
+        return None
+    return config
+
+def build_draft_model(model_name: Optional[str]) -> Optional[MeasuredDraftModel]:
+    """
+    Draft model for `model_name`: a draft GGUF if one is configured and found,
+    otherwise prompt-lookup decoding (drafts n-grams copied from the prompt,
+    which pays off when replies quote the context, e.g. search results).
+    """
+    config = speculative_config(model_name)
+    if config is None or Llama is None:
+        return None
+
+    num_pred_tokens = int(config.get("num_pred_tokens", 8))
+    draft = config.get("draft")
+    if draft:
+        path = draft if os.path.isabs(draft) else os.path.join(settings.models_root_dir, draft)
+        if os.path.exists(path):
+            try:
+                return MeasuredDraftModel(GGUFDraftModel(path, num_pred_tokens), "draft:" + os.path.basename(path))
+            except Exception as e:
+                logger.error(f"Failed to load draft model {path}, using prompt lookup: {e}")
+        else:
+            logger.warning(f"Draft model not found at {path}, using prompt lookup")
+
+    return MeasuredDraftModel(
+        LlamaPromptLookupDecoding(
+            max_ngram_size=int(config.get("max_ngram_size", 3)),
+            num_pred_tokens=num_pred_tokens
+        ),
+        "prompt_lookup"
+    )
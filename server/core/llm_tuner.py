@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import datetime
+import subprocess
+from typing import Dict, Any, List, Optional
+
+import psutil
+
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+from .config import settings, BASE_DIR, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+RESULTS_PATH = DATA_DIR / "llm_tuning.json"
+FILLER_TEXT = (
+    "The quick brown fox jumps over the lazy dog while the server measures how fast "
+    "the model evaluates prompts and generates tokens on this machine. "
+)
+
+class _RSSSampler:
+    """Samples the resident set size of this process in the background and keeps the peak."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._process = psutil.Process()
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+class LLMTuner:
+    """
+    Finds n_threads / n_batch / n_ctx for a GGUF on this host.
+
+    The sweep is coordinate-wise rather than a full grid, since every
+    configuration means loading the model again:
+    1. thread counts, ranked by generation tokens/sec (decode is thread bound),
+    2. batch sizes at the best thread count, ranked by prompt-eval tokens/sec,
+    3. context sizes at the best threads and batch: the largest one whose
+       generation speed stays within 10% of the best and whose peak RSS fits
+       `settings.llm_pool_ram_mb`.
+
+    Each configuration is measured in a fresh Python process, so the model
+    loaded for a trial never shares the server's address space and the peak
+    RSS is the trial's own.
+
+    Results are stored per model file in `data/llm_tuning.json`. When the tuned
+    file is the configured model, the best values are written to settings and,
+    with `reload=True`, the default engine is swapped in the background to pick
+    them up. Otherwise `reload_required` in the result tells the caller a
+    restart or reload is still needed.
+    Run it on an otherwise idle server, live traffic skews the numbers.
+    """
+
+    TRIAL_TIMEOUT = 900
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.progress: Dict[str, Any] = {"status": "idle"}
+
+    # --- Candidates ---
+
+    @staticmethod
+    def thread_candidates() -> List[int]:
+        logical = os.cpu_count() or 4
+        physical = psutil.cpu_count(logical=False) or logical
+        candidates = {max(1, physical // 2), physical, logical, settings.n_threads}
+        return sorted(c for c in candidates if 0 < c <= logical)
+
+    @staticmethod
+    def batch_candidates() -> List[int]:
+        return sorted({128, 256, 512, 1024, settings.n_batch})
+
+    @staticmethod
+    def context_candidates() -> List[int]:
+        return sorted({2048, 4096, 8192, settings.n_ctx})
+
+    # --- Measurement ---
+
+    def measure(self, model_path: str, n_threads: int, n_batch: int, n_ctx: int,
+                prompt_tokens: int = 512, gen_tokens: int = 64) -> Dict[str, Any]:
+        """Run one trial of `measure_in_process` in a child process and return its result."""
+        config = dict(model_path=model_path, n_threads=n_threads, n_batch=n_batch, n_ctx=n_ctx,
+                      prompt_tokens=prompt_tokens, gen_tokens=gen_tokens)
+        command = [sys.executable, "-m", "server.core.llm_tuner", "--measure", json.dumps(config)]
+        completed = subprocess.run(command, capture_output=True, text=True,
+                                   cwd=str(BASE_DIR.parent), timeout=self.TRIAL_TIMEOUT)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            error = (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]
+            raise RuntimeError(error)
+        return json.loads(lines[-1])
+
+    @staticmethod
+    def measure_in_process(model_path: str, n_threads: int, n_batch: int, n_ctx: int,
+                           prompt_tokens: int = 512, gen_tokens: int = 64) -> Dict[str, Any]:
+        """Load the model with one configuration and time prompt evaluation and decoding."""
+        if Llama is None:
+            raise RuntimeError("llama-cpp-python not installed")
+        with _RSSSampler() as rss:
+            started = time.perf_counter()
+            model = Llama(
+                model_path=model_path,
+                n_ctx=n_ctx,
+                n_threads=n_threads,
+                n_batch=n_batch,
+                use_mmap=settings.model_use_mmap,
+                use_mlock=settings.model_use_mlock,
+                verbose=False
+            )
+            load_seconds = time.perf_counter() - started
+
+            filler = model.tokenize(FILLER_TEXT.encode("utf-8"), add_bos=False)
+            n_prompt = min(prompt_tokens, n_ctx - gen_tokens - 1)
+            tokens = [model.token_bos()] + (filler * (n_prompt // len(filler) + 1))[:n_prompt - 1]
+
+            # Warm up once so the first configuration doesn't pay for page faults alone
+            model.eval(tokens[:8])
+            model.reset()
+
+            started = time.perf_counter()
+            model.eval(tokens)
+            prompt_seconds = time.perf_counter() - started
+
+            # Decode speed: one token per evaluation, as during generation (sampling excluded)
+            started = time.perf_counter()
+            for i in range(gen_tokens):
+                model.eval([filler[i % len(filler)]])
+            gen_seconds = time.perf_counter() - started
+            del model
+
+        return {
+            "n_threads": n_threads,
+            "n_batch": n_batch,
+            "n_ctx": n_ctx,
+            "load_seconds": round(load_seconds, 2),
+            "prompt_tps": round(len(tokens) / prompt_seconds, 1) if prompt_seconds > 0 else 0.0,
+            "gen_tps": round(gen_tokens / gen_seconds, 1) if gen_seconds > 0 else 0.0,
+            "peak_rss_mb": round(rss.peak / (1024 * 1024), 1)
+        }
+
+    def _run_one(self, runs: List[dict], model_path: str, **config) -> Optional[dict]:
+        self.progress["current"] = config
+        try:
+            result = self.measure(model_path, **config)
+        except Exception as e:
+            logger.warning(f"Tuning run {config} failed: {e}")
+            return None
+        runs.append(result)
+        self.progress["completed"] = len(runs)
+        logger.info(f"Tuning run: {result}")
+        return result
+
+    # --- Sweep ---
+
+    def tune(self, model_path: str = None, apply: bool = True, prompt_tokens: int = 512, gen_tokens: int = 64,
+             reload: bool = False) -> Dict[str, Any]:
+        if Llama is None:
+            raise RuntimeError("llama-cpp-python not installed")
+        model_path = model_path or settings.model_path
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found at {model_path}")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A tuning run is already in progress")
+
+        try:
+            runs: List[dict] = []
+            self.progress = {"status": "running", "model": os.path.basename(model_path), "completed": 0, "current": None}
+            measure = dict(model_path=model_path, prompt_tokens=prompt_tokens, gen_tokens=gen_tokens)
+
+            thread_runs = [r for r in (self._run_one(runs, n_threads=t, n_batch=settings.n_batch, n_ctx=settings.n_ctx, **measure)
+                                       for t in self.thread_candidates()) if r]
+            if not thread_runs:
+                raise RuntimeError("Every tuning run failed")
+            best = max(thread_runs, key=lambda r: (r["gen_tps"], r["prompt_tps"]))
+
+            batch_runs = [best] + [r for r in (self._run_one(runs, n_threads=best["n_threads"], n_batch=b, n_ctx=settings.n_ctx, **measure)
+                                               for b in self.batch_candidates() if b != best["n_batch"]) if r]
+            best = max(batch_runs, key=lambda r: (r["prompt_tps"], r["gen_tps"]))
+
+            ctx_runs = [best] + [r for r in (self._run_one(runs, n_threads=best["n_threads"], n_batch=best["n_batch"], n_ctx=c, **measure)
+                                             for c in self.context_candidates() if c != best["n_ctx"]) if r]
+            fast_enough = [
+                r for r in ctx_runs
+                if r["gen_tps"] >= 0.9 * best["gen_tps"] and r["peak_rss_mb"] <= settings.llm_pool_ram_mb
+            ]
+            best = max(fast_enough or [best], key=lambda r: r["n_ctx"])
+
+            result = {
+                "model": os.path.basename(model_path),
+                "size_bytes": os.path.getsize(model_path),
+                "tuned_at": datetime.datetime.now().isoformat(),
+                "cpu_count": os.cpu_count(),
+                "best": best,
+                "runs": runs
+            }
+            self._save_result(result)
+
+            applied = reloaded = False
+            if apply and os.path.abspath(model_path) == os.path.abspath(settings.model_path):
+                settings.n_threads = best["n_threads"]
+                settings.n_batch = best["n_batch"]
+                settings.n_ctx = best["n_ctx"]
+                settings.save()
+                applied = True
+                if reload:
+                    reloaded = self._reload_default_engine()
+            result["applied"] = applied
+            # Engines only read these settings when they load a model
+            result["reload_required"] = applied and not reloaded
+
+            self.progress = {"status": "completed", "model": result["model"], "completed": len(runs), "best": best,
+                             "applied": applied, "reload_required": result["reload_required"]}
+            return result
+        except Exception as e:
+            self.progress = {"status": "error", "model": os.path.basename(model_path), "error": str(e)}
+            raise
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _reload_default_engine() -> bool:
+        """Swap the default engine to the new settings; the current model serves until it is ready."""
+        from .llm import llm_engine
+        if llm_engine.model is None:
+            return False
+        llm_engine.reload_model()
+        return True
+
+    def tune_async(self, model_path: str = None, apply: bool = True) -> threading.Thread:
+        def run():
+            try:
+                self.tune(model_path, apply=apply, reload=True)
+            except Exception as e:
+                logger.error(f"LLM tuning failed: {e}")
+
+        thread = threading.Thread(target=run, name="llm-tuner", daemon=True)
+        thread.start()
+        return thread
+
+    # --- Stored results ---
+
+    def load_results(self) -> Dict[str, Any]:
+        if not RESULTS_PATH.exists():
+            return {}
+        try:
+            with open(RESULTS_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read tuning results: {e}")
+            return {}
+
+    def _save_result(self, result: Dict[str, Any]):
+        results = self.load_results()
+        results[result["model"]] = result
+        RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(RESULTS_PATH, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    def get_result(self, model_path: str, results: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Stored tuning for a model file, or None if it was never tuned or the file changed since."""
+        results = self.load_results() if results is None else results
+        result = results.get(os.path.basename(model_path))
+        if not result:
+            return None
+        try:
+            if result.get("size_bytes") != os.path.getsize(model_path):
+                return None
+        except OSError:
+            return None
+        return result
+
+llm_tuner = LLMTuner()
+
+def _main():
+    parser = argparse.ArgumentParser(description="Internal: one tuning trial, called by LLMTuner.measure.")
+    parser.add_argument("--measure", required=True, help="JSON keyword arguments for measure_in_process")
+    args = parser.parse_args()
+    print(json.dumps(LLMTuner.measure_in_process(**json.loads(args.measure))))
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,398 @@
+import json
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ("int8", "binary")
+
+def id_fingerprint(ids: Iterable[str]) -> dict:
+    """
+    Count and order-independent digest of a set of row ids (sum of 64-bit
+    blake2b hashes), so an index can be matched against its table no matter
+    how rows were inserted, deleted or renumbered.
+    """
+    count, digest = 0, 0
+    for id_ in ids:
+        digest += int.from_bytes(hashlib.blake2b(str(id_).encode("utf-8"), digest_size=8).digest(), "little")
+        count += 1
+    return {"count": count, "digest": digest % (1 << 64)}
+
+class IVFFlatIndex:
+    """
+    In-process inverted-file index over normalized float32 vectors (cosine similarity).
+
+    Below `min_train_rows` live vectors the index is a flat matrix and search is
+    exact. Above it, vectors are clustered with spherical k-means into about
+    sqrt(N) lists and a query only scans the `nprobe` lists whose centroids are
+    closest to it. Adds are assigned to their nearest existing centroid and
+    deletes are tombstoned; the clustering is redone lazily once the index has
+    grown 4x since the last training or a third of its rows are tombstones.
+
+    Rows may carry a timestamp (epoch seconds). Timestamped rows are also
+    partitioned into day buckets, and a search restricted to a time range
+    scans only the buckets overlapping it, exactly.
+
+    With `quantization` set, every row also gets a compact code: "int8"
+    (components scaled to [-127, 127], 4x smaller than float32) or "binary"
+    (sign bits, 32x smaller). Candidates are scored on the codes first and
+    the best `k * rerank_factor` are re-ranked with exact float similarity.
+    If a `vector_source` (ids -> {id: float vector}) is given, the float
+    vectors are not kept in memory and re-ranking fetches them from it.
+    """
+
+    BUCKET_SECONDS = 86400
+
+    def __init__(self, nprobe: int = 16, min_train_rows: int = 2048, quantization: Optional[str] = None,
+                 rerank_factor: int = 16, vector_source: Optional[Callable[[List[str]], Dict[str, np.ndarray]]] = None):
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.vector_source = vector_source if quantization else None
+        self._lock = threading.RLock()
+        self._reset(0)
+
+    @property
+    def keeps_vectors(self) -> bool:
+        return self.vector_source is None
+
+    def _reset(self, dim: int):
+        self.dim = dim
+        self.ids: List[str] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.vectors = np.zeros((0, dim if self.keeps_vectors else 0), dtype=np.float32)
+        self.codes = None if self.quantization is None else np.zeros((0, self._code_width(dim)), dtype=self._code_dtype())
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0
+        self.deleted = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.lists: List[List[int]] = []
+        self.trained_rows = 0
+        self.timestamps = np.full(0, np.nan)
+        self.buckets: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return self.size - self.deleted
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32, copy=False)
+
+    # --- Quantization ---
+
+    def _code_width(self, dim: int) -> int:
+        return dim if self.quantization == "int8" else (dim + 7) // 8
+
+    def _code_dtype(self):
+        return np.int8 if self.quantization == "int8" else np.uint8
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes for normalized vectors (components are within [-1, 1])."""
+        if self.quantization == "int8":
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return np.packbits(vectors > 0, axis=-1)
+
+    def _dequantize(self, rows) -> np.ndarray:
+        """Approximate normalized vectors from codes, for clustering when floats aren't kept."""
+        if self.quantization == "int8":
+            return self._normalize(self.codes[rows].astype(np.float32))
+        signs = np.unpackbits(self.codes[rows], axis=-1, count=self.dim).astype(np.float32) * 2 - 1
+        return signs / np.sqrt(self.dim, dtype=np.float32)
+
+    def _train_vectors(self, rows) -> np.ndarray:
+        return self.vectors[rows] if self.keeps_vectors else self._dequantize(rows)
+
+    def _approx_scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        First-pass scores on the codes; only their order matters. The query
+        stays float: scoring it against the codes (asymmetric) ranks binary
+        codes noticeably better than Hamming distance to a binarized query.
+        """
+        if self.quantization == "int8":
+            decode = lambda chunk: self.codes[chunk].astype(np.float32)
+        else:
+            decode = self._dequantize
+        return np.concatenate([decode(rows[start:start + 16384]) @ query for start in range(0, len(rows), 16384)])
+
+    # --- Building ---
+
+    def build(self, ids: Sequence[str], vectors=None, timestamps=None, codes=None) -> None:
+        """
+        Index `vectors`, or for a quantized index without kept floats, the
+        already computed `codes` (used when loading a saved index).
+        """
+        if vectors is not None:
+            vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+            dim = vectors.shape[1] if vectors.ndim == 2 and len(vectors) else 0
+        else:
+            dim = self.dim
+        with self._lock:
+            self._reset(dim)
+            if not len(ids):
+                return
+            self.ids = list(ids)
+            self.id_to_row = {id_: i for i, id_ in enumerate(self.ids)}
+            if self.keeps_vectors:
+                self.vectors = vectors
+            if self.quantization is not None:
+                self.codes = self._quantize(vectors) if vectors is not None else np.asarray(codes, dtype=self._code_dtype())
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            self.assign = np.full(len(self.ids), -1, dtype=np.int32)
+            self.size = len(self.ids)
+            self.timestamps = np.full(len(self.ids), np.nan) if timestamps is None else np.asarray(timestamps, dtype=np.float64)
+            for row, ts in enumerate(self.timestamps):
+                if not np.isnan(ts):
+                    self.buckets.setdefault(int(ts // self.BUCKET_SECONDS), []).append(row)
+            if len(self) >= self.min_train_rows:
+                self._train(vectors)
+
+    def _compact(self):
+        rows = np.flatnonzero(self.alive[:self.size])
+        ids = [self.ids[i] for i in rows]
+        if self.keeps_vectors:
+            self.build(ids, self.vectors[rows], self.timestamps[rows])
+        else:
+            self.build(ids, None, self.timestamps[rows], self.codes[rows])
+
+    def _train(self, vectors: Optional[np.ndarray] = None, iterations: int = 8, seed: int = 0):
+        """Cluster the live rows, on `vectors` (all rows, normalized) when the caller still has the floats."""
+        rows_of = (lambda rows: vectors[rows]) if vectors is not None else self._train_vectors
+        live = np.flatnonzero(self.alive[:self.size])
+        n = len(live)
+        nlist = int(min(n, 4096, max(8, np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+
+        # Spherical k-means on a sample, then one assignment pass over everything
+        sample = rows_of(rng.choice(live, size=min(n, nlist * 64), replace=False))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = self._normalize(sums)
+
+        self.centroids = centroids
+        self.assign = np.full(len(self.ids), -1, dtype=np.int32)
+        for start in range(0, n, 16384):
+            chunk = live[start:start + 16384]
+            self.assign[chunk] = np.argmax(rows_of(chunk) @ centroids.T, axis=1)
+        self.lists = [[] for _ in range(nlist)]
+        for row in live:
+            self.lists[self.assign[row]].append(int(row))
+        self.trained_rows = n
+
+    def _maintain(self):
+        if self.deleted and self.deleted * 3 > self.size:
+            self._compact()
+        elif self.centroids is None and len(self) >= self.min_train_rows:
+            self._train()
+        elif self.centroids is not None and len(self) > 4 * self.trained_rows:
+            self._train()
+
+    # --- Updates ---
+
+    def add(self, id_: str, vector, timestamp: Optional[float] = None) -> None:
+        vector = self._normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        with self._lock:
+            if id_ in self.id_to_row:
+                self.remove(id_)
+            if self.size == 0 and self.dim != vector.shape[1]:
+                self._reset(vector.shape[1])
+            if self.size == len(self.alive):
+                # Grow geometrically so appends stay amortized O(1)
+                capacity = max(64, 2 * len(self.alive))
+                if self.keeps_vectors:
+                    grown = np.zeros((capacity, self.dim), dtype=np.float32)
+                    grown[:self.size] = self.vectors[:self.size]
+                    self.vectors = grown
+                if self.codes is not None:
+                    grown = np.zeros((capacity, self.codes.shape[1]), dtype=self.codes.dtype)
+                    grown[:self.size] = self.codes[:self.size]
+                    self.codes = grown
+                self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+                self.assign = np.concatenate([self.assign, np.full(capacity - len(self.assign), -1, dtype=np.int32)])
+                self.timestamps = np.concatenate([self.timestamps, np.full(capacity - len(self.timestamps), np.nan)])
+
+            row = self.size
+            if self.keeps_vectors:
+                self.vectors[row] = vector[0]
+            if self.codes is not None:
+                self.codes[row] = self._quantize(vector[0])
+            self.alive[row] = True
+            self.ids.append(id_)
+            self.id_to_row[id_] = row
+            self.size += 1
+            self.timestamps[row] = np.nan if timestamp is None else timestamp
+            if timestamp is not None:
+                self.buckets.setdefault(int(timestamp // self.BUCKET_SECONDS), []).append(row)
+            if self.centroids is not None:
+                cluster = int(np.argmax(self.centroids @ vector[0]))
+                self.assign[row] = cluster
+                self.lists[cluster].append(row)
+
+    def remove(self, id_: str) -> bool:
+        with self._lock:
+            row = self.id_to_row.pop(id_, None)
+            if row is None:
+                return False
+            self.alive[row] = False
+            self.deleted += 1
+            return True
+
+    # --- Search ---
+
+    def search(self, query, k: int, threshold: float = 0.0,
+               time_range: Optional[Tuple[Optional[float], Optional[float]]] = None) -> List[Tuple[str, float]]:
+        """
+        Top `k` (id, cosine similarity) pairs with similarity >= threshold, best
+        first. `time_range` is (start, end) in epoch seconds, either side open
+        when None; rows without a timestamp never match it.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        with self._lock:
+            self._maintain()
+            if len(self) == 0:
+                return []
+            if time_range is not None:
+                rows = self._rows_in_range(*time_range)
+            elif self.centroids is None:
+                rows = np.flatnonzero(self.alive[:self.size])
+            else:
+                nprobe = min(self.nprobe, len(self.centroids))
+                probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                rows = np.fromiter((r for c in probe for r in self.lists[c]), dtype=np.int64)
+                rows = rows[self.alive[rows]]
+            if not len(rows):
+                return []
+
+            if self.codes is not None:
+                shortlist = k * self.rerank_factor
+                if len(rows) > shortlist:
+                    approx = self._approx_scores(rows, query)
+                    rows = rows[np.argpartition(-approx, shortlist - 1)[:shortlist]]
+            ids = [self.ids[r] for r in rows]
+            sims = self.vectors[rows] @ query if self.keeps_vectors else None
+
+        if sims is None:
+            # Exact re-ranking outside the lock, the source may hit the database
+            ids, sims = self._exact_scores(ids, query)
+        keep = np.flatnonzero(sims >= threshold)
+        if len(keep) > k:
+            keep = keep[np.argpartition(-sims[keep], k - 1)[:k]]
+        keep = keep[np.argsort(-sims[keep])]
+        return [(ids[i], float(sims[i])) for i in keep]
+
+    def _exact_scores(self, ids: List[str], query: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        vectors = self.vector_source(ids)
+        # Rows deleted since they were indexed are missing from the source
+        ids = [id_ for id_ in ids if vectors.get(id_) is not None]
+        if not ids:
+            return [], np.zeros(0, dtype=np.float32)
+        matrix = self._normalize(np.stack([np.asarray(vectors[id_], dtype=np.float32) for id_ in ids]))
+        return ids, matrix @ query
+
+    def _rows_in_range(self, start: Optional[float], end: Optional[float]) -> np.ndarray:
+        first = None if start is None else int(start // self.BUCKET_SECONDS)
+        last = None if end is None else int(end // self.BUCKET_SECONDS)
+        rows = [
+            r for day, bucket in self.buckets.items()
+            if (first is None or day >= first) and (last is None or day <= last)
+            for r in bucket
+        ]
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return rows
+        ts = self.timestamps[rows]
+        keep = self.alive[rows]
+        if start is not None:
+            keep &= ts >= start
+        if end is not None:
+            keep &= ts < end
+        return rows[keep]
+
+    # --- Persistence ---
+
+    def live_ids(self) -> List[str]:
+        with self._lock:
+            return [self.ids[i] for i in np.flatnonzero(self.alive[:self.size])]
+
+    def save(self, path: str) -> dict:
+        """Write the live rows to `path`; returns the `id_fingerprint` of the ids saved, stored alongside them."""
+        with self._lock:
+            live = np.flatnonzero(self.alive[:self.size])
+            ids = [self.ids[i] for i in live]
+            fingerprint = id_fingerprint(ids)
+            arrays = {}
+            if self.keeps_vectors:
+                arrays["vectors"] = self.vectors[live]
+            if self.codes is not None:
+                arrays["codes"] = self.codes[live]
+            np.savez(
+                path,
+                ids=np.array(ids, dtype=str),
+                timestamps=self.timestamps[live],
+                dim=np.array(self.dim),
+                quantization=np.array(self.quantization or ""),
+                fingerprint=np.array(json.dumps(fingerprint)),
+                **arrays
+            )
+        return fingerprint
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 16, min_train_rows: int = 2048, quantization: Optional[str] = None,
+             rerank_factor: int = 16, vector_source=None) -> Tuple["IVFFlatIndex", dict]:
+        """
+        Load a saved index. Raises ValueError when it was saved with another
+        quantization, or without the float vectors this configuration keeps.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            saved = str(data["quantization"]) if "quantization" in data.files else ""
+            if saved != (quantization or ""):
+                raise ValueError(f"Index was saved with quantization {saved or 'none'!r}")
+            index = cls(nprobe=nprobe, min_train_rows=min_train_rows, quantization=quantization,
+                        rerank_factor=rerank_factor, vector_source=vector_source)
+            if index.keeps_vectors and "vectors" not in data.files:
+                raise ValueError("Index was saved without float vectors")
+            timestamps = data["timestamps"] if "timestamps" in data.files else None
+            if index.keeps_vectors:
+                index.build(data["ids"].tolist(), data["vectors"], timestamps)
+            else:
+                index.dim = int(data["dim"])
+                index.build(data["ids"].tolist(), None, timestamps, data["codes"])
+            fingerprint = json.loads(str(data["fingerprint"]))
+        return index, fingerprint
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the vector and code matrices."""
+        with self._lock:
+            return self.vectors.nbytes + (self.codes.nbytes if self.codes is not None else 0)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": len(self),
+                "tombstones": self.deleted,
+                "lists": 0 if self.centroids is None else len(self.centroids),
+                "nprobe": self.nprobe,
+                "time_buckets": len(self.buckets),
+                "exact": self.centroids is None,
+                "quantization": self.quantization or "none",
+                "memory_mb": round(self.memory_bytes() / (1024 * 1024), 2)
+            }
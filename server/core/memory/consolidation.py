@@ -1,17 +1,114 @@
+import json
 import time
 import logging
-from sqlalchemy import select, func, text
+import datetime
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from server.core.config import settings, DATA_DIR
 from server.core.database import SessionLocal
-from server.core.memory.models import ActiveRecallMemory, SubconsciousMemory
+from server.core.memory.models import ActiveRecallMemory
 from server.core.memory.vector_store import vector_store
 from server.core.memory.embedding import embedding_service
+from server.core.memory.ingestion import active_recall_ingestor
 
 logger = logging.getLogger(__name__)
 
+STATE_PATH = DATA_DIR / "memory_consolidation.json"
+
+SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string", "maxLength": 300},
+        "keywords": {"type": "array", "maxItems": 6, "items": {"type": "string", "maxLength": 24}}
+    },
+    "required": ["summary", "keywords"],
+    "additionalProperties": False
+}
+
 class MemoryConsolidator:
+    """
+    Background job that folds clusters of near-duplicate active recall
+    memories into subconscious patterns and prunes old active memories.
+
+    Clustering is incremental. Memories newer than the consolidated watermark
+    (persisted in `data/memory_consolidation.json`) lead clusters and are
+    compared against the whole active layer; older memories were already
+    compared with each other on earlier runs. At most
+    `settings.consolidation_max_leaders` new memories lead per run, oldest
+    first, and the watermark only advances past those, so a large backlog
+    is worked off over several runs. Similarities are computed as
+    normalized matrix products in row blocks bounded by `block_elements`.
+    Cluster summaries come from the LLM at background priority when a model
+    is loaded, otherwise from the newest member.
+    """
+
     def __init__(self):
-        self.batch_size = 50
         self.similarity_threshold = 0.92  # Very high similarity for merging
+        self.min_cluster_size = 3  # Only consolidate meaningful clusters
+        self.retention_days = 30
+        self.max_active_memories = 2000
+        self.delete_batch_size = 500
+        self.block_elements = 4_000_000  # Similarity block size (floats), ~16 MB
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.progress: Dict[str, Any] = {"status": "idle"}
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    # --- Scheduling ---
+
+    def start(self):
+        """Run consolidation every `settings.consolidation_interval_seconds` in a daemon thread."""
+        if not settings.consolidation_enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Stop the schedule and wait for a run in progress, up to `timeout` seconds each."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # Runs started by run_async hold the lock too
+        if self._run_lock.acquire(timeout=timeout):
+            self._run_lock.release()
+        else:
+            logger.warning("Memory consolidation still running at shutdown")
+
+    def _loop(self):
+        while not self._stop.wait(settings.consolidation_interval_seconds):
+            self.run_consolidation()
+
+    def run_async(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run_consolidation, name="memory-consolidation-run", daemon=True)
+        thread.start()
+        return thread
+
+    def is_running(self) -> bool:
+        return self._run_lock.locked()
+
+    # --- Watermark ---
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not STATE_PATH.exists():
+            return {}
+        try:
+            with open(STATE_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to read consolidation state: {e}")
+            return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(STATE_PATH, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4)
+
+    # --- Run ---
 
     def run_consolidation(self):
         """
@@ -20,106 +117,196 @@ class MemoryConsolidator:
         2. Merge them into subconscious patterns
         3. Prune old/weak memories
         """
+        if not self._run_lock.acquire(blocking=False):
+            logger.info("Memory consolidation already running, skipped")
+            return
         logger.info("Starting memory consolidation...")
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        self.progress = {"status": "running", "phase": "flush", "started_at": datetime.datetime.now().isoformat()}
         try:
-            self._consolidate_active_to_subconscious()
-            self._prune_weak_memories()
-            logger.info("Memory consolidation complete.")
+            active_recall_ingestor.flush()
+            result = self._consolidate_active_to_subconscious(timings)
+
+            self.progress["phase"] = "prune"
+            phase_started = time.perf_counter()
+            result["pruned"] = self._prune_weak_memories()
+            timings["prune"] = time.perf_counter() - phase_started
+
+            result["timings_ms"] = {k: round(v * 1000, 1) for k, v in timings.items()}
+            result["duration_seconds"] = round(time.perf_counter() - started, 3)
+            result["finished_at"] = datetime.datetime.now().isoformat()
+            self.last_run = result
+            self.progress = {"status": "completed", **result}
+            logger.info(f"Memory consolidation complete: {result['clusters']} clusters, {result['pruned']} pruned in {result['duration_seconds']}s")
         except Exception as e:
+            self.progress = {"status": "error", "error": str(e)}
             logger.error(f"Error during consolidation: {e}")
+        finally:
+            self._run_lock.release()
 
-    def _consolidate_active_to_subconscious(self):
+    def _consolidate_active_to_subconscious(self, timings: Dict[str, float]) -> Dict[str, Any]:
         """
         Find clusters of similar active memories and convert them into a single subconscious pattern.
         """
+        state = self._load_state()
+        watermark = state.get("watermark")
+
+        self.progress["phase"] = "load"
+        phase_started = time.perf_counter()
         with SessionLocal() as db:
-            # Get recent active memories that haven't been consolidated
-            recent_memories = db.query(ActiveRecallMemory).order_by(ActiveRecallMemory.timestamp.desc()).limit(100).all()
-            
-            if len(recent_memories) < 2:
-                return
-
-            # Extract embeddings and ids
-            memories_with_embedding = [m for m in recent_memories if m.embedding is not None]
-            if not memories_with_embedding:
-                return
-
-            # Simple clustering based on cosine similarity
-            clusters = []
-            processed_ids = set()
-
-            for i, mem1 in enumerate(memories_with_embedding):
-                if mem1.id in processed_ids:
+            rows = db.query(ActiveRecallMemory.id, ActiveRecallMemory.embedding, ActiveRecallMemory.timestamp) \
+                .order_by(ActiveRecallMemory.timestamp.desc()).all()
+        rows = [r for r in rows if r[1] is not None and len(r[1])]
+        timings["load"] = time.perf_counter() - phase_started
+
+        result = {"active_memories": len(rows), "new_memories": 0, "clusters": 0, "consolidated": 0}
+        if len(rows) < self.min_cluster_size:
+            return result
+
+        ids = [r[0] for r in rows]
+        stamps = [r[2].isoformat() if r[2] else None for r in rows]
+        matrix = np.stack([r[1] for r in rows]).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+        # Rows are newest first, so new memories lead clusters in the same order as before
+        leaders = [i for i, ts in enumerate(stamps) if watermark is None or ts is None or ts >= watermark]
+        result["new_memories"] = len(leaders)
+        # Over the cap, take the oldest new memories; the newer ones stay above the watermark
+        leaders = leaders[-settings.consolidation_max_leaders:]
+        result["leaders"] = len(leaders)
+
+        self.progress.update(phase="similarity", processed=0, total=len(leaders))
+        phase_started = time.perf_counter()
+        clusters = self._cluster(matrix, leaders)
+        timings["similarity"] = time.perf_counter() - phase_started
+        result["clusters"] = len(clusters)
+
+        if clusters:
+            self.progress["phase"] = "summarize"
+            phase_started = time.perf_counter()
+            member_ids = [ids[i] for cluster in clusters for i in cluster]
+            contents = {}
+            with SessionLocal() as db:
+                for start in range(0, len(member_ids), self.delete_batch_size):
+                    chunk = member_ids[start:start + self.delete_batch_size]
+                    contents.update(db.query(ActiveRecallMemory.id, ActiveRecallMemory.content)
+                                    .filter(ActiveRecallMemory.id.in_(chunk)).all())
+            patterns = [self._summarize([contents.get(ids[i], "") for i in cluster]) for cluster in clusters]
+            timings["summarize"] = time.perf_counter() - phase_started
+
+            self.progress["phase"] = "write"
+            phase_started = time.perf_counter()
+            embeddings = embedding_service.get_embeddings([summary for summary, _ in patterns])
+            for (summary, keywords), embedding in zip(patterns, embeddings):
+                vector_store.add_subconscious(summary, keywords, embedding=embedding)
+                logger.info(f"Consolidated memories into subconscious: {summary[:50]}...")
+            result["consolidated"] = self._delete_active(member_ids)
+            timings["write"] = time.perf_counter() - phase_started
+
+        newest = max((stamps[i] for i in leaders if stamps[i]), default=watermark)
+        if newest != watermark:
+            state["watermark"] = newest
+            self._save_state(state)
+        return result
+
+    def _cluster(self, matrix: np.ndarray, leaders: List[int]) -> List[List[int]]:
+        """
+        Greedy leader clustering: each unassigned leader takes every unassigned
+        row within the similarity threshold. A cluster smaller than
+        `min_cluster_size` is dropped and its rows stay available.
+        """
+        n = len(matrix)
+        assigned = np.zeros(n, dtype=bool)
+        clusters: List[List[int]] = []
+        block = max(1, self.block_elements // n)
+
+        for start in range(0, len(leaders), block):
+            chunk = leaders[start:start + block]
+            sims = matrix[chunk] @ matrix.T
+            for row, leader in enumerate(chunk):
+                if assigned[leader]:
                     continue
+                members = np.flatnonzero((sims[row] >= self.similarity_threshold) & ~assigned)
+                if len(members) >= self.min_cluster_size:
+                    # Leader first, the rest newest first
+                    members = [leader] + [int(m) for m in members if m != leader]
+                    assigned[members] = True
+                    clusters.append(members)
+            self.progress["processed"] = min(len(leaders), start + block)
+        return clusters
+
+    def _summarize(self, contents: List[str]):
+        """(summary, keywords) for a cluster, newest content first."""
+        fallback = (f"Repeated pattern ({len(contents)} times): {contents[0]}", "pattern, consolidation")
+        if not settings.consolidation_llm_summaries:
+            return fallback
 
-                cluster = [mem1]
-                processed_ids.add(mem1.id)
-                
-                # Compare with others
-                for j in range(i + 1, len(memories_with_embedding)):
-                    mem2 = memories_with_embedding[j]
-                    if mem2.id in processed_ids:
-                        continue
-                    
-                    sim = vector_store._cosine_similarity_py(mem1.embedding, mem2.embedding)
-                    if sim >= self.similarity_threshold:
-                        cluster.append(mem2)
-                        processed_ids.add(mem2.id)
-                
-                if len(cluster) >= 3:  # Only consolidate if we have a meaningful cluster
-                    clusters.append(cluster)
-
-            # Process clusters into subconscious memories
-            for cluster in clusters:
-                # 1. Generate summary (In production, use LLM)
-                # For now, we use the most recent memory's content as base + count
-                base_content = cluster[0].content
-                summary = f"Repeated pattern ({len(cluster)} times): {base_content}"
-                
-                # 2. Extract keywords (Simple heuristic)
-                keywords = "pattern, consolidation" 
-                
-                # 3. Add to subconscious
-                vector_store.add_subconscious(summary, keywords)
-                logger.info(f"Consolidated {len(cluster)} memories into subconscious: {summary[:50]}...")
-
-                # 4. Mark active memories as consolidated (or delete depending on policy)
-                # For this implementation, we'll delete them to keep active memory clean
-                for mem in cluster:
-                    db.delete(mem)
-            
-            db.commit()
-
-    def _prune_weak_memories(self):
+        from server.core.llm import llm_engine
+        from server.core.llm_scheduler import llm_scheduler, Priority
+        if not llm_engine.model:
+            return fallback
+
+        samples = "\n".join(f"- {c[:300]}" for c in contents[:10])
+        messages = [
+            {"role": "system", "content": "You condense repeated user messages into one memory. Reply with JSON only."},
+            {"role": "user", "content": (
+                f"These {len(contents)} messages express the same recurring pattern:\n{samples}\n\n"
+                "Write a one-sentence summary of the pattern and up to 6 short keywords."
+            )}
+        ]
+        try:
+            data = llm_scheduler.run_sync(llm_engine.generate_json, messages, schema=SUMMARY_SCHEMA, priority=Priority.BACKGROUND)
+            if isinstance(data, dict) and data.get("summary"):
+                return data["summary"], ", ".join(data.get("keywords") or []) or fallback[1]
+        except Exception as e:
+            logger.warning(f"LLM cluster summary failed, using heuristic: {e}")
+        return fallback
+
+    def _delete_active(self, memory_ids: List[str]) -> int:
+        deleted = 0
+        with SessionLocal() as db:
+            for start in range(0, len(memory_ids), self.delete_batch_size):
+                chunk = memory_ids[start:start + self.delete_batch_size]
+                deleted += db.query(ActiveRecallMemory).filter(ActiveRecallMemory.id.in_(chunk)).delete(synchronize_session=False)
+                db.commit()
+        vector_store.index_remove("active_recall", memory_ids)
+        return deleted
+
+    def _prune_weak_memories(self) -> int:
         """
         Remove old active recall memories that haven't been accessed or reinforced.
         """
-        import datetime
-        
-        # Retention policy: Keep last 1000 messages or 30 days
-        # For this implementation, we delete memories older than 30 days
-        retention_days = 30
-        cutoff_date = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
-        
-        with SessionLocal() as db:
-            try:
-                # Find old memories
-                deleted_count = db.query(ActiveRecallMemory).filter(ActiveRecallMemory.timestamp < cutoff_date).delete()
-                
-                # Also keep total count under control (e.g., max 2000 active memories)
-                total_count = db.query(ActiveRecallMemory).count()
-                if total_count > 2000:
+        # Retention policy: Keep last `max_active_memories` messages and nothing older than `retention_days`
+        cutoff_date = datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days)
+
+        try:
+            with SessionLocal() as db:
+                expired = [r[0] for r in db.query(ActiveRecallMemory.id).filter(ActiveRecallMemory.timestamp < cutoff_date).all()]
+                excess = db.query(ActiveRecallMemory).count() - len(expired) - self.max_active_memories
+                if excess > 0:
                     # Remove oldest excess
-                    excess = total_count - 2000
-                    subquery = db.query(ActiveRecallMemory.id).order_by(ActiveRecallMemory.timestamp.asc()).limit(excess)
-                    db.query(ActiveRecallMemory).filter(ActiveRecallMemory.id.in_(subquery)).delete(synchronize_session=False)
-                    deleted_count += excess
-                
-                if deleted_count > 0:
-                    db.commit()
-                    logger.info(f"Pruned {deleted_count} weak memories.")
-            except Exception as e:
-                logger.error(f"Error pruning memories: {e}")
-                db.rollback()
+                    expired += [r[0] for r in db.query(ActiveRecallMemory.id)
+                                .filter(ActiveRecallMemory.timestamp >= cutoff_date)
+                                .order_by(ActiveRecallMemory.timestamp.asc()).limit(excess).all()]
+            if not expired:
+                return 0
+            deleted = self._delete_active(expired)
+            logger.info(f"Pruned {deleted} weak memories.")
+            return deleted
+        except Exception as e:
+            logger.error(f"Error pruning memories: {e}")
+            return 0
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.consolidation_enabled,
+            "interval_seconds": settings.consolidation_interval_seconds,
+            "watermark": self._load_state().get("watermark"),
+            "progress": self.progress,
+            "last_run": self.last_run
+        }
 
 memory_consolidator = MemoryConsolidator()
@@ -1,15 +1,33 @@
-from typing import List
+from typing import List, Dict, Any
+from collections import OrderedDict
 import os
+import time
+import hashlib
+import threading
 from server.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingService:
+    """
+    Text embeddings from a local sentence-transformers model, the same model
+    exported to int8 ONNX (provider "onnx", see onnx_embedding), or the
+    OpenAI API.
+
+    Results are kept in an LRU keyed by (provider, model, text hash), so the
+    same text embedded for storage and for each memory layer search during a
+    turn is only encoded once. Zero vectors returned on failure are not cached.
+    Returned vectors are shared with the cache and must not be modified.
+    """
+
     def __init__(self):
         self.client = None
         self.local_model = None
         self.provider = settings.embedding_provider
+        self._cache: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.stats = {"requests": 0, "cache_hits": 0, "encoded": 0, "batches": 0, "encode_seconds": 0.0}
         self._setup_client()
 
     def _setup_client(self):
@@ -28,7 +46,6 @@ class EmbeddingService:
         elif self.provider == "local":
             try:
                 # Fix for SSL certificate verify failed
-                import os
                 import ssl
                 
                 # Disable SSL verification for model download
@@ -45,37 +62,119 @@ class EmbeddingService:
             except Exception as e:
                 logger.error(f"Failed to load local embedding model: {e}")
 
+        elif self.provider == "onnx":
+            try:
+                from server.core.memory.onnx_embedding import OnnxSentenceEncoder, CONFIG_FILE
+                model_dir = settings.onnx_embedding_dir
+                if not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+                    # Exporting needs torch and sentence-transformers, which an ONNX deployment leaves out
+                    logger.error(
+                        f"No ONNX export of {settings.local_embedding_model} in {model_dir}. "
+                        f"Run `python server/scripts/export_onnx_embedding.py` once, then restart."
+                    )
+                    return
+                self.local_model = OnnxSentenceEncoder(model_dir, settings.onnx_threads, settings.onnx_max_length)
+                logger.info(f"Loaded ONNX embedding model: {model_dir}")
+            except ImportError as e:
+                logger.error(f"ONNX embeddings need onnxruntime and tokenizers: {e}")
+            except Exception as e:
+                logger.error(f"Failed to load ONNX embedding model: {e}")
+
+    @property
+    def model_name(self) -> str:
+        return settings.embedding_model if self.provider == "openai" else settings.local_embedding_model
+
+    def _cache_key(self, text: str) -> tuple:
+        return (self.provider, self.model_name, hashlib.sha1(text.encode("utf-8")).hexdigest())
+
     def get_embedding(self, text: str) -> List[float]:
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+        """Embed several texts, encoding the ones not cached in batches of `batch_size`."""
+        keys = [self._cache_key(t) for t in texts]
+        results: List[List[float]] = [None] * len(texts)
+        missing: Dict[tuple, List[int]] = {}
+        with self._cache_lock:
+            self.stats["requests"] += len(texts)
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.stats["cache_hits"] += 1
+                    results[i] = cached
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            started = time.perf_counter()
+            vectors = self._encode([texts[positions[0]] for _, positions in chunk])
+            elapsed = time.perf_counter() - started
+
+            with self._cache_lock:
+                self.stats["batches"] += 1
+                self.stats["encoded"] += len(chunk)
+                self.stats["encode_seconds"] += elapsed
+                for (key, positions), vector in zip(chunk, vectors):
+                    if vector is None:
+                        vector = [0.0] * settings.vector_dim
+                    else:
+                        self._cache[key] = vector
+                    for i in positions:
+                        results[i] = vector
+                while len(self._cache) > settings.embedding_cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """Encode one batch; failed entries are None."""
         if self.provider == "openai":
             if not self.client:
                 self._setup_client()
             if not self.client:
                 logger.warning("OpenAI client not configured. Returning zero vector.")
-                return [0.0] * settings.vector_dim
+                return [None] * len(texts)
             try:
                 response = self.client.embeddings.create(
-                    input=text.replace("\n", " "),
+                    input=[t.replace("\n", " ") for t in texts],
                     model=settings.embedding_model
                 )
-                return response.data[0].embedding
+                return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
             except Exception as e:
                 logger.error(f"Error generating embedding (OpenAI): {e}")
-                return [0.0] * settings.vector_dim
+                return [None] * len(texts)
         
-        elif self.provider == "local":
+        elif self.provider in ("local", "onnx"):
             if not self.local_model:
                 self._setup_client()
             if not self.local_model:
                 logger.warning("Local model not loaded. Returning zero vector.")
-                return [0.0] * settings.vector_dim
+                return [None] * len(texts)
             try:
-                # encode returns numpy array, convert to list
-                embedding = self.local_model.encode(text)
-                return embedding.tolist()
+                # encode returns a numpy matrix, convert rows to lists
+                return self.local_model.encode(texts, batch_size=len(texts)).tolist()
             except Exception as e:
                 logger.error(f"Error generating embedding (Local): {e}")
-                return [0.0] * settings.vector_dim
+                return [None] * len(texts)
         
-        return [0.0] * settings.vector_dim
+        return [None] * len(texts)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            stats = dict(self.stats)
+            stats["cached_texts"] = len(self._cache)
+        stats["hit_rate"] = round(stats["cache_hits"] / stats["requests"], 3) if stats["requests"] else 0.0
+        stats["avg_encode_ms"] = round(1000 * stats["encode_seconds"] / stats["encoded"], 2) if stats["encoded"] else 0.0
+        stats["avg_batch_ms"] = round(1000 * stats["encode_seconds"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["encode_seconds"] = round(stats["encode_seconds"], 3)
+        stats["provider"] = self.provider
+        stats["model"] = self.model_name
+        return stats
 
 embedding_service = EmbeddingService()
@@ -0,0 +1,259 @@
+import time
+import queue
+import logging
+import datetime
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from server.core.config import settings
+from server.core.database import SessionLocal
+from server.core.memory.models import ActiveRecallMemory, generate_uuid
+from server.core.memory.embedding import embedding_service
+from server.core.memory.vector_store import vector_store, metadata_matches
+
+logger = logging.getLogger(__name__)
+
+class ActiveRecallIngestor:
+    """
+    Write-behind queue for active recall memories.
+
+    `submit` only enqueues the message. A worker thread drains the queue in
+    batches of up to `settings.memory_ingest_batch_size`, or whatever arrived
+    within `settings.memory_ingest_flush_seconds` of the first queued item,
+    embeds the batch with one encoder call and inserts it in one transaction.
+
+    Until a row is committed it stays in an in-memory overlay that
+    `search_active_recall` merges into its results, so a message is
+    searchable as soon as it is submitted. When the queue is full, `submit`
+    writes the row directly instead of blocking the caller indefinitely.
+
+    Every submitted message counts as in flight until it is committed,
+    including while the worker holds it in a batch, and `flush` waits for
+    that count to reach zero. A batch that fails to write stays pending and
+    is retried with backoff rather than dropped.
+    """
+
+    MAX_RETRY_DELAY = 30.0
+
+    def __init__(self):
+        self._queue: "queue.Queue[ActiveRecallMemory]" = queue.Queue(maxsize=settings.memory_ingest_queue_size)
+        self._pending: Dict[str, ActiveRecallMemory] = {}
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Condition(self._pending_lock)
+        self._inflight = 0
+        self._flush_lock = threading.Lock()
+        self._hurry = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Batches whose write failed, retried by the worker once `_retry_at` passes
+        self._retry: List[ActiveRecallMemory] = []
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self.stats = {"submitted": 0, "flushed": 0, "flushes": 0, "direct_writes": 0, "failed": 0, "failed_batches": 0, "retried": 0, "flush_seconds": 0.0}
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-ingest", daemon=True)
+            self._thread.start()
+
+    # --- Producer side ---
+
+    def submit(self, content: str, role: str, context_metadata: dict = None) -> ActiveRecallMemory:
+        memory = ActiveRecallMemory(
+            id=generate_uuid(),
+            content=content,
+            role=role,
+            timestamp=datetime.datetime.utcnow(),
+            context_metadata=context_metadata or {}
+        )
+        with self._pending_lock:
+            self._pending[memory.id] = memory
+            self._inflight += 1
+            self.stats["submitted"] += 1
+        self._ensure_worker()
+        try:
+            self._queue.put(memory, timeout=0.5)
+        except queue.Full:
+            logger.warning("Memory ingestion queue is full, writing directly")
+            with self._pending_lock:
+                self.stats["direct_writes"] += 1
+            self._write([memory])
+        return memory
+
+    # --- Worker side ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._retry_due()
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + settings.memory_ingest_flush_seconds
+            # Waits in short slices so a flush doesn't sit out the whole batching window
+            while len(batch) < settings.memory_ingest_batch_size and not self._hurry.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.05)))
+                except queue.Empty:
+                    continue
+            self._write(batch)
+
+    def _take_retry(self) -> List[ActiveRecallMemory]:
+        with self._pending_lock:
+            batch, self._retry = self._retry, []
+            self.stats["retried"] += len(batch)
+        return batch
+
+    def _retry_due(self):
+        if self._retry and time.monotonic() >= self._retry_at:
+            self._write_chunks(self._take_retry())
+
+    def _write_chunks(self, batch: List[ActiveRecallMemory]) -> bool:
+        size = settings.memory_ingest_batch_size
+        ok = True
+        for start in range(0, len(batch), size):
+            ok = self._write(batch[start:start + size]) and ok
+        return ok
+
+    def _drain(self) -> List[ActiveRecallMemory]:
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _write(self, batch: List[ActiveRecallMemory]) -> bool:
+        """Commit one batch; on failure it stays pending and is queued for a retry."""
+        with self._flush_lock:
+            started = time.perf_counter()
+            try:
+                embeddings = embedding_service.get_embeddings([m.content for m in batch])
+                with SessionLocal() as db:
+                    db.add_all([
+                        ActiveRecallMemory(
+                            id=m.id,
+                            content=m.content,
+                            embedding=embedding,
+                            role=m.role,
+                            timestamp=m.timestamp,
+                            context_metadata=m.context_metadata
+                        )
+                        for m, embedding in zip(batch, embeddings)
+                    ])
+                    db.commit()
+                for m, embedding in zip(batch, embeddings):
+                    vector_store._index_add(ActiveRecallMemory, m.id, embedding, m.timestamp)
+                failed = False
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} active recall memories: {e}")
+                failed = True
+
+            with self._pending_lock:
+                self.stats["flushes"] += 1
+                self.stats["flush_seconds"] += time.perf_counter() - started
+                if failed:
+                    self.stats["failed"] += len(batch)
+                    self.stats["failed_batches"] += 1
+                    self._retry.extend(batch)
+                    self._retry_delay = min(self.MAX_RETRY_DELAY, max(0.5, 2 * self._retry_delay))
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    return False
+                for m in batch:
+                    self._pending.pop(m.id, None)
+                self._inflight -= len(batch)
+                self.stats["flushed"] += len(batch)
+                self._retry_delay = 0.0
+                self._idle.notify_all()
+            return True
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """
+        Write everything submitted so far, including batches the worker is
+        holding; failed batches get one immediate retry. Used
+        before consolidation and on shutdown. Returns False if rows were still
+        unwritten after `timeout` seconds.
+        """
+        self._hurry.set()
+        try:
+            self._write_chunks(self._drain())
+            deadline = time.monotonic() + timeout
+            retried = False
+            while True:
+                with self._idle:
+                    # Stop waiting once every unwritten row is in the retry list, the worker won't touch it before the backoff
+                    while self._inflight and not (self._retry and len(self._retry) >= self._inflight):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._idle.wait(min(remaining, 0.1))
+                    unwritten = self._inflight
+                if not unwritten or retried or time.monotonic() >= deadline:
+                    break
+                retried = True
+                self._write_chunks(self._take_retry())
+        finally:
+            self._hurry.clear()
+        if unwritten:
+            logger.warning(f"Memory ingestion flush left {unwritten} messages unwritten")
+        return unwritten == 0
+
+    def stop(self, timeout: float = 30.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush(timeout)
+
+    # --- Read-your-writes overlay ---
+
+    def search_pending(self, query_embedding, limit: int, threshold: float = 0.0, time_range=None,
+                       role: str = None, metadata: dict = None) -> List[Dict[str, Any]]:
+        """
+        Score memories that are queued but not yet committed against a query
+        embedding, applying the same filters as `search_active_recall`
+        (`time_range` as naive UTC (start, end)).
+        """
+        with self._pending_lock:
+            pending = list(self._pending.values())
+        if time_range is not None:
+            start, end = time_range
+            pending = [m for m in pending if (start is None or m.timestamp >= start) and (end is None or m.timestamp < end)]
+        if role:
+            pending = [m for m in pending if m.role == role]
+        if metadata:
+            pending = [m for m in pending if metadata_matches(m.context_metadata, metadata)]
+        if not pending:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        # Cached by the embedding service, so the flush does not encode these again
+        matrix = np.asarray(embedding_service.get_embeddings([m.content for m in pending]), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1e-10
+        sims = matrix @ query / (norms * norm)
+        results = [{"memory": m, "similarity": float(s)} for m, s in zip(pending, sims) if s >= threshold]
+        results.sort(key=lambda x: x["similarity"], reverse=True)
+        return results[:limit]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+            stats["inflight"] = self._inflight
+            stats["retrying"] = len(self._retry)
+        stats["queued"] = self._queue.qsize()
+        stats["avg_flush_ms"] = round(1000 * stats["flush_seconds"] / stats["flushes"], 2) if stats["flushes"] else 0.0
+        stats["flush_seconds"] = round(stats["flush_seconds"], 3)
+        return stats
+
+active_recall_ingestor = ActiveRecallIngestor()
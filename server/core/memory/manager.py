@@ -1,5 +1,6 @@
 from server.core.memory_legacy import memory_manager as legacy_manager
 from server.core.memory.vector_store import vector_store
+from server.core.memory.ingestion import active_recall_ingestor
 from server.core.memory.trigger import memory_trigger
 import logging
 
@@ -33,10 +34,19 @@ class MemoryManager:
         # Note: We don't clear vector store to preserve long-term memory
         # unless explicitly requested.
 
-    def add_message(self, role: str, content: str):
+    def add_message(self, role: str, content: str, background: bool = False):
+        """
+        Record a message in history and index it for active recall. With
+        `background=True` only the history is updated before returning; the
+        message is queued for the ingestion worker, which embeds and writes
+        it in a batch (it is searchable right away through the overlay).
+        """
         self.legacy.add_message(role, content)
         try:
-            vector_store.add_active_recall(content, role)
+            if background:
+                active_recall_ingestor.submit(content, role)
+            else:
+                vector_store.add_active_recall(content, role)
         except Exception as e:
             logger.error(f"Failed to add active recall memory: {e}")
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, JSON, Integer, DateTime, ForeignKey, Text, Index, TypeDecorator
+from sqlalchemy import Column, String, Float, JSON, Integer, DateTime, ForeignKey, Text, Index, TypeDecorator, LargeBinary
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
@@ -7,13 +7,55 @@ from server.core.config import settings
 import datetime
 import uuid
 import json
+import struct
+import numpy as np
 
 def generate_uuid():
     return str(uuid.uuid4())
 
+# Binary embedding format for SQLite: a 4-byte header (format version, dtype
+# code, dimension) followed by the raw little-endian vector. int8 vectors carry
+# a float32 scale right after the header.
+VECTOR_FORMAT_VERSION = 1
+VECTOR_HEADER = struct.Struct("<BBH")
+VECTOR_DTYPES = {"float32": 0, "float16": 1, "int8": 2}
+
+def encode_vector(value, dtype: str = "float32") -> bytes:
+    vector = np.asarray(value, dtype=np.float32).ravel()
+    header = VECTOR_HEADER.pack(VECTOR_FORMAT_VERSION, VECTOR_DTYPES[dtype], len(vector))
+    if dtype == "float16":
+        return header + vector.astype("<f2").tobytes()
+    if dtype == "int8":
+        peak = float(np.abs(vector).max()) if len(vector) else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return header + struct.pack("<f", scale) + quantized.tobytes()
+    return header + vector.astype("<f4", copy=False).tobytes()
+
+def decode_vector(value) -> np.ndarray:
+    """
+    Decode a stored embedding to a float32 array. float32 blobs are wrapped
+    with `np.frombuffer` without copying (the result is read-only); rows still
+    holding the legacy JSON text are parsed.
+    """
+    if isinstance(value, str):
+        return np.asarray(json.loads(value), dtype=np.float32)
+    version, code, dim = VECTOR_HEADER.unpack_from(value)
+    if version != VECTOR_FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+    offset = VECTOR_HEADER.size
+    if code == VECTOR_DTYPES["float32"]:
+        return np.frombuffer(value, dtype="<f4", count=dim, offset=offset)
+    if code == VECTOR_DTYPES["float16"]:
+        return np.frombuffer(value, dtype="<f2", count=dim, offset=offset).astype(np.float32)
+    if code == VECTOR_DTYPES["int8"]:
+        (scale,) = struct.unpack_from("<f", value, offset)
+        return np.frombuffer(value, dtype=np.int8, count=dim, offset=offset + 4).astype(np.float32) * np.float32(scale)
+    raise ValueError(f"Unknown embedding dtype code {code}")
+
 # Compatibility for SQLite
 class VectorType(TypeDecorator):
-    impl = Text
+    impl = LargeBinary
     cache_ok = True
 
     def load_dialect_impl(self, dialect):
@@ -26,14 +68,14 @@ class VectorType(TypeDecorator):
             return value
         if value is None:
             return None
-        return json.dumps(value)
+        return encode_vector(value, settings.embedding_storage_dtype)
 
     def process_result_value(self, value, dialect):
         if dialect.name == 'postgresql':
             return value
         if value is None:
             return None
-        return json.loads(value)
+        return decode_vector(value)
 
 class InstinctMemory(Base):
     __tablename__ = "memory_instinct"
@@ -74,7 +116,7 @@ class ActiveRecallMemory(Base):
     content: Mapped[str] = mapped_column(Text)
     embedding: Mapped[list] = mapped_column(VectorType)
     role: Mapped[str] = mapped_column(String) # user or assistant
-    timestamp: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+    timestamp: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), default=func.now(), index=True)
     context_metadata: Mapped[dict] = mapped_column(JSON, nullable=True)
     
     if settings.database_url.startswith("postgresql"):
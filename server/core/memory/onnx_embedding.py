@@ -0,0 +1,144 @@
+import os
+import json
+import logging
+from typing import List
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+except ImportError:
+    ort = None
+    Tokenizer = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model_int8.onnx"
+CONFIG_FILE = "embedding_config.json"
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Mean of the token states under the attention mask, as sentence-transformers' Pooling(mean)."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (hidden * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+class OnnxSentenceEncoder:
+    """
+    Sentence embeddings from a transformer exported to ONNX and dynamically
+    quantized to int8, run with onnxruntime on CPU. Needs only onnxruntime
+    and tokenizers at runtime, not torch.
+
+    `encode` follows SentenceTransformer.encode (texts in, float32 matrix
+    out) and applies the pooling and normalization recorded at export, so
+    vectors are interchangeable with the PyTorch model's up to quantization
+    error. Texts are sorted by length before batching to keep padding short.
+    """
+
+    def __init__(self, model_dir: str, threads: int = 0, max_length: int = 256):
+        if ort is None:
+            raise RuntimeError("onnxruntime and tokenizers are not installed")
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.max_length = min(max_length, self.config.get("max_length", max_length))
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_token_id", 0))
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, MODEL_FILE), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dim"]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]
+        if self.config.get("pooling") == "cls":
+            pooled = hidden[:, 0]
+        else:
+            pooled = mean_pool(hidden, mask)
+        return pooled
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.zeros((len(texts), self.config["dim"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._encode_batch([texts[i] for i in rows])
+        return l2_normalize(out) if self.config.get("normalize") else out
+
+def export_onnx(model_name: str, output_dir: str, opset: int = 14) -> str:
+    """
+    Export a sentence-transformers model to `output_dir` as an int8 ONNX
+    graph plus tokenizer.json and the pooling settings. Needs torch,
+    sentence-transformers, onnx and onnxruntime; run once, e.g. with
+    server/scripts/export_onnx_embedding.py.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = next((m for m in model if isinstance(m, Pooling)), None)
+    if pooling is not None and not (pooling.pooling_mode_mean_tokens or pooling.pooling_mode_cls_token):
+        raise ValueError(f"Unsupported pooling for {model_name}, only mean and CLS are exported")
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            Wrapper(transformer), tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"], dynamic_axes=dynamic, opset_version=opset
+        )
+    quantize_dynamic(fp32_path, os.path.join(output_dir, MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.save_pretrained(output_dir)
+    config = {
+        "source_model": model_name,
+        "dim": model.get_sentence_embedding_dimension(),
+        "max_length": model.max_seq_length,
+        "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(isinstance(m, Normalize) for m in model),
+        "pad_token_id": tokenizer.pad_token_id or 0
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=4)
+    logger.info(f"Exported {model_name} to {output_dir} (int8 ONNX)")
+    return output_dir
@@ -1,8 +1,13 @@
 from server.core.memory.vector_store import vector_store
+from server.core.memory.embedding import embedding_service
 from server.core.config import settings
+from server.core.turn_classifier import turn_classifier
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import re
-import json
+import time
 import logging
+import datetime
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -10,11 +15,71 @@ class MemoryTrigger:
     def __init__(self):
         self.threshold_instinct = 0.85
         self.threshold_subconscious = 0.7
+        # "Last time" means the previous conversation: messages older than this gap
+        self.session_gap = datetime.timedelta(minutes=30)
+        self.session_span = datetime.timedelta(hours=6)
+        # Layer searches of one turn run side by side; a few turns may overlap
+        self._executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="memory-layer")
+        # Searches queued or running, including ones whose turn already gave up on them
+        self._outstanding = 0
+        self.max_outstanding = 12
+        self._stats_lock = threading.Lock()
+        self.stats = {layer: {"searches": 0, "timeouts": 0, "errors": 0, "skipped": 0, "total_ms": 0.0}
+                      for layer in ("instinct", "subconscious", "active_recall")}
+
+    def _timed(self, layer: str, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.stats[layer]["searches"] += 1
+                self.stats[layer]["total_ms"] += (time.perf_counter() - started) * 1000
+
+    def _submit(self, layer: str, fn, *args, **kwargs):
+        """Queue a layer search, or return None and count a skip when the executor is backed up."""
+        with self._stats_lock:
+            if self._outstanding >= self.max_outstanding:
+                self.stats[layer]["skipped"] += 1
+                logger.warning(f"Memory layer {layer} skipped, {self._outstanding} searches outstanding")
+                return None
+            self._outstanding += 1
+        future = self._executor.submit(self._timed, layer, fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._stats_lock:
+            self._outstanding -= 1
+
+    def _collect(self, layer: str, future, deadline: float):
+        """Result of a layer search, or None if it was skipped, failed or missed the turn's deadline for that layer."""
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        except TimeoutError:
+            with self._stats_lock:
+                self.stats[layer]["timeouts"] += 1
+            logger.warning(f"Memory layer {layer} missed its latency budget, skipped")
+        except Exception as e:
+            with self._stats_lock:
+                self.stats[layer]["errors"] += 1
+            logger.error(f"Memory layer {layer} search failed: {e}")
+        return None
 
     def analyze_and_retrieve(self, user_input: str):
         """
         Analyze user input to decide which memory layers to activate and retrieve them.
         Returns a combined context string and detailed results.
+
+        The input is embedded once and the layers are searched in parallel.
+        Each layer has a latency budget from `settings.memory_layer_budgets_ms`;
+        a layer that has not answered by then is left out of this turn, and a
+        layer is skipped outright while `max_outstanding` searches are already
+        queued or running. Active recall is only searched when the input refers
+        to a past conversation or the recall intent check says so, and its
+        budget starts once that is decided.
         """
         triggers = {
             "instinct": False,
@@ -22,64 +87,112 @@ class MemoryTrigger:
             "active_recall": False,
             "results": {}
         }
-        
-        # 1. Search Instinct (High frequency, fast)
-        instinct_results = vector_store.search_instinct(user_input, limit=1, threshold=self.threshold_instinct)
-        if instinct_results:
-            triggers["instinct"] = True
-            triggers["results"]["instinct"] = instinct_results
-            
-        # 2. Search Subconscious (Implicit association)
-        subconscious_results = vector_store.search_subconscious(user_input, limit=3, threshold=self.threshold_subconscious)
-        if subconscious_results:
-            triggers["subconscious"] = True
-            triggers["results"]["subconscious"] = subconscious_results
-            
-        # 3. Active Recall (Explicit intent)
-        # Simple heuristic for now, can be upgraded to LLM classification
-        if self._is_active_recall_intent(user_input):
-            triggers["active_recall"] = True
-            active_results = vector_store.search_active_recall(user_input, limit=5)
-            triggers["results"]["active_recall"] = active_results
+
+        started = time.perf_counter()
+        budgets = settings.memory_layer_budgets_ms
+        embedding = embedding_service.get_embedding(user_input)
+        futures = {
+            # 1. Search Instinct (High frequency, fast)
+            "instinct": self._submit(
+                "instinct", vector_store.search_instinct,
+                user_input, limit=1, threshold=self.threshold_instinct, embedding=embedding
+            ),
+            # 2. Search Subconscious (Implicit association)
+            "subconscious": self._submit(
+                "subconscious", vector_store.search_subconscious,
+                user_input, limit=3, threshold=self.threshold_subconscious, embedding=embedding
+            )
+        }
+
+        # 3. Active Recall (Explicit intent), decided while the other layers run.
+        # Any time reference narrows the search; only a past one ("yesterday", "last time") is a recall cue by itself
+        time_range, past = self._time_window(user_input)
+        if past or self._is_active_recall_intent(user_input):
+            active_started = time.perf_counter()
+            future = self._submit(
+                "active_recall", vector_store.search_active_recall,
+                user_input, limit=5, time_range=time_range, embedding=embedding
+            )
+        else:
+            future = None
+
+        for layer in ("instinct", "subconscious"):
+            results = self._collect(layer, futures[layer], started + budgets.get(layer, 500) / 1000)
+            if results:
+                triggers[layer] = True
+                triggers["results"][layer] = results
+
+        if future is not None:
+            active_results = self._collect("active_recall", future, active_started + budgets.get("active_recall", 500) / 1000)
+            if active_results is not None:
+                triggers["active_recall"] = True
+                triggers["time_range"] = time_range
+                triggers["results"]["active_recall"] = active_results
         
         return self._synthesize_context(triggers), triggers
 
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                layer: {
+                    "searches": s["searches"],
+                    "timeouts": s["timeouts"],
+                    "errors": s["errors"],
+                    "skipped": s["skipped"],
+                    "avg_ms": round(s["total_ms"] / s["searches"], 2) if s["searches"] else 0.0
+                }
+                for layer, s in self.stats.items()
+            }
+
     def _is_active_recall_intent(self, text: str) -> bool:
-        # 1. Fast Regex Check (Keep for latency optimization)
-        patterns = [
-            r"remember", r"recall", r"what did i say", r"history", 
-            r"last time", r"yesterday", r"before", r"mentioned"
-        ]
-        combined_pattern = "|".join(patterns)
-        if re.search(combined_pattern, text, re.IGNORECASE):
-            return True
-
-        # 2. LLM Classification (For implicit intent)
-        # Use local LLM to detect if user is asking about the past
+        # Shares the turn classification with the search layer (memoised per text),
+        # so no extra LLM call is made for the same turn
         try:
-            from server.core.llm import llm_engine
-            
-            # Skip if model not ready to avoid long waits or errors
-            if llm_engine.status != "ready":
-                return False
-
-            prompt = """
-Analyze if the user is asking to recall a past memory, conversation, or fact from history.
-Respond ONLY with a JSON object: {"is_recall": true} or {"is_recall": false}.
-"""
-            # Call LLM: user_input=text, system_prompt=prompt
-            response = llm_engine.generate_response(text, prompt)
-            
-            # Parse JSON
-            match = re.search(r"\{.*\}", response, re.DOTALL)
-            if match:
-                data = json.loads(match.group(0))
-                return data.get("is_recall", False)
-                
+            return turn_classifier.classify(text)["is_recall"]
         except Exception as e:
-            logger.warning(f"LLM intent check failed: {e}")
-            
-        return False
+            logger.warning(f"Recall intent check failed: {e}")
+            return False
+
+    def _time_window(self, text: str, now: datetime.datetime = None):
+        """
+        Time range implied by the user's words, as ({"start", "end"}, past).
+        Either bound may be None, and the range is None when the text has no
+        time reference. `past` is True for references to an earlier
+        conversation ("yesterday", "last time", "3 days ago"), False for the
+        current period ("today", "this week"). Days follow the server's local
+        time.
+        """
+        text = text.lower()
+        now = now or datetime.datetime.now().astimezone()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        day = datetime.timedelta(days=1)
+
+        if "last time" in text or "上次" in text:
+            latest = vector_store.latest_active_timestamp(before=now - self.session_gap)
+            if latest is None:
+                return None, False
+            return {"start": latest - self.session_span, "end": latest + datetime.timedelta(seconds=1)}, True
+        if "last night" in text or "昨晚" in text or "昨天晚上" in text:
+            return {"start": today - day + datetime.timedelta(hours=18), "end": today + datetime.timedelta(hours=6)}, True
+        if "day before yesterday" in text or "前天" in text:
+            return {"start": today - 2 * day, "end": today - day}, True
+        if "yesterday" in text or "昨天" in text:
+            return {"start": today - day, "end": today}, True
+        if "this morning" in text or "今天早上" in text or "今早" in text:
+            return {"start": today, "end": today + datetime.timedelta(hours=12)}, False
+        if "today" in text or "今天" in text:
+            return {"start": today, "end": None}, False
+        if "last week" in text or "上周" in text or "上星期" in text:
+            monday = today - today.weekday() * day
+            return {"start": monday - 7 * day, "end": monday}, True
+        if "this week" in text or "这周" in text or "本周" in text:
+            return {"start": today - today.weekday() * day, "end": None}, False
+
+        match = re.search(r"(\d+)\s*(?:days? ago|天前)", text)
+        if match:
+            start = today - int(match.group(1)) * day
+            return {"start": start, "end": start + day}, True
+        return None, False
 
     def _synthesize_context(self, triggers: dict) -> str:
         context_parts = []
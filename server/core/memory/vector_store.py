@@ -1,18 +1,112 @@
-from sqlalchemy import select, text
+from sqlalchemy import select, text, func, case
 from sqlalchemy.orm import Session
 from server.core.database import SessionLocal, engine
-from server.core.memory.models import InstinctMemory, SubconsciousMemory, ActiveRecallMemory
+from server.core.memory.models import InstinctMemory, SubconsciousMemory, ActiveRecallMemory, VECTOR_HEADER
 from server.core.memory.embedding import embedding_service
+from server.core.memory.ann_index import IVFFlatIndex, id_fingerprint
 from server.core.config import settings
+import os
+import re
+import datetime
 import logging
+import threading
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+LAYER_MODELS = {
+    "instinct": InstinctMemory,
+    "subconscious": SubconsciousMemory,
+    "active_recall": ActiveRecallMemory
+}
+
+# Too common to say anything about relevance; matching on them would pull in every row
+FTS_STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her him his how i if in
+into is it its me my no not of on or our she so than that the their them then there these they this to
+us was we were what when where which who why will with would you your
+""".split())
+
+# JSON type names a filter value may match, per dialect: (SQLite json_type, PostgreSQL json_typeof)
+METADATA_JSON_TYPES = {
+    bool: (("true", "false"), ("boolean",)),
+    float: (("integer", "real"), ("number",)),
+    str: (("text",), ("string",))
+}
+
+def metadata_kind(value):
+    """The kind a metadata value compares as: bool, float (any number), str, None for null, else its type."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float)):
+        return float
+    return type(value)
+
+def metadata_filter(column, key: str, value, postgres: bool = False):
+    """
+    SQL condition for `column[key] == value` on a JSON column, with the same
+    meaning as `metadata_matches`. The stored value must have the filter
+    value's JSON kind: a bare cast would compare SQLite's 1 for true with the
+    string 'True', or let the string "3" match the number 3. Numbers compare
+    as floats, as 3 == 3.0 does in Python.
+    """
+    element = column[key]
+    kind = metadata_kind(value)
+    if kind is None:
+        return element.as_string().is_(None)
+    if kind not in METADATA_JSON_TYPES:
+        raise TypeError(f"Metadata filter on {key!r} needs a str, int, float, bool or None, got {type(value).__name__}")
+    typed = {bool: element.as_boolean, float: element.as_float, str: element.as_string}[kind]()
+    sqlite_types, postgres_types = METADATA_JSON_TYPES[kind]
+    if postgres:
+        json_type, names = func.json_typeof(element), postgres_types
+    else:
+        json_type, names = func.json_type(column, f'$."{key}"'), sqlite_types
+    # The cast only runs on values of the right kind, so it can't fail or match loosely
+    return case((json_type.in_(names), typed), else_=None) == value
+
+def metadata_matches(context_metadata: dict, metadata: dict) -> bool:
+    """In-memory counterpart of `metadata_filter` for rows not written yet."""
+    context_metadata = context_metadata or {}
+    return all(
+        context_metadata.get(key) == value and metadata_kind(context_metadata.get(key)) is metadata_kind(value)
+        for key, value in metadata.items()
+    )
+
+def to_epoch(value) -> float:
+    """Epoch seconds for a stored timestamp (naive values are UTC, as SQLite's CURRENT_TIMESTAMP)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+def to_utc_naive(value) -> datetime.datetime:
+    """Normalize a datetime, ISO string or epoch seconds to the naive UTC form stored in the database."""
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
 class VectorStore:
     def __init__(self):
         self.ensure_extension()
         self.is_sqlite = not settings.database_url.startswith("postgresql")
+        # Per-layer ANN indexes (SQLite only; Postgres uses pgvector indexes)
+        self._indexes = {}
+        self._index_lock = threading.Lock()
+        self._stale = set()
+        self._save_timers = {}
+        # Adds and removes made while a layer's index is being built, replayed before it is swapped in
+        self._pending_ops = {}
+        self._build_locks = {model: threading.Lock() for model in LAYER_MODELS.values()}
+        # FTS5 tables for hybrid search, created on first use (None once found unsupported)
+        self._fts_ready = set()
+        self._fts_available = True
+        self.index_dir = os.path.join(os.path.dirname(settings.database_url.replace("sqlite:///", "")) or ".", "ann")
         
     def ensure_extension(self):
         if settings.database_url.startswith("postgresql"):
@@ -42,21 +136,433 @@ class VectorStore:
             return 0.0
         return float(np.dot(v1, v2) / (norm1 * norm2))
 
-    def _search_sqlite(self, model, query_embedding, limit, threshold=0.0):
+    # --- ANN index management ---
+
+    def _use_index(self, model) -> bool:
+        return self.is_sqlite and settings.ann_index_enabled and model in LAYER_MODELS.values()
+
+    def _index_path(self, model) -> str:
+        return os.path.join(self.index_dir, f"{model.__tablename__}.npz")
+
+    def _fingerprint(self, model) -> dict:
+        """`id_fingerprint` of the rows an index over this table holds, to compare with a saved index's."""
+        with engine.connect() as conn:
+            ids = conn.execute(text(
+                f"SELECT id FROM {model.__tablename__} WHERE length(embedding) > {VECTOR_HEADER.size}"
+            )).scalars()
+            return id_fingerprint(ids)
+
+    def _index_options(self, model) -> dict:
+        """IVFFlatIndex arguments from settings; quantized indexes re-rank with embeddings read from the table."""
+        quantization = None if settings.ann_quantization in ("", "none") else settings.ann_quantization
+        return {
+            "nprobe": settings.ann_nprobe,
+            "min_train_rows": settings.ann_min_train_rows,
+            "quantization": quantization,
+            "rerank_factor": settings.ann_rerank_factor,
+            "vector_source": (lambda ids: self._fetch_embeddings(model, ids)) if quantization else None
+        }
+
+    def _fetch_embeddings(self, model, ids) -> dict:
+        with SessionLocal() as db:
+            return dict(db.query(model.id, model.embedding).filter(model.id.in_(ids)).all())
+
+    def _rebuild_index(self, model) -> IVFFlatIndex:
+        timed = hasattr(model, "timestamp")
+        with SessionLocal() as db:
+            columns = [model.id, model.embedding] + ([model.timestamp] if timed else [])
+            rows = db.query(*columns).all()
+        rows = [r for r in rows if r[1] is not None and len(r[1])]
+        index = IVFFlatIndex(**self._index_options(model))
+        if rows:
+            # Embeddings decode as views over the row buffers, stacking is the only copy
+            timestamps = [to_epoch(r[2]) if r[2] else np.nan for r in rows] if timed else None
+            index.build([r[0] for r in rows], np.stack([r[1] for r in rows]), timestamps)
+        logger.info(f"Built ANN index for {model.__tablename__}: {len(index)} vectors")
+        return index
+
+    def _get_index(self, model) -> IVFFlatIndex:
+        with self._index_lock:
+            index = self._indexes.get(model)
+            if index is not None and model not in self._stale:
+                return index
+        # One build per layer at a time; searches and writes on other layers don't wait for it
+        with self._build_locks[model]:
+            with self._index_lock:
+                index = self._indexes.get(model)
+                if index is not None and model not in self._stale:
+                    return index
+                first_load = index is None
+                self._stale.discard(model)
+                self._pending_ops[model] = []
+            try:
+                index = self._load_index(model) if first_load else None
+                rebuilt = index is None
+                if rebuilt:
+                    index = self._rebuild_index(model)
+            except Exception:
+                with self._index_lock:
+                    self._pending_ops.pop(model, None)
+                raise
+            with self._index_lock:
+                for op, args in self._pending_ops.pop(model):
+                    getattr(index, op)(*args)
+                self._indexes[model] = index
+            if rebuilt:
+                self._schedule_save(model, delay=0)
+            return index
+
+    def _load_index(self, model):
+        """The saved index if it still holds exactly the table's rows, else None."""
+        path = self._index_path(model)
+        if not os.path.exists(path):
+            return None
+        try:
+            loaded, fingerprint = IVFFlatIndex.load(path, **self._index_options(model))
+        except Exception as e:
+            logger.warning(f"Failed to load ANN index {path}: {e}")
+            return None
+        # Indexes saved before timestamps were stored can't serve time-range queries
+        untimed = hasattr(model, "timestamp") and len(loaded) and np.isnan(loaded.timestamps[:loaded.size]).all()
+        if fingerprint != self._fingerprint(model) or untimed:
+            logger.info(f"ANN index for {model.__tablename__} is stale, rebuilding")
+            return None
+        return loaded
+
+    def _schedule_save(self, model, delay: float = None):
+        # Debounced: at most one pending save per layer
+        if model in self._save_timers:
+            return
+        delay = settings.ann_save_interval_seconds if delay is None else delay
+        timer = threading.Timer(delay, self._save_index, args=(model,))
+        timer.daemon = True
+        self._save_timers[model] = timer
+        timer.start()
+
+    def _save_index(self, model):
+        self._save_timers.pop(model, None)
+        index = self._indexes.get(model)
+        if index is None:
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            path = self._index_path(model)
+            # Per-thread name, a debounced save may still be running when save_indexes runs
+            tmp = f"{path}.{threading.get_ident()}.tmp.npz"
+            index.save(tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning(f"Failed to save ANN index for {model.__tablename__}: {e}")
+
+    def save_indexes(self):
+        """Flush every loaded index to disk (called on shutdown)."""
+        for timer in list(self._save_timers.values()):
+            timer.cancel()
+        self._save_timers.clear()
+        for model in list(self._indexes):
+            self._save_index(model)
+
+    def _apply(self, model, op: str, *args) -> bool:
+        """Apply an add or remove to the layer's index, and record it for a build in progress."""
+        with self._index_lock:
+            pending = self._pending_ops.get(model)
+            if pending is not None:
+                pending.append((op, args))
+            index = self._indexes.get(model)
+            if index is not None:
+                getattr(index, op)(*args)
+        return index is not None
+
+    def _index_add(self, model, memory_id, embedding, timestamp=None):
+        if not self._use_index(model) or embedding is None or not len(embedding):
+            return
+        if self._apply(model, "add", memory_id, embedding, to_epoch(timestamp) if timestamp else None):
+            self._schedule_save(model)
+
+    def _index_remove(self, model, memory_ids):
+        changed = False
+        for memory_id in memory_ids:
+            changed = self._apply(model, "remove", memory_id) or changed
+        if changed:
+            self._schedule_save(model)
+
+    def index_remove(self, layer_name: str, memory_ids):
+        """Drop rows deleted outside the store's own methods from the layer index."""
+        model = LAYER_MODELS.get(layer_name)
+        if model:
+            self._index_remove(model, memory_ids)
+
+    def mark_stale(self, layer_name: str):
+        """Force a rebuild on next search, for bulk changes made directly in the database."""
+        model = LAYER_MODELS.get(layer_name)
+        if model:
+            with self._index_lock:
+                self._stale.add(model)
+
+    # --- Hybrid lexical + vector search ---
+
+    FTS_COLUMNS = {"memory_subconscious": ("content", "keywords"), "memory_active_recall": ("content",)}
+
+    def _use_hybrid(self, model) -> bool:
+        return (
+            self.is_sqlite and self._fts_available and settings.hybrid_search_enabled
+            and model.__tablename__ in self.FTS_COLUMNS
+            and any(LAYER_MODELS.get(layer) is model for layer in settings.hybrid_search_layers)
+        )
+
+    def _ensure_fts(self, model) -> bool:
+        """
+        Create the external-content FTS5 table for a layer plus triggers that
+        keep it in sync with every insert, update and delete, then index the
+        rows that already exist. Rows are linked by implicit rowid, which a
+        VACUUM may renumber, so an existing index is checked against its table
+        once per process (FTS5 `integrity-check` with rank 1) and rebuilt if
+        they disagree. Hybrid search is only turned off for good when SQLite
+        lacks the fts5 module; other errors are retried on the next search.
+        """
+        table = model.__tablename__
+        if table in self._fts_ready:
+            return True
+        columns = self.FTS_COLUMNS[table]
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new_values = ", ".join(f"new.{c}" for c in columns)
+        old_values = ", ".join(f"old.{c}" for c in columns)
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}).first()
+                if not exists:
+                    conn.execute(text(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='rowid')"))
+                    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                                      f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_values}); END"))
+                    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                                      f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_values}); END"))
+                    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+                                      f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old_values}); "
+                                      f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_values}); END"))
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+                    logger.info(f"Created full-text index {fts}")
+            if exists:
+                self._check_fts(fts)
+        except Exception as e:
+            if "no such module: fts5" in str(e):
+                logger.warning(f"FTS5 unavailable, hybrid search disabled: {e}")
+                self._fts_available = False
+            else:
+                logger.error(f"Failed to prepare full-text index {fts}: {e}")
+            return False
+        self._fts_ready.add(table)
+        return True
+
+    def _check_fts(self, fts: str):
+        """Rebuild an FTS5 index whose rowids or contents no longer match its content table."""
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"INSERT INTO {fts}({fts}, rank) VALUES ('integrity-check', 1)"))
+        except Exception as e:
+            logger.warning(f"Full-text index {fts} is out of sync with its table, rebuilding: {e}")
+            with engine.begin() as conn:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    @staticmethod
+    def _fts_query(query_text: str) -> str:
+        # Any query term may match; quoting keeps FTS5 operators and punctuation literal
+        tokens = dict.fromkeys(t for t in re.findall(r"\w+", query_text.lower())
+                               if len(t) > 1 and t not in FTS_STOPWORDS)
+        return " OR ".join(f'"{t}"' for t in tokens)
+
+    def _search_lexical(self, model, query_text: str, limit: int):
+        """[(memory id, bm25)] best first; FTS5's bm25() is lower-is-better."""
+        match = self._fts_query(query_text)
+        if not match:
+            return []
+        table = model.__tablename__
+        with engine.connect() as conn:
+            return conn.execute(text(
+                f"SELECT m.id, bm25({table}_fts) AS rank FROM {table}_fts "
+                f"JOIN {table} m ON m.rowid = {table}_fts.rowid "
+                f"WHERE {table}_fts MATCH :match ORDER BY rank LIMIT :n"
+            ), {"match": match, "n": limit}).all()
+
+    def _search_hybrid(self, model, query_text: str, query_embedding, limit: int, threshold: float = 0.0):
+        """
+        Reciprocal rank fusion of BM25 over content/keywords and cosine similarity.
+
+        Candidates are the top `hybrid_candidates` lexical matches plus the top
+        dense hits from the ANN index, so neither side scans the layer. All
+        candidates are scored densely from their stored embeddings and only
+        those whose similarity passes `threshold` are kept: a lexical match
+        recovers rows the approximate index missed and lifts their rank, it
+        does not stand in for relevance.
+        """
+        k = settings.hybrid_rrf_k
+        n = max(limit, settings.hybrid_candidates)
+        lexical = self._search_lexical(model, query_text, n)
+        dense = self._search_sqlite(model, query_embedding, n, threshold)
+        lexical_rank = {id_: rank for rank, (id_, _) in enumerate(lexical)}
+        bm25 = dict(lexical)
+
+        candidates = {r["memory"].id: r["memory"] for r in dense}
+        missing = [id_ for id_ in lexical_rank if id_ not in candidates]
+        if missing:
+            with SessionLocal() as db:
+                candidates.update({m.id: m for m in db.query(model).filter(model.id.in_(missing)).all()})
+        if not candidates:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        results = []
+        for memory in candidates.values():
+            emb = memory.embedding
+            norm = np.linalg.norm(emb) if emb is not None and len(emb) else 0.0
+            sim = float(np.dot(emb, query) / (norm * query_norm)) if norm and query_norm else 0.0
+            if sim < threshold:
+                continue
+            results.append({"memory": memory, "similarity": sim, "bm25": bm25.get(memory.id)})
+
+        results.sort(key=lambda r: r["similarity"], reverse=True)
+        for dense_rank, r in enumerate(results):
+            score = 1.0 / (k + dense_rank + 1)
+            if r["memory"].id in lexical_rank:
+                score += 1.0 / (k + lexical_rank[r["memory"].id] + 1)
+            r["score"] = score
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:limit]
+
+    def _search_layer(self, model, query_text: str, embedding, limit: int, threshold: float):
+        if self._use_hybrid(model) and self._ensure_fts(model):
+            try:
+                return self._search_hybrid(model, query_text, embedding, limit, threshold)
+            except Exception as e:
+                logger.error(f"Hybrid search failed, using vector search: {e}")
+        return self._search_sqlite(model, embedding, limit, threshold)
+
+    # --- Embedding storage ---
+
+    def ensure_indexes(self):
+        """Create column indexes declared on the layer models that tables created earlier lack."""
+        for model in LAYER_MODELS.values():
+            for index in model.__table__.indexes:
+                try:
+                    index.create(bind=engine, checkfirst=True)
+                except Exception as e:
+                    logger.warning(f"Failed to create index {index.name}: {e}")
+
+    def migrate_embeddings(self, batch_size: int = 500) -> int:
+        """
+        Rewrite embeddings still stored as JSON text into the binary format, in
+        batches. Reads accept both formats, so this can run in the background.
+        Unreadable values are replaced by an empty vector. Returns the number
+        of rows rewritten.
+        """
+        if not self.is_sqlite:
+            return 0
+        from sqlalchemy import inspect
+        from server.core.database import Base
+        from server.core.memory.models import VectorType, encode_vector, decode_vector
+
+        converted = 0
+        existing = set(inspect(engine).get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = [c.name for c in table.columns if isinstance(c.type, VectorType)]
+            for column in columns:
+                while True:
+                    with engine.begin() as conn:
+                        rows = conn.execute(text(
+                            f"SELECT rowid, {column} FROM {table.name} WHERE typeof({column}) = 'text' LIMIT :n"
+                        ), {"n": batch_size}).all()
+                        if not rows:
+                            break
+                        updates = []
+                        for rowid, value in rows:
+                            try:
+                                blob = encode_vector(decode_vector(value), settings.embedding_storage_dtype)
+                            except (ValueError, TypeError):
+                                # Unreadable legacy value, cleared rather than retried forever. The columns
+                                # are NOT NULL, so it becomes an empty vector, which searches skip
+                                blob = encode_vector([], "float32")
+                            updates.append({"rowid": rowid, "value": blob})
+                        conn.execute(text(f"UPDATE {table.name} SET {column} = :value WHERE rowid = :rowid"), updates)
+                    converted += len(rows)
+        if converted:
+            logger.info(f"Migrated {converted} embeddings to binary storage")
+        return converted
+
+    def migrate_embeddings_async(self) -> threading.Thread:
+        def run():
+            try:
+                self.migrate_embeddings()
+            except Exception as e:
+                logger.error(f"Embedding migration failed: {e}")
+
+        thread = threading.Thread(target=run, name="embedding-migration", daemon=True)
+        thread.start()
+        return thread
+
+    def get_index_stats(self) -> dict:
+        return {
+            layer: self._indexes[model].get_stats() if model in self._indexes else None
+            for layer, model in LAYER_MODELS.items()
+        }
+
+    def _search_sqlite(self, model, query_embedding, limit, threshold=0.0, filters=None, time_range=None):
+        """
+        Vector search over one layer. `time_range` (start, end) in naive UTC
+        is served from the index's day buckets; any other `filters` are pushed
+        into a SQL query and the matching rows are scanned.
+        """
+        if not filters and self._use_index(model):
+            try:
+                return self._search_index(model, query_embedding, limit, threshold, time_range)
+            except Exception as e:
+                logger.error(f"ANN search failed, falling back to full scan: {e}")
+        if time_range is not None:
+            filters = list(filters or []) + self._time_filters(model, time_range)
+        return self._search_scan(model, query_embedding, limit, threshold, filters)
+
+    @staticmethod
+    def _time_filters(model, time_range):
+        start, end = time_range
+        filters = []
+        if start is not None:
+            filters.append(model.timestamp >= start)
+        if end is not None:
+            filters.append(model.timestamp < end)
+        return filters
+
+    def _search_index(self, model, query_embedding, limit, threshold=0.0, time_range=None):
+        epoch_range = None
+        if time_range is not None:
+            epoch_range = tuple(to_epoch(t) if t is not None else None for t in time_range)
+        hits = self._get_index(model).search(query_embedding, limit, threshold, epoch_range)
+        if not hits:
+            return []
         with SessionLocal() as db:
-            all_memories = db.query(model).all()
+            rows = {m.id: m for m in db.query(model).filter(model.id.in_([h[0] for h in hits])).all()}
+        # Rows deleted by another process since the index was built are skipped
+        return [{"memory": rows[id_], "similarity": sim} for id_, sim in hits if id_ in rows]
+
+    def _search_scan(self, model, query_embedding, limit, threshold=0.0, filters=None):
+        with SessionLocal() as db:
+            query = db.query(model)
+            if filters:
+                query = query.filter(*filters)
+            all_memories = query.all()
         
         if not all_memories:
             return []
 
         # Filter out empty embeddings
-        valid_memories = [m for m in all_memories if m.embedding]
+        valid_memories = [m for m in all_memories if m.embedding is not None and len(m.embedding)]
         if not valid_memories:
             return []
             
         try:
             # Vectorized calculation for performance
-            matrix = np.array([m.embedding for m in valid_memories]) # Shape (N, D)
+            matrix = np.stack([m.embedding for m in valid_memories]) # Shape (N, D)
             query = np.array(query_embedding) # Shape (D,)
             
             # Normalize
@@ -94,8 +600,9 @@ class VectorStore:
             return results[:limit]
 
     # Instinct Layer
-    def add_instinct(self, content: str, trait_type: str, strength: float = 1.0):
-        embedding = embedding_service.get_embedding(content)
+    def add_instinct(self, content: str, trait_type: str, strength: float = 1.0, embedding=None):
+        if embedding is None:
+            embedding = embedding_service.get_embedding(content)
         with SessionLocal() as db:
             memory = InstinctMemory(
                 content=content,
@@ -106,10 +613,12 @@ class VectorStore:
             db.add(memory)
             db.commit()
             db.refresh(memory)
-            return memory
+        self._index_add(type(memory), memory.id, embedding)
+        return memory
 
-    def search_instinct(self, query_text: str, limit: int = 5, threshold: float = 0.85):
-        embedding = embedding_service.get_embedding(query_text)
+    def search_instinct(self, query_text: str, limit: int = 5, threshold: float = 0.85, embedding=None):
+        if embedding is None:
+            embedding = embedding_service.get_embedding(query_text)
         
         if self.is_sqlite:
             return self._search_sqlite(InstinctMemory, embedding, limit, threshold)
@@ -129,8 +638,9 @@ class VectorStore:
                 return []
 
     # Subconscious Layer
-    def add_subconscious(self, content: str, keywords: str):
-        embedding = embedding_service.get_embedding(content)
+    def add_subconscious(self, content: str, keywords: str, embedding=None):
+        if embedding is None:
+            embedding = embedding_service.get_embedding(content)
         with SessionLocal() as db:
             memory = SubconsciousMemory(
                 content=content,
@@ -140,13 +650,15 @@ class VectorStore:
             db.add(memory)
             db.commit()
             db.refresh(memory)
-            return memory
+        self._index_add(type(memory), memory.id, embedding)
+        return memory
 
-    def search_subconscious(self, query_text: str, limit: int = 5, threshold: float = 0.7):
-        embedding = embedding_service.get_embedding(query_text)
+    def search_subconscious(self, query_text: str, limit: int = 5, threshold: float = 0.7, embedding=None):
+        if embedding is None:
+            embedding = embedding_service.get_embedding(query_text)
         
         if self.is_sqlite:
-            return self._search_sqlite(SubconsciousMemory, embedding, limit, threshold)
+            return self._search_layer(SubconsciousMemory, query_text, embedding, limit, threshold)
 
         with SessionLocal() as db:
             try:
@@ -163,8 +675,9 @@ class VectorStore:
                 return []
 
     # Active Recall Layer
-    def add_active_recall(self, content: str, role: str, context_metadata: dict = None):
-        embedding = embedding_service.get_embedding(content)
+    def add_active_recall(self, content: str, role: str, context_metadata: dict = None, embedding=None):
+        if embedding is None:
+            embedding = embedding_service.get_embedding(content)
         with SessionLocal() as db:
             memory = ActiveRecallMemory(
                 content=content,
@@ -175,29 +688,79 @@ class VectorStore:
             db.add(memory)
             db.commit()
             db.refresh(memory)
-            return memory
+        self._index_add(type(memory), memory.id, embedding, memory.timestamp)
+        return memory
 
-    def search_active_recall(self, query_text: str, limit: int = 5, time_range: dict = None):
-        embedding = embedding_service.get_embedding(query_text)
+    def search_active_recall(self, query_text: str, limit: int = 5, time_range: dict = None,
+                             role: str = None, metadata: dict = None, embedding=None):
+        """
+        Top-k active recall memories. `time_range` is {"start": ..., "end": ...}
+        (datetimes, ISO strings or epoch seconds, either side optional); `role`
+        and `metadata` (key -> value in context_metadata) narrow the rows in SQL.
+        """
+        if embedding is None:
+            embedding = embedding_service.get_embedding(query_text)
+        bounds = self._time_bounds(time_range)
+        filters = []
+        if role:
+            filters.append(ActiveRecallMemory.role == role)
+        for key, value in (metadata or {}).items():
+            filters.append(metadata_filter(ActiveRecallMemory.context_metadata, key, value, postgres=not self.is_sqlite))
         
         if self.is_sqlite:
             # Active recall usually doesn't need strict threshold for "search", just top-k
-            return self._search_sqlite(ActiveRecallMemory, embedding, limit, threshold=0.0)
+            if filters or bounds is not None:
+                results = self._search_sqlite(ActiveRecallMemory, embedding, limit, 0.0, filters, bounds)
+            else:
+                results = self._search_layer(ActiveRecallMemory, query_text, embedding, limit, threshold=0.0)
+            return self._merge_pending(results, embedding, limit, bounds, role, metadata)
 
         with SessionLocal() as db:
             try:
+                if bounds is not None:
+                    filters += self._time_filters(ActiveRecallMemory, bounds)
                 stmt = select(ActiveRecallMemory, ActiveRecallMemory.embedding.cosine_distance(embedding).label("distance")) \
+                    .filter(*filters) \
                     .order_by("distance") \
                     .limit(limit)
                 
-                # TODO: Add time range filter implementation
-                
                 results = db.execute(stmt).all()
-                return [{"memory": r[0], "similarity": 1 - r[1]} for r in results]
+                return self._merge_pending([{"memory": r[0], "similarity": 1 - r[1]} for r in results], embedding, limit, bounds, role, metadata)
             except Exception as e:
                 logger.error(f"Error searching active recall memory: {e}")
                 return []
 
+    @staticmethod
+    def _time_bounds(time_range: dict):
+        if not time_range:
+            return None
+        start, end = time_range.get("start"), time_range.get("end")
+        if start is None and end is None:
+            return None
+        return (
+            to_utc_naive(start) if start is not None else None,
+            to_utc_naive(end) if end is not None else None
+        )
+
+    def latest_active_timestamp(self, before=None):
+        """Timestamp of the newest active recall memory (older than `before`, if given)."""
+        with SessionLocal() as db:
+            query = db.query(func.max(ActiveRecallMemory.timestamp))
+            if before is not None:
+                query = query.filter(ActiveRecallMemory.timestamp < to_utc_naive(before))
+            return query.scalar()
+
+    def _merge_pending(self, results, embedding, limit, time_range=None, role=None, metadata=None):
+        # Messages still queued for ingestion are searchable before they are written
+        from server.core.memory.ingestion import active_recall_ingestor
+        pending = active_recall_ingestor.search_pending(embedding, limit, time_range=time_range, role=role, metadata=metadata)
+        if not pending:
+            return results
+        seen = {r["memory"].id for r in results}
+        merged = results + [r for r in pending if r["memory"].id not in seen]
+        merged.sort(key=lambda x: x["similarity"], reverse=True)
+        return merged[:limit]
+
     def delete_memory(self, layer_name: str, memory_id: int):
         with SessionLocal() as db:
             if layer_name == "instinct":
@@ -213,6 +776,7 @@ class VectorStore:
             if memory:
                 db.delete(memory)
                 db.commit()
+                self._index_remove(model, [memory_id])
                 return True
             return False
 
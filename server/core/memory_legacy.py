@@ -4,8 +4,13 @@ from pathlib import Path
 import base64
 import time
 import math
+import threading
+import re
+import shutil
+import uuid
 from typing import List, Dict, Any, Optional
-from collections import deque
+from collections import deque, defaultdict
+import numpy as np
 from abc import ABC, abstractmethod
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
@@ -67,6 +72,91 @@ class MemoryNode:
         node.access_count = data.get("access_count", 1)
         return node
 
+def tokenize(text: str) -> set:
+    return set(re.findall(r'\w+', text.lower()))
+
+class LTMIndex:
+    """
+    Columnar view of the long-term memory used for retrieval scoring.
+
+    Per-node scoring inputs (last access, timestamp, importance, access count,
+    decay rate, summed non-neutral emotion) live in NumPy arrays, row i
+    matching `nodes[i]`, and an inverted index maps each token to the rows
+    containing it. Nodes are tokenized once when added. `update` refreshes a
+    row after a node changes (e.g. `update_access`).
+    """
+
+    COLUMNS = ("last_accessed", "timestamp", "importance", "access_count", "decay_rate", "emotion")
+
+    def __init__(self, nodes: List[MemoryNode] = None):
+        self.nodes: List[MemoryNode] = []
+        self.rows: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.columns = {name: np.zeros(64) for name in self.COLUMNS}
+        for node in nodes or []:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, node: MemoryNode):
+        row = len(self.nodes)
+        if row == len(self.columns["timestamp"]):
+            # Grow geometrically so appends stay amortized O(1)
+            for name, column in self.columns.items():
+                self.columns[name] = np.concatenate([column, np.zeros(len(column))])
+        self.nodes.append(node)
+        self.rows[node.id] = row
+        for token in tokenize(node.content):
+            self.postings[token].append(row)
+        self.update(node)
+
+    def update(self, node: MemoryNode):
+        row = self.rows.get(node.id)
+        if row is None:
+            return
+        self.columns["last_accessed"][row] = node.last_accessed
+        self.columns["timestamp"][row] = node.timestamp
+        self.columns["importance"][row] = node.importance
+        self.columns["access_count"][row] = node.access_count
+        self.columns["decay_rate"][row] = node.decay_rate
+        self.columns["emotion"][row] = sum(v for k, v in node.emotion.items() if k != "neutral")
+
+    def top_k(self, query: str, limit: int, now: float, w_sem: float, w_rec: float,
+              w_pri: float, w_em: float, w_str: float) -> List[MemoryNode]:
+        """
+        Nodes with activation > 0.1, best first, at most `limit`. Equal scores
+        keep insertion order, as a stable sort of the nodes would.
+        """
+        n = len(self.nodes)
+        if n == 0 or limit <= 0:
+            return []
+        c = {name: column[:n] for name, column in self.columns.items()}
+
+        query_tokens = tokenize(query)
+        overlap = np.zeros(n)
+        for token in query_tokens:
+            rows = self.postings.get(token)
+            if rows:
+                overlap[rows] += 1
+        semantic = overlap / (len(query_tokens) + 1) if query_tokens else overlap
+
+        strength = c["importance"] * np.exp(-c["decay_rate"] * ((now - c["last_accessed"]) / 3600))
+        recency = np.maximum(0.0, 1.0 - ((now - c["timestamp"]) / (3600 * 48)))
+        primacy = 1.0 / (1.0 + c["access_count"])
+        activation = (strength * w_str) + (semantic * w_sem) + (recency * w_rec) + (primacy * w_pri) + c["emotion"] * w_em
+
+        candidates = np.flatnonzero(activation > 0.1)
+        if len(candidates) > limit:
+            scores = activation[candidates]
+            kth = scores[np.argpartition(-scores, limit - 1)[limit - 1]]
+            above = candidates[scores > kth]
+            ties = candidates[scores == kth][:limit - len(above)]
+            candidates = np.concatenate([above, ties])
+        # Highest activation first, lower row (older insertion) first among equals
+        order = np.lexsort((candidates, -activation[candidates]))
+        return [self.nodes[i] for i in candidates[order]]
+
 class MemoryStorage(ABC):
     @abstractmethod
     def load(self) -> List[MemoryNode]:
@@ -103,16 +193,19 @@ class JSONEncryptedStorage(MemoryStorage):
         ct = encryptor.update(padded_data) + encryptor.finalize()
         return base64.b64encode(iv + ct)
 
+    def _decrypt_raw(self, data: bytes) -> bytes:
+        raw = base64.b64decode(data)
+        iv = raw[:16]
+        ct = raw[16:]
+        cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=default_backend())
+        decryptor = cipher.decryptor()
+        padded_data = decryptor.update(ct) + decryptor.finalize()
+        unpadder = padding.PKCS7(128).unpadder()
+        return unpadder.update(padded_data) + unpadder.finalize()
+
     def _decrypt(self, data: bytes) -> bytes:
         try:
-            raw = base64.b64decode(data)
-            iv = raw[:16]
-            ct = raw[16:]
-            cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=default_backend())
-            decryptor = cipher.decryptor()
-            padded_data = decryptor.update(ct) + decryptor.finalize()
-            unpadder = padding.PKCS7(128).unpadder()
-            return unpadder.update(padded_data) + unpadder.finalize()
+            return self._decrypt_raw(data)
         except Exception as e:
             print(f"Decryption error: {e}")
             return b"[]"
@@ -140,15 +233,256 @@ class JSONEncryptedStorage(MemoryStorage):
         except Exception as e:
             print(f"Error saving LTM: {e}")
 
+class JournaledEncryptedStorage(JSONEncryptedStorage):
+    """
+    Append-only variant of the encrypted LTM store.
+
+    Every added or updated node is one encrypted record (a base64 line) appended
+    to a journal next to the snapshot, so recording a message costs one record
+    instead of re-encrypting all of memory. Records are flushed to the OS on
+    every append and fsynced in batches: after `fsync_batch` records or within
+    `fsync_interval` seconds. Once the journal holds `compact_records` records,
+    `needs_compaction` asks the owner for a `save`, which writes a new snapshot
+    (one record per node, replaced atomically).
+
+    `save` only holds the lock to copy the nodes and rotate the journal aside,
+    so appends carry on in a fresh journal while the snapshot is encrypted and
+    written. Each journal starts with a random id and the snapshot records the
+    id of the journal it covers, so a rotated journal left behind by a crash
+    is replayed only if the snapshot doesn't already include it.
+
+    Loading streams the snapshot and then replays the rotated and current
+    journals line by line. A torn last record from a crash is skipped; an
+    unreadable record anywhere else stops the load of that file with
+    `CorruptRecordError`, and a copy of the file is kept next to it, since the
+    next compaction would otherwise replace it. A snapshot in the older
+    single-blob format is still read, and the next compaction rewrites it.
+    """
+
+    SNAPSHOT_HEADER = b"#ltm-snapshot v1\n"
+    JOURNAL_HEADER = b"#ltm-journal "
+    COVERS_HEADER = b"#covers "
+
+    def __init__(self, file_path: str, key_path: str, fsync_batch: int = 32,
+                 fsync_interval: float = 1.0, compact_records: int = 1000):
+        super().__init__(file_path, key_path)
+        self.journal_path = str(Path(file_path).with_suffix(".journal"))
+        self.rotated_path = self.journal_path + ".old"
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_records = compact_records
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._journal = None
+        self._journal_records = 0
+        self._unsynced = 0
+        self._sync_timer = None
+
+    # --- Records ---
+
+    @staticmethod
+    def _serialize(record: Dict[str, Any]) -> bytes:
+        return json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+    def _encrypt_record(self, payload: bytes) -> bytes:
+        return self._encrypt(payload) + b"\n"
+
+    def _encode_record(self, record: Dict[str, Any]) -> bytes:
+        return self._encrypt_record(self._serialize(record))
+
+    def _read_records(self, path: str):
+        failed = None
+        with open(path, "rb") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith(b"#"):
+                    continue
+                if failed is not None:
+                    raise CorruptRecordError(f"Unreadable LTM record at line {failed[0]} of {os.path.basename(path)}: {failed[1]}")
+                try:
+                    record = json.loads(self._decrypt_raw(line).decode('utf-8'))
+                except Exception as e:
+                    failed = (number, e)
+                    continue
+                yield record
+        if failed is not None:
+            # Only the last record can be torn by a crash mid-append
+            print(f"Skipping torn last LTM record in {os.path.basename(path)}: {failed[1]}")
+
+    @staticmethod
+    def _header_value(path: str, prefix: bytes) -> Optional[str]:
+        """Value of the first `prefix` header line among the leading comment lines of `path`."""
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.startswith(b"#"):
+                    return None
+                if line.startswith(prefix):
+                    return line[len(prefix):].strip().decode('ascii')
+        return None
+
+    def _keep_corrupt_copy(self, path: str):
+        try:
+            shutil.copy2(path, path + ".corrupt")
+        except OSError as e:
+            print(f"Failed to keep a copy of {os.path.basename(path)}: {e}")
+
+    def load(self) -> List[MemoryNode]:
+        nodes: Dict[str, MemoryNode] = {}
+        covered = None
+        if os.path.exists(self.file_path):
+            try:
+                with open(self.file_path, "rb") as f:
+                    legacy = not f.read(len(self.SNAPSHOT_HEADER)).startswith(self.SNAPSHOT_HEADER)
+                if legacy:
+                    nodes = {n.id: n for n in super().load()}
+                else:
+                    covered = self._header_value(self.file_path, self.COVERS_HEADER)
+                    for record in self._read_records(self.file_path):
+                        node = MemoryNode.from_dict(record)
+                        nodes[node.id] = node
+            except CorruptRecordError as e:
+                print(f"Error loading LTM snapshot: {e}")
+                self._keep_corrupt_copy(self.file_path)
+            except Exception as e:
+                print(f"Error loading LTM snapshot: {e}")
+
+        records = 0
+        for path in (self.rotated_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            if covered is not None and self._header_value(path, self.JOURNAL_HEADER) == covered:
+                # A compaction wrote the snapshot but stopped before removing the rotated journal
+                if path == self.rotated_path:
+                    os.remove(path)
+                continue
+            try:
+                for record in self._read_records(path):
+                    records += 1
+                    node = MemoryNode.from_dict(record["node"])
+                    nodes[node.id] = node
+            except CorruptRecordError as e:
+                print(f"Error replaying LTM journal: {e}")
+                self._keep_corrupt_copy(path)
+            except Exception as e:
+                print(f"Error replaying LTM journal: {e}")
+        with self._lock:
+            self._journal_records = records
+        return list(nodes.values())
+
+    def append(self, nodes: List[MemoryNode]):
+        """Journal the current state of `nodes` (new or updated)."""
+        if not nodes:
+            return
+        data = b"".join(self._encode_record({"op": "put", "node": node.to_dict()}) for node in nodes)
+        self._append_bytes(data, len(nodes))
+
+    def _open_journal_locked(self):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        self._journal = open(self.journal_path, "ab")
+        if self._journal.tell() == 0:
+            self._journal.write(self.JOURNAL_HEADER + uuid.uuid4().hex.encode('ascii') + b"\n")
+
+    def _append_bytes(self, data: bytes, count: int):
+        with self._lock:
+            try:
+                if self._journal is None:
+                    self._open_journal_locked()
+                self._journal.write(data)
+                self._journal.flush()
+                self._journal_records += count
+                self._unsynced += count
+                if self._unsynced >= self.fsync_batch:
+                    self._sync_locked()
+                elif self._sync_timer is None:
+                    self._sync_timer = threading.Timer(self.fsync_interval, self.sync)
+                    self._sync_timer.daemon = True
+                    self._sync_timer.start()
+            except Exception as e:
+                print(f"Error appending to LTM journal: {e}")
+
+    def _sync_locked(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        if self._journal is not None and self._unsynced:
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+
+    def sync(self):
+        with self._lock:
+            try:
+                self._sync_locked()
+            except Exception as e:
+                print(f"Error syncing LTM journal: {e}")
+
+    def needs_compaction(self) -> bool:
+        return self._journal_records >= self.compact_records and not self._save_lock.locked()
+
+    def save(self, nodes: List[MemoryNode]):
+        """Compact: rotate the journal aside, write a fresh snapshot of `nodes`, then drop the rotated journal."""
+        with self._save_lock:
+            with self._lock:
+                # Appends wait only for this copy; later ones land in a new journal. Serializing
+                # here freezes each node's emotion and associations dicts, which request
+                # threads keep changing while the snapshot is encrypted below
+                payloads = [self._serialize(node.to_dict()) for node in list(nodes)]
+                covered = None
+                try:
+                    self._sync_locked()
+                    if self._journal is not None:
+                        self._journal.close()
+                        self._journal = None
+                    if os.path.exists(self.rotated_path) and os.path.exists(self.journal_path):
+                        # Left by a compaction that didn't finish; it isn't in the snapshot yet either
+                        with open(self.rotated_path, "ab") as rotated, open(self.journal_path, "rb") as journal:
+                            shutil.copyfileobj(journal, rotated)
+                        os.remove(self.journal_path)
+                    elif os.path.exists(self.journal_path):
+                        os.replace(self.journal_path, self.rotated_path)
+                    if os.path.exists(self.rotated_path):
+                        covered = self._header_value(self.rotated_path, self.JOURNAL_HEADER)
+                    self._journal_records = 0
+                except Exception as e:
+                    print(f"Error rotating LTM journal: {e}")
+                    return
+
+            try:
+                tmp_path = self.file_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(self.SNAPSHOT_HEADER)
+                    if covered:
+                        f.write(self.COVERS_HEADER + covered.encode('ascii') + b"\n")
+                    for payload in payloads:
+                        f.write(self._encrypt_record(payload))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.file_path)
+                # The snapshot now covers everything in the rotated journal
+                if os.path.exists(self.rotated_path):
+                    os.remove(self.rotated_path)
+            except Exception as e:
+                print(f"Error saving LTM: {e}")
+
+    def close(self):
+        with self._save_lock, self._lock:
+            try:
+                self._sync_locked()
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+            except Exception as e:
+                print(f"Error closing LTM journal: {e}")
+
+class CorruptRecordError(ValueError):
+    """An unreadable record that is not the last one of its file, so not a torn append."""
+
 class MemoryManager:
-    def __init__(self):
-        base_dir = Path(__file__).resolve().parent.parent
-        data_dir = base_dir / "data"
-        
-        # Storage Backend
-        self.ltm_file = str(data_dir / "long_term_memory.json")
-        self.key_file = str(data_dir / "secret.key")
-        self.storage = JSONEncryptedStorage(self.ltm_file, self.key_file)
+    def __init__(self, ltm_file: Optional[str] = None, key_file: Optional[str] = None, profile_path: Optional[str] = None):
+        # Storage Backend (paths default to settings, tools and tests pass scratch files)
+        self.ltm_file = ltm_file or settings.long_term_memory_path
+        self.key_file = key_file or settings.secret_key_path
+        self.profile_path = profile_path or settings.user_profile_path
+        self.storage = JournaledEncryptedStorage(self.ltm_file, self.key_file)
 
         # 1. Memory Layering
         # Short-term (Working) Memory: High fidelity, limited capacity
@@ -157,6 +491,9 @@ class MemoryManager:
         
         # Long-term Memory: Unlimited capacity, decay-based retrieval
         self.long_term_memory: List[MemoryNode] = self.storage.load()
+        self._ltm_ids = {node.id for node in self.long_term_memory}
+        self.ltm_index = LTMIndex(self.long_term_memory)
+        self._compaction: Optional[threading.Thread] = None
         
         # Legacy support (for API compatibility)
         self.history = deque(maxlen=20) 
@@ -185,6 +522,21 @@ class MemoryManager:
     def save_ltm(self):
         self.storage.save(self.long_term_memory)
 
+    def persist_nodes(self, nodes: List[MemoryNode]):
+        """Journal changes to LTM nodes, compacting into a snapshot in the background when the journal is long."""
+        nodes = [n for n in nodes if n.id in self._ltm_ids]
+        if not nodes:
+            return
+        self.storage.append(nodes)
+        if self.storage.needs_compaction() and not (self._compaction and self._compaction.is_alive()):
+            self._compaction = threading.Thread(target=self.save_ltm, name="ltm-compaction", daemon=True)
+            self._compaction.start()
+
+    def flush_ltm(self):
+        if self._compaction is not None:
+            self._compaction.join()
+        self.storage.close()
+
     def add_message(self, role: str, content: str):
         if self.is_paused:
             return
@@ -209,17 +561,20 @@ class MemoryManager:
         self.short_term_memory.append(node)
         self.history.append({"role": role, "content": content}) # Legacy
         
-        # 5. Verification & Consolidation
-        # Periodically move important STM items to LTM
-        self.consolidate_memory(node)
-        
         # 4. Associative Linking
         # Link to recent nodes in STM
+        changed = [node]
         if len(self.short_term_memory) > 1:
             prev_node = self.short_term_memory[-2]
             # Heuristic link strength based on temporal proximity
             node.associations[prev_node.id] = 0.8
             prev_node.associations[node.id] = 0.8
+            changed.append(prev_node)
+
+        # 5. Verification & Consolidation
+        # Periodically move important STM items to LTM
+        self.consolidate_memory(node)
+        self.persist_nodes(changed)
 
     def consolidate_memory(self, node: MemoryNode):
         """
@@ -228,54 +583,33 @@ class MemoryManager:
         # Threshold for consolidation
         if node.importance > 0.3: 
             self.long_term_memory.append(node)
-            self.save_ltm()
+            self._ltm_ids.add(node.id)
+            self.ltm_index.add(node)
 
     def retrieve(self, query: str, limit: int = 5) -> List[MemoryNode]:
         """
         Hybrid retrieval using configurable weights: Semantic, Recency, Primacy, Emotion, Strength
         """
-        candidates = []
-        
-        # Simple Keyword/Semantic Matching (Simulated)
-        import re
-        query_tokens = set(re.findall(r'\w+', query.lower()))
-        
-        current_time = time.time()
+        # Activation = strength (forgetting curve) + keyword overlap + recency + primacy + emotion,
+        # scored over all nodes at once from the columnar index
+        if len(self.ltm_index) != len(self.long_term_memory):
+            self.ltm_index = LTMIndex(self.long_term_memory)
+
         weights = self.user_profile.get("preferences", {})
-        w_sem = float(weights.get("semantic_weight", 0.6))
-        w_rec = float(weights.get("recency_weight", 0.3))
-        w_pri = float(weights.get("primacy_weight", 0.2))
-        w_em = float(weights.get("emotion_weight", 0.2))
-        w_str = 0.3
-        
-        for node in self.long_term_memory:
-            # 1. Activation based on Recency & Decay (Forgetting Curve)
-            strength = node.get_current_strength()
-            
-            # 2. Semantic Match
-            node_tokens = set(re.findall(r'\w+', node.content.lower()))
-            overlap = len(query_tokens.intersection(node_tokens))
-            semantic_score = overlap / (len(query_tokens) + 1) if query_tokens else 0
-            
-            # 3. Emotional Weighting
-            # Emotional memories are recalled easier
-            emotion_boost = sum(v for k,v in node.emotion.items() if k != "neutral") * w_em
-            recency = max(0.0, 1.0 - ((current_time - node.timestamp) / (3600 * 48)))
-            primacy = 1.0 / (1.0 + node.access_count)
-            
-            # Total Activation Score
-            activation = (strength * w_str) + (semantic_score * w_sem) + (recency * w_rec) + (primacy * w_pri) + emotion_boost
-            
-            if activation > 0.1:
-                candidates.append((activation, node))
-                
-        # Sort by activation
-        candidates.sort(key=lambda x: x[0], reverse=True)
+        results = self.ltm_index.top_k(
+            query, limit, time.time(),
+            w_sem=float(weights.get("semantic_weight", 0.6)),
+            w_rec=float(weights.get("recency_weight", 0.3)),
+            w_pri=float(weights.get("primacy_weight", 0.2)),
+            w_em=float(weights.get("emotion_weight", 0.2)),
+            w_str=0.3
+        )
         
         # 6. Neuroplasticity: Update access for retrieved items
-        results = [node for _, node in candidates[:limit]]
         for node in results:
             node.update_access()
+            self.ltm_index.update(node)
+        self.persist_nodes(results)
             
         return results
 
@@ -300,9 +634,9 @@ class MemoryManager:
         self.short_term_memory.clear()
 
     def load_profile(self):
-        if os.path.exists(settings.user_profile_path):
+        if os.path.exists(self.profile_path):
             try:
-                with open(settings.user_profile_path, "rb") as f:
+                with open(self.profile_path, "rb") as f:
                     encrypted_data = f.read()
                 
                 # Check if it's JSON (migration) or Encrypted
@@ -353,10 +687,10 @@ class MemoryManager:
                         self.user_profile[k][sub_k] = sub_v
 
     def save_profile(self):
-        os.makedirs(os.path.dirname(settings.user_profile_path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.profile_path), exist_ok=True)
         json_bytes = json.dumps(self.user_profile, ensure_ascii=False).encode('utf-8')
         encrypted_data = self._encrypt(json_bytes)
-        with open(settings.user_profile_path, "wb") as f:
+        with open(self.profile_path, "wb") as f:
             f.write(encrypted_data)
 
     def update_profile(self, key: str, value: Any):
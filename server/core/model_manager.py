@@ -10,6 +10,8 @@ from typing import List, Dict, Optional
 from pathlib import Path
 from .config import settings
 from .llm import llm_engine
+from .llm_pool import llm_pool
+from .llm_tuner import llm_tuner
 
 logger = logging.getLogger(__name__)
 
@@ -36,13 +38,20 @@ class ModelManager:
                 if filename.endswith(".gguf"):
                     files.append(os.path.join(root, filename))
                     
+        resident = {os.path.abspath(p) for p in llm_pool.resident_paths()}
+        tuning = llm_tuner.load_results()
         models = []
         for f in files:
+            tuned = llm_tuner.get_result(f, tuning)
             models.append({
                 "name": os.path.basename(f),
                 "path": f,
                 "size_mb": round(os.path.getsize(f) / (1024*1024), 2),
-                "status": "ready"
+                "status": "ready",
+                "loaded": os.path.abspath(f) in resident,
+                # Expected throughput on this host, from the last tuning run
+                "expected_tokens_per_sec": tuned["best"]["gen_tps"] if tuned else None,
+                "expected_prompt_tokens_per_sec": tuned["best"]["prompt_tps"] if tuned else None
             })
         return models
 
@@ -93,7 +102,7 @@ class ModelManager:
         settings.model_path = target_path
         settings.save()
         
-        # Trigger reload
+        # Load in the background; the current model keeps serving until the swap
         try:
             llm_engine.reload_model()
             return True
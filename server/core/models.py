@@ -1,7 +1,8 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, DateTime, Text, ForeignKey
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from server.core.database import Base
+from server.core.memory.models import VectorType
 import uuid
 
 def generate_uuid():
@@ -55,3 +56,16 @@ class WorkflowState(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    scope_hash = Column(String, index=True)  # Hash of prompt template + persona + model + previous reply
+    query = Column(Text)  # Normalized user turn
+    embedding = Column(VectorType)
+    response = Column(Text)
+    generation_seconds = Column(Float, default=0.0)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,3 +1,4 @@
+import asyncio
 import psutil
 import time
 import logging
@@ -8,6 +9,18 @@ from typing import Dict, List, Any
 from dataclasses import dataclass, asdict
 from .config import settings
 from .llm import llm_engine
+from .llm_scheduler import llm_scheduler
+from .llm_pool import llm_pool
+from .turn_classifier import turn_classifier
+from .response_cache import response_cache
+from .context_budget import context_assembler
+from .memory.embedding import embedding_service
+from .memory.vector_store import vector_store
+from .memory.ingestion import active_recall_ingestor
+from .memory.consolidation import memory_consolidator
+from .memory.trigger import memory_trigger
+from .framework.bus import message_bus
+from .framework.events import Event
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -36,12 +49,16 @@ class MonitorHub:
             try:
                 stats = monitor.get_system_stats()
                 model_info = monitor.get_model_info()
+                llm_stats = monitor.get_llm_stats()
+                memory_stats = monitor.get_memory_stats()
                 
                 msg = {
                     "type": "system_stats",
                     "data": {
                         "system": stats,
                         "model": model_info,
+                        "llm": llm_stats,
+                        "memory": memory_stats,
                         "timestamp": datetime.datetime.now().isoformat()
                     }
                 }
@@ -160,10 +177,33 @@ class Monitor:
         status = getattr(llm_engine, "status", "unknown")
         return {
             "status": status,
+            "swapping": getattr(llm_engine, "swapping", False),
+            "error": getattr(llm_engine, "last_error", None),
             "model_name": settings.model_path.split("/")[-1] if settings.model_path else "Unknown",
             "context_window": settings.n_ctx
         }
 
+    def get_llm_stats(self):
+        cache = getattr(llm_engine, "prompt_cache", None)
+        return {
+            "scheduler": llm_scheduler.get_stats(),
+            "pool": llm_pool.get_stats(),
+            "turn_classifier": turn_classifier.get_stats(),
+            "response_cache": response_cache.get_stats(),
+            "context": context_assembler.get_stats(),
+            "speculative": [e.get_speculative_stats() for e in llm_pool.engines() if e.model is not None],
+            "prompt_cache": cache.get_stats() if cache else None
+        }
+
+    def get_memory_stats(self):
+        return {
+            "embeddings": embedding_service.get_stats(),
+            "ann_index": vector_store.get_index_stats(),
+            "ingestion": active_recall_ingestor.get_stats(),
+            "consolidation": memory_consolidator.get_status(),
+            "layers": memory_trigger.get_stats()
+        }
+
     def get_clients(self):
         return client_manager.clients
     def get_settings_summary(self):
@@ -1,11 +1,21 @@
 import logging
-import json
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
 from .memory import memory_manager
 
 logger = logging.getLogger(__name__)
 
+PERSONA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "interests": {"type": "array", "maxItems": 10, "items": {"type": "string", "maxLength": 32}},
+        "communication_style": {"enum": ["formal", "casual", "terse", "verbose"]},
+        "traits": {"type": "object", "maxProperties": 8, "additionalProperties": {"type": "number"}}
+    },
+    "required": ["interests", "communication_style", "traits"],
+    "additionalProperties": False
+}
+
 class PersonaModel(BaseModel):
     traits: Dict[str, float] = Field(default_factory=dict)  # e.g., {"openness": 0.8}
     interests: List[str] = Field(default_factory=list)
@@ -33,6 +43,7 @@ class PersonaManager:
         Analyzes LTM to extract persona traits using LLM.
         """
         from .llm import llm_engine
+        from .llm_scheduler import llm_scheduler, Priority
         
         ltm = memory_manager.long_term_memory
         if not ltm:
@@ -60,15 +71,11 @@ class PersonaManager:
         """
         
         try:
-            response = llm_engine.generate_completion([{"role": "user", "content": prompt}])
-            
-            # Simple parsing of JSON from response (handling potential markdown code blocks)
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0]
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0]
-                
-            data = json.loads(response.strip())
+            data = llm_scheduler.run_sync(
+                llm_engine.generate_json, [{"role": "user", "content": prompt}], schema=PERSONA_SCHEMA, priority=Priority.BACKGROUND
+            )
+            if not isinstance(data, dict):
+                raise ValueError("No valid JSON in model output")
             
             self.current_persona.interests = data.get("interests", [])
             self.current_persona.communication_style = data.get("communication_style", "formal")
@@ -0,0 +1,160 @@
+import re
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from sqlalchemy import select
+
+from .config import settings
+from .database import SessionLocal
+from .models import ResponseCacheEntry
+from .memory.embedding import embedding_service
+from .memory.vector_store import vector_store
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """
+    Opt-in semantic cache of complete assistant responses (`enable_response_cache`).
+
+    An entry is keyed on the embedding of the normalized user turn and is only
+    reused within the same scope: a hash of the system prompt (prompt template
+    plus persona), the model that produced it and the assistant reply the turn
+    follows. The last part keeps context-dependent turns ("yes", "tell me
+    more") from picking up answers given in another conversation. A lookup hits when the cosine
+    similarity to a stored turn reaches `response_cache_threshold` and the entry
+    is younger than `response_cache_ttl_seconds`. Entries live in the
+    `response_cache` table and are trimmed least-recently-used to
+    `response_cache_max_entries`.
+
+    Callers must bypass the cache for turns that carry search results or
+    recalled memories, because the answer then depends on more than the turn text.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.enable_response_cache
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = re.sub(r"\s+", " ", text.strip().lower())
+        return text.rstrip("?!.,;:。？！ ")
+
+    @staticmethod
+    def scope_hash(system_prompt: str, model_path: str, previous_reply: str = "") -> str:
+        previous = hashlib.sha1(previous_reply.encode("utf-8")).hexdigest()
+        return hashlib.sha1(f"{model_path}\n{previous}\n{system_prompt}".encode("utf-8")).hexdigest()
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=settings.response_cache_ttl_seconds)
+
+    def lookup(self, user_input: str, system_prompt: str, model_path: str, previous_reply: str = "") -> Optional[str]:
+        """Return a cached response for an equivalent turn, or None."""
+        query = self.normalize(user_input)
+        if not query:
+            return None
+        scope = self.scope_hash(system_prompt, model_path, previous_reply)
+
+        try:
+            embedding = embedding_service.get_embedding(query)
+            if not any(embedding):
+                return None
+
+            filters = [ResponseCacheEntry.scope_hash == scope, ResponseCacheEntry.created_at >= self._cutoff()]
+            if vector_store.is_sqlite:
+                results = vector_store._search_sqlite(
+                    ResponseCacheEntry, embedding, 1, threshold=settings.response_cache_threshold, filters=filters
+                )
+                match = results[0]["memory"] if results else None
+            else:
+                with SessionLocal() as db:
+                    distance = ResponseCacheEntry.embedding.cosine_distance(embedding)
+                    stmt = select(ResponseCacheEntry).filter(*filters) \
+                        .filter(distance <= 1 - settings.response_cache_threshold) \
+                        .order_by(distance) \
+                        .limit(1)
+                    match = db.execute(stmt).scalars().first()
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+
+        if match is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with SessionLocal() as db:
+            entry = db.get(ResponseCacheEntry, match.id)
+            if entry is not None:
+                entry.hit_count = (entry.hit_count or 0) + 1
+                entry.last_used_at = datetime.utcnow()
+                db.commit()
+
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += match.generation_seconds or 0.0
+        return match.response
+
+    def store(self, user_input: str, system_prompt: str, model_path: str, response: str, generation_seconds: float,
+              previous_reply: str = ""):
+        query = self.normalize(user_input)
+        if not query or not response:
+            return
+
+        try:
+            embedding = embedding_service.get_embedding(query)
+            if not any(embedding):
+                return
+            with SessionLocal() as db:
+                db.add(ResponseCacheEntry(
+                    scope_hash=self.scope_hash(system_prompt, model_path, previous_reply),
+                    query=query,
+                    embedding=embedding,
+                    response=response,
+                    generation_seconds=generation_seconds
+                ))
+                db.query(ResponseCacheEntry).filter(ResponseCacheEntry.created_at < self._cutoff()).delete()
+                db.commit()
+
+                overflow = db.query(ResponseCacheEntry).count() - settings.response_cache_max_entries
+                if overflow > 0:
+                    stale = db.query(ResponseCacheEntry.id) \
+                        .order_by(ResponseCacheEntry.last_used_at.asc()) \
+                        .limit(overflow)
+                    db.query(ResponseCacheEntry).filter(ResponseCacheEntry.id.in_(stale.scalar_subquery())) \
+                        .delete(synchronize_session=False)
+                    db.commit()
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+            return
+
+        with self._lock:
+            self.stores += 1
+
+    def clear(self):
+        with SessionLocal() as db:
+            db.query(ResponseCacheEntry).delete()
+            db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 1)
+            }
+
+response_cache = ResponseCache()
@@ -1,7 +1,5 @@
 import logging
 import time
-import json
-import re
 from typing import Optional, Dict, List, Any
 from .search import search_engine
 
@@ -21,30 +19,19 @@ class AISearchArchitect:
     def analyze_intent(self, query: str) -> Dict[str, Any]:
         """
         Layer 1: Local Intent Recognition
-        Uses Hybrid approach: Heuristic (Fast) -> LLM (Deep)
+        Uses the single-pass turn classifier: Heuristic -> Embedding kNN -> one LLM call
+        The result also carries `is_recall`, which the memory trigger reuses.
         """
-        # 1. Fast Heuristic Check
-        heuristic_result = self._analyze_heuristic(query)
-        if heuristic_result["needs_search"] and heuristic_result["search_type"] in ["realtime", "explicit"]:
-            return heuristic_result
-            
-        # 2. LLM Deep Analysis (for ambiguous or complex queries)
-        # Only if heuristics didn't trigger a "definite yes", but we suspect it might need one
-        # Or if we want to parse complex search operators.
-        # For performance, we skip LLM if heuristic says NO and query is simple.
-        # But per requirements "Local model responsible for intent recognition", we should try to use it.
-        
         try:
-            # Import here to avoid circular dependency at module level
-            from .llm import llm_engine
-            if llm_engine.status == "ready":
-                return self._analyze_with_llm(query, llm_engine)
+            from .turn_classifier import turn_classifier
+            return turn_classifier.classify(query)
         except Exception as e:
-            logger.warning(f"LLM Intent Analysis failed: {e}")
-            
-        return heuristic_result
+            logger.warning(f"Turn classification failed: {e}")
+
+        return self._analyze_heuristic(query)
 
-    def _analyze_heuristic(self, query: str) -> Dict[str, Any]:
+    @staticmethod
+    def _analyze_heuristic(query: str) -> Dict[str, Any]:
         query_lower = query.lower()
         triggers_realtime = ["news", "latest", "current", "today", "now", "price", "stock", "weather", "forecast", "schedule", "when is", "what time"]
         if any(t in query_lower for t in triggers_realtime):
@@ -59,46 +46,6 @@ class AISearchArchitect:
 
         return {"needs_search": False, "search_type": "none", "keywords": ""}
 
-    def _analyze_with_llm(self, query: str, llm) -> Dict[str, Any]:
-        """
-        Ask LLM to classify intent and generate search keywords.
-        """
-        prompt = f"""
-Analyze the following user query and determine if it requires an internet search to answer.
-Query: "{query}"
-
-Respond ONLY with a JSON object in this format:
-{{
-    "needs_search": true/false,
-    "search_type": "realtime" | "factual" | "none",
-    "search_query": "optimized search keywords or operators"
-}}
-
-Rules:
-- "realtime": Weather, stocks, news, current events (2024-2025).
-- "factual": Specific entities, definitions not in general knowledge.
-- "none": Greetings, logic, coding, general knowledge.
-- If unsure, set needs_search to false.
-"""
-        try:
-            # Generate response (using a separate call, not streaming)
-            response_text = llm.generate_response(query, prompt)
-            
-            # Extract JSON
-            match = re.search(r"\{.*\}", response_text, re.DOTALL)
-            if match:
-                data = json.loads(match.group(0))
-                return {
-                    "needs_search": data.get("needs_search", False),
-                    "search_type": data.get("search_type", "none"),
-                    "keywords": data.get("search_query", query)
-                }
-        except Exception as e:
-            logger.error(f"Error parsing LLM intent: {e}")
-            
-        # Fallback to heuristic if LLM fails
-        return self._analyze_heuristic(query)
-
     def execute_search(self, query: str) -> Dict[str, Any]:
         """
         Layer 2: Networking
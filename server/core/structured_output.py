@@ -0,0 +1,111 @@
+import re
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    from llama_cpp import LlamaGrammar
+    from llama_cpp.llama_grammar import json_schema_to_gbnf
+except ImportError:
+    LlamaGrammar = None
+    json_schema_to_gbnf = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for a structured generation, same as free-form completions
+MAX_STRUCTURED_TOKENS = 2048
+# Defaults when a schema leaves a size open
+DEFAULT_STRING_CHARS = 64
+DEFAULT_ARRAY_ITEMS = 8
+DEFAULT_OBJECT_PROPERTIES = 8
+# Token cost of a string of n characters; CJK text runs close to one token per char
+TOKENS_PER_CHAR = 0.75
+
+# GBNF source per schema; the schema conversion is the expensive part
+_grammar_sources: Dict[str, str] = {}
+_grammar_lock = threading.Lock()
+
+def get_grammar(schema: Optional[dict] = None, gbnf: Optional[str] = None):
+    """
+    Build a llama.cpp grammar from a JSON schema or a GBNF string. The GBNF
+    for a schema is converted once and cached, but every call gets its own
+    LlamaGrammar: it carries parser state and must not be shared between
+    generations running on different engines. Returns None when grammars
+    are unavailable, callers then generate freely and rely on `parse_json`.
+    """
+    if LlamaGrammar is None or (schema is None and gbnf is None):
+        return None
+
+    key = gbnf if gbnf is not None else json.dumps(schema, sort_keys=True)
+    with _grammar_lock:
+        source = _grammar_sources.get(key)
+    try:
+        if source is None:
+            source = gbnf if gbnf is not None else json_schema_to_gbnf(json.dumps(schema))
+            grammar = LlamaGrammar.from_string(source, verbose=False)
+            with _grammar_lock:
+                _grammar_sources[key] = source
+            return grammar
+        return LlamaGrammar.from_string(source, verbose=False)
+    except Exception as e:
+        logger.warning(f"Failed to build grammar, generating unconstrained: {e}")
+        return None
+
+def _string_tokens(n_chars: int) -> int:
+    return int(n_chars * TOKENS_PER_CHAR) + 2
+
+def schema_max_tokens(schema: dict) -> int:
+    """
+    Upper estimate of the tokens needed to emit a document matching `schema`.
+    Strings should carry `maxLength` and arrays `maxItems`, otherwise defaults apply.
+    """
+    if "enum" in schema:
+        return max(_string_tokens(len(json.dumps(v, ensure_ascii=False))) for v in schema["enum"])
+
+    kind = schema.get("type")
+    if kind == "boolean" or kind == "null":
+        return 2
+    if kind in ("integer", "number"):
+        return 8
+    if kind == "string":
+        return _string_tokens(schema.get("maxLength", DEFAULT_STRING_CHARS))
+    if kind == "array":
+        items = schema.get("items", {"type": "string"})
+        return 2 + schema.get("maxItems", DEFAULT_ARRAY_ITEMS) * (schema_max_tokens(items) + 1)
+    if kind == "object":
+        total = 2
+        for name, prop in schema.get("properties", {}).items():
+            total += _string_tokens(len(name)) + 1 + schema_max_tokens(prop)
+        extra = schema.get("additionalProperties")
+        if isinstance(extra, dict):
+            key_tokens = _string_tokens(DEFAULT_STRING_CHARS // 2)
+            total += schema.get("maxProperties", DEFAULT_OBJECT_PROPERTIES) * (key_tokens + 1 + schema_max_tokens(extra))
+        return total
+    return _string_tokens(DEFAULT_STRING_CHARS)
+
+def max_tokens_for(schema: Optional[dict]) -> int:
+    if not schema:
+        return MAX_STRUCTURED_TOKENS
+    # Whitespace between tokens is free for the grammar, leave some slack for it
+    return min(MAX_STRUCTURED_TOKENS, int(schema_max_tokens(schema) * 1.1) + 16)
+
+def parse_json(text: str) -> Optional[Any]:
+    """Parse a JSON document out of model output, tolerating code fences and surrounding prose."""
+    if not text:
+        return None
+    text = text.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```(json)?", "", text)
+        text = re.sub(r"```$", "", text).strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    match = re.search(r"(\{.*\}|\[.*\])", text, re.DOTALL)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except ValueError:
+            pass
+    return None
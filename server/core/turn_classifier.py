@@ -0,0 +1,267 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# (text, search_type, is_recall) exemplars for the nearest-neighbour vote.
+# search_type is one of: realtime, factual, explicit, none
+EXEMPLARS = [
+    ("What's the weather like in Berlin tomorrow?", "realtime", False),
+    ("Latest news about the election", "realtime", False),
+    ("How much is Bitcoin worth right now?", "realtime", False),
+    ("What is the Tesla stock price today?", "realtime", False),
+    ("When does the next SpaceX launch happen?", "realtime", False),
+    ("Who won the football match last night?", "realtime", False),
+    ("Is the subway running on schedule today?", "realtime", False),
+    ("今天北京的天气怎么样", "realtime", False),
+    ("最新的科技新闻", "realtime", False),
+    ("Who is the CEO of Nvidia?", "factual", False),
+    ("What is the population of Brazil?", "factual", False),
+    ("Define quantum entanglement", "factual", False),
+    ("Explain the history of the Roman Empire", "factual", False),
+    ("Who wrote One Hundred Years of Solitude?", "factual", False),
+    ("What is the capital of Australia?", "factual", False),
+    ("谁是爱因斯坦", "factual", False),
+    ("Search the web for llama.cpp benchmarks", "explicit", False),
+    ("Google how to fix a leaking tap", "explicit", False),
+    ("Look up reviews of the new Pixel phone", "explicit", False),
+    ("Find articles about CRISPR on the internet", "explicit", False),
+    ("帮我搜索一下最近的电影", "explicit", False),
+    ("Hello Eliza, how are you?", "none", False),
+    ("Good morning!", "none", False),
+    ("Thanks, that helped a lot", "none", False),
+    ("Write a Python function that reverses a list", "none", False),
+    ("Help me debug this segmentation fault", "none", False),
+    ("Tell me a joke", "none", False),
+    ("What is 17 times 23?", "none", False),
+    ("Let's plan my workout for this week", "none", False),
+    ("你好", "none", False),
+    ("谢谢你的帮助", "none", False),
+    ("What did I tell you about my sister?", "none", True),
+    ("Do you remember what we talked about last time?", "none", True),
+    ("What was the name of the restaurant I mentioned?", "none", True),
+    ("Remind me what I said about my project deadline", "none", True),
+    ("Earlier you suggested a book, which one was it?", "none", True),
+    ("Have I told you my favourite color before?", "none", True),
+    ("What were we discussing yesterday?", "none", True),
+    ("你还记得我昨天说了什么吗", "none", True),
+    ("我之前提到过的那个项目叫什么", "none", True),
+]
+
+RECALL_PATTERNS = re.compile(
+    r"remember|recall|what did i say|history|last time|yesterday|before|mentioned|记得|之前|上次|昨天",
+    re.IGNORECASE
+)
+
+CLASSIFIER_PROMPT = """
+Classify the user's message. Respond with a JSON object:
+{"needs_search": true/false, "search_type": "realtime" | "factual" | "none", "search_query": "optimized search keywords", "is_recall": true/false}
+
+Rules:
+- "realtime": Weather, stocks, news, current events.
+- "factual": Specific entities, definitions not in general knowledge.
+- "none": Greetings, logic, coding, general knowledge.
+- is_recall: the user asks about a past conversation, memory or something they said before.
+- If unsure, set needs_search to false.
+"""
+
+CLASSIFIER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "needs_search": {"type": "boolean"},
+        "search_type": {"enum": ["realtime", "factual", "none"]},
+        "search_query": {"type": "string", "maxLength": 80},
+        "is_recall": {"type": "boolean"}
+    },
+    "required": ["needs_search", "search_type", "search_query", "is_recall"],
+    "additionalProperties": False
+}
+
+class TurnClassifier:
+    """
+    Decides in one pass whether a chat turn needs a web search (and which kind)
+    and whether it asks to recall past conversation.
+
+    Order of evaluation:
+    1. Keyword heuristics for definite cases (realtime/explicit search, recall words).
+    2. Weighted k-nearest-neighbour vote over embedded labelled exemplars.
+    3. Only if the vote is not confident, one LLM call without chat history
+       that answers every field at once.
+    Results are memoised per text, so the search layer and the memory trigger
+    share one classification within a turn.
+    """
+
+    def __init__(self, k: int = None, min_confidence: float = None):
+        self.k = k or settings.turn_classifier_k
+        self.min_confidence = min_confidence if min_confidence is not None else settings.turn_classifier_min_confidence
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_built = False
+        self._lock = threading.Lock()
+        self._memo: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._memo_size = 64
+        self._inflight: Dict[str, threading.Event] = {}
+        self.stats = {"heuristic": 0, "knn": 0, "llm": 0, "llm_calls": 0, "memo_hits": 0}
+
+    # --- Stages ---
+
+    def _heuristic(self, text: str) -> Dict[str, Any]:
+        # The search layer's keyword rules, plus the recall keywords
+        from .search_engine import AISearchArchitect
+        result = dict(AISearchArchitect._analyze_heuristic(text))
+        result["is_recall"] = bool(RECALL_PATTERNS.search(text))
+        return result
+
+    def _exemplar_matrix(self) -> Optional[np.ndarray]:
+        if not self._matrix_built:
+            with self._lock:
+                if not self._matrix_built:
+                    from .memory.embedding import embedding_service
+                    vectors = np.array(embedding_service.get_embeddings([t for t, _, _ in EXEMPLARS]), dtype=np.float32)
+                    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                    # Zero vectors mean the embedding provider is unavailable; skip kNN then
+                    if np.all(norms > 0):
+                        self._matrix = vectors / norms
+                    self._matrix_built = True
+        return self._matrix
+
+    def _knn(self, text: str) -> Optional[Dict[str, Any]]:
+        matrix = self._exemplar_matrix()
+        if matrix is None:
+            return None
+
+        from .memory.embedding import embedding_service
+        query = np.asarray(embedding_service.get_embedding(text), dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+
+        sims = matrix @ (query / norm)
+        k = min(self.k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        weights = np.clip(sims[top], 0.0, None)
+        total = float(weights.sum())
+        if total <= 0:
+            return None
+
+        type_votes: Dict[str, float] = {}
+        recall_vote = 0.0
+        for idx, w in zip(top, weights):
+            _, search_type, is_recall = EXEMPLARS[idx]
+            type_votes[search_type] = type_votes.get(search_type, 0.0) + float(w)
+            if is_recall:
+                recall_vote += float(w)
+
+        search_type = max(type_votes, key=type_votes.get)
+        type_conf = type_votes[search_type] / total
+        recall_share = recall_vote / total
+        return {
+            "needs_search": search_type != "none",
+            "search_type": search_type,
+            "keywords": text if search_type != "none" else "",
+            "is_recall": recall_share >= 0.5,
+            "confidence": min(type_conf, max(recall_share, 1 - recall_share))
+        }
+
+    def _llm(self, text: str) -> Optional[Dict[str, Any]]:
+        from .llm import llm_engine
+        from .llm_scheduler import llm_scheduler, Priority
+
+        if llm_engine.status != "ready":
+            return None
+        with self._lock:
+            self.stats["llm_calls"] += 1
+        messages = [
+            {"role": "system", "content": CLASSIFIER_PROMPT},
+            {"role": "user", "content": text}
+        ]
+        try:
+            data = llm_scheduler.run_sync(
+                llm_engine.generate_json, messages, schema=CLASSIFIER_SCHEMA, priority=Priority.CLASSIFICATION
+            )
+        except Exception as e:
+            logger.warning(f"LLM turn classification failed: {e}")
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        search_type = data.get("search_type", "none")
+        needs_search = bool(data.get("needs_search", False))
+        return {
+            "needs_search": needs_search,
+            "search_type": search_type if needs_search else "none",
+            "keywords": (data.get("search_query") or text) if needs_search else "",
+            "is_recall": bool(data.get("is_recall", False))
+        }
+
+    # --- Public API ---
+
+    def classify(self, text: str, use_llm: bool = None) -> Dict[str, Any]:
+        """Returns {needs_search, search_type, keywords, is_recall, source}."""
+        if use_llm is None:
+            use_llm = settings.turn_classifier_llm_fallback
+
+        while True:
+            with self._lock:
+                cached = self._memo.get(text)
+                if cached is not None:
+                    self._memo.move_to_end(text)
+                    self.stats["memo_hits"] += 1
+                    return dict(cached)
+                pending = self._inflight.get(text)
+                if pending is None:
+                    # The search layer and the memory trigger classify the same turn
+                    # concurrently; the second caller waits for the first
+                    self._inflight[text] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            return dict(self._classify(text, use_llm))
+        finally:
+            with self._lock:
+                self._inflight.pop(text).set()
+
+    def _classify(self, text: str, use_llm: bool) -> Dict[str, Any]:
+        result = self._heuristic(text)
+        source = "heuristic"
+        definite = result["needs_search"] and result["search_type"] in ["realtime", "explicit"]
+
+        if not definite:
+            knn = None
+            try:
+                knn = self._knn(text)
+            except Exception as e:
+                logger.warning(f"Embedding turn classification failed: {e}")
+
+            if knn and knn["confidence"] >= self.min_confidence:
+                # Recall keywords are precise, keep them even if the vote disagrees
+                knn["is_recall"] = knn["is_recall"] or result["is_recall"]
+                result, source = knn, "knn"
+            elif use_llm:
+                llm_result = self._llm(text)
+                if llm_result:
+                    llm_result["is_recall"] = llm_result["is_recall"] or result["is_recall"]
+                    result, source = llm_result, "llm"
+
+        result.pop("confidence", None)
+        result["source"] = source
+
+        with self._lock:
+            self.stats[source] += 1
+            self._memo[text] = result
+            if len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+turn_classifier = TurnClassifier()
@@ -1,13 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends
+import json
+import time
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect, Response, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from server.core.config import settings
 from server.core.llm import llm_engine
+from server.core.context_budget import context_assembler
+from server.core.llm_scheduler import llm_scheduler, Priority, SchedulerQueueFull
 from server.core.memory import memory_manager
+from server.core.response_cache import response_cache
 from server.core.search_engine import ai_search
 from server.core.i18n import I18N
+from server.core.users import user_manager
+from server.middleware.auth import API_KEY_NAME
 from pydantic import BaseModel
 from typing import List, Optional
 
 router = APIRouter()
+# WebSocket routes cannot use the header-based verify_api_key dependency,
+# so they live on a separate router and authenticate in the handler.
+ws_router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class ChatRequest(BaseModel):
     message: str
@@ -21,8 +36,79 @@ class ChatResponse(BaseModel):
     search_summary: Optional[str] = None
     search_query: Optional[str] = None
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+def require_model_ready():
+    """Rejects chat turns with 503 until the default model has finished loading."""
+    if llm_engine.status == "ready":
+        return
+    if llm_engine.status == "error":
+        raise HTTPException(status_code=503, detail=f"{I18N.t('model_load_failed')}: {llm_engine.last_error}")
+    raise HTTPException(status_code=503, detail=I18N.t("model_loading"), headers={"Retry-After": "10"})
+
+class StreamStats:
+    """Tracks time-to-first-token and decode throughput for one streamed turn."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.tokens = 0
+
+    def on_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def to_dict(self) -> dict:
+        now = time.perf_counter()
+        ttft = (self.first_token_at - self.started) if self.first_token_at else None
+        decode_time = (now - self.first_token_at) if self.first_token_at else 0.0
+        # The first token is produced by prompt evaluation, so it is excluded from decode throughput
+        tokens_per_sec = (self.tokens - 1) / decode_time if self.tokens > 1 and decode_time > 0 else 0.0
+        return {
+            "tokens": self.tokens,
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "tokens_per_sec": round(tokens_per_sec, 2),
+            "total_ms": round((now - self.started) * 1000, 1)
+        }
+
+class TurnTimings:
+    """Start offset and duration of each stage of one chat turn."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+
+    async def run(self, name: str, fn, *args):
+        """Run a blocking stage in the threadpool and record its span."""
+        start = time.perf_counter()
+        try:
+            return await run_in_threadpool(fn, *args)
+        finally:
+            self.record(name, start)
+
+    def record(self, name: str, start: float):
+        self.spans[name] = (start - self.started, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        return {
+            name: {"start_ms": round(offset * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+            for name, (offset, duration) in self.spans.items()
+        }
+
+    def header(self) -> str:
+        # Server-Timing format, shown by browser dev tools
+        return ", ".join(f"{name};dur={duration * 1000:.1f}" for name, (_, duration) in self.spans.items())
+
+async def prepare_turn(request: ChatRequest, timings: TurnTimings) -> dict:
+    """
+    Runs intent recognition, search and memory retrieval for a chat turn and
+    records the user message. Returns the system prompt plus the metadata
+    that the streaming routes send as separate frames.
+
+    Stages run as a small dependency graph: recording the message, memory
+    retrieval, the persona prompt and intent classification start together,
+    and the web search (which needs the intent) overlaps with memory retrieval.
+    Indexing the message for active recall happens off the critical path.
+    """
     user_input = request.message
     search_context = ""
     search_used = False
@@ -30,61 +116,211 @@ async def chat(request: ChatRequest):
     search_summary = ""
     search_query = ""
 
-    # Layer 1: Intent Recognition
-    intent = ai_search.analyze_intent(user_input)
-    
-    # Check trigger: Force Search OR Intent Detected AND Search Enabled
-    should_search = request.force_search or (settings.enable_search and intent["needs_search"])
-
-    if should_search:
-        # Layer 2: Networking
-        search_query = intent["keywords"] if not request.force_search else user_input
-        search_data = ai_search.execute_search(search_query)
-        
-        # Layer 3: Result Processing
-        search_context = ai_search.process_results(search_data)
-        search_results = search_data.get("raw", [])
-        search_summary = search_data.get("summary", "") # Keep legacy summary format if needed
-        search_used = True
-    
-    # Add to memory
-    memory_manager.add_message("user", user_input)
-    
-    # Generate prompt with search context if available
-    system_prompt = memory_manager.get_context_prompt()
-    
+    # The reply this turn follows, taken before the turn itself is recorded
+    previous_reply = next((m["content"] for m in reversed(memory_manager.get_history()) if m["role"] == "assistant"), "")
+
+    # Add to memory; the vector index write is deferred to the memory worker
+    history_task = asyncio.ensure_future(timings.run("history", memory_manager.add_message, "user", user_input, True))
     # Analyze short-term memory context
-    memory_context = memory_manager.analyze_context(user_input)
-    
-    combined_context = ""
-    if search_context:
+    memory_task = asyncio.ensure_future(timings.run("memory", memory_manager.analyze_context, user_input))
+    persona_task = asyncio.ensure_future(timings.run("persona", memory_manager.get_context_prompt))
+
+    try:
+        if request.force_search:
+            should_search = True
+            search_query = user_input
+        else:
+            # Layer 1: Intent Recognition
+            intent = await timings.run("intent", ai_search.analyze_intent, user_input)
+            # Check trigger: Intent Detected AND Search Enabled
+            should_search = settings.enable_search and intent["needs_search"]
+            search_query = intent["keywords"]
+
+        if should_search:
+            # Layer 2: Networking
+            search_data = await timings.run("search", ai_search.execute_search, search_query)
+
+            # Layer 3: Result Processing
+            search_context = ai_search.process_results(search_data)
+            search_results = search_data.get("raw", [])
+            search_summary = search_data.get("summary", "") # Keep legacy summary format if needed
+            search_used = True
+        else:
+            search_query = ""
+
+        memory_context, system_prompt, _ = await asyncio.gather(memory_task, persona_task, history_task)
+    except BaseException:
+        for task in (history_task, memory_task, persona_task):
+            task.cancel()
+        raise
+
+    # Search results and memory layers are ranked, so over-budget text is cut from the end
+    prompt_search = context_assembler.fit(llm_engine.model, search_context, context_assembler.budget("search", llm_engine.model))
+    prompt_memory = context_assembler.fit(llm_engine.model, memory_context, context_assembler.budget("memory", llm_engine.model))
+
+    turn_context = ""
+    if prompt_search:
         # Fusion Feedback
-        combined_context += f"\n\n{I18N.t('chat_system_search_data')}\n{search_context}\n"
-    if memory_context:
-        combined_context += f"\n\n{memory_context}\n"
-        
-    if combined_context:
-        system_prompt += combined_context + f"\n{I18N.t('chat_system_use_info')}"
-
-    # Stream response handling would be ideal, but standard REST returns full text
-    # For now, we collect the stream
+        turn_context += f"\n\n{I18N.t('chat_system_search_data')}\n{prompt_search}\n"
+    if prompt_memory:
+        turn_context += f"\n\n{prompt_memory}\n"
+
+    if turn_context:
+        turn_context = turn_context.strip() + f"\n{I18N.t('chat_system_use_info')}"
+
+    return {
+        "system_prompt": system_prompt,
+        "turn_context": turn_context,
+        # Answers grounded in search results or recalled memories must not be reused
+        "cacheable": response_cache.enabled and not search_used and not memory_context,
+        "previous_reply": previous_reply,
+        "search": {
+            "search_used": search_used,
+            "search_results": search_results,
+            "search_summary": search_summary,
+            "search_query": search_query
+        },
+        "memory": {
+            "memory_context": memory_context
+        }
+    }
+
+def lookup_cached(request: ChatRequest, turn: dict) -> Optional[str]:
+    if not turn["cacheable"]:
+        return None
+    return response_cache.lookup(request.message, turn["system_prompt"], llm_engine.model_path, turn["previous_reply"])
+
+def store_cached(request: ChatRequest, turn: dict, response_text: str, generation_seconds: float):
+    if turn["cacheable"] and response_text:
+        response_cache.store(request.message, turn["system_prompt"], llm_engine.model_path, response_text, generation_seconds,
+                             turn["previous_reply"])
+
+@router.post("/chat", response_model=ChatResponse, dependencies=[Depends(require_model_ready)])
+async def chat(request: ChatRequest, response: Response, background_tasks: BackgroundTasks):
+    user_input = request.message
+    timings = TurnTimings()
+    turn = await prepare_turn(request, timings)
+
+    cached = await timings.run("cache", lookup_cached, request, turn)
+    if cached is not None:
+        # History is updated before returning so the next turn sees this reply; embedding and DB write are queued
+        await timings.run("record", memory_manager.add_message, "assistant", cached, True)
+        response.headers["Server-Timing"] = timings.header()
+        return ChatResponse(response=cached, **turn["search"])
+
+    # Standard REST returns full text, so we collect the stream
     response_text = ""
+    started = time.perf_counter()
     try:
-        for chunk in llm_engine.stream_response(user_input, system_prompt):
+        async for chunk in llm_scheduler.stream(llm_engine.stream_response, user_input, turn["system_prompt"], turn["turn_context"], priority=Priority.INTERACTIVE):
             if not chunk.startswith("Error:"):
                 response_text += chunk
             else:
                 # Handle error in stream?
                 pass
+    except SchedulerQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    timings.record("generate", started)
+
+    # History is updated before returning; the memory embedding and DB write are queued,
+    # the cache write runs after the response is sent
+    await timings.run("record", memory_manager.add_message, "assistant", response_text, True)
+    background_tasks.add_task(store_cached, request, turn, response_text, time.perf_counter() - started)
+    response.headers["Server-Timing"] = timings.header()
 
-    memory_manager.add_message("assistant", response_text)
+    return ChatResponse(response=response_text, **turn["search"])
 
-    return ChatResponse(
-        response=response_text,
-        search_used=search_used,
-        search_results=search_results,
-        search_summary=search_summary,
-        search_query=search_query
+async def stream_turn(request: ChatRequest):
+    """
+    Async generator of chat frames: search and memory metadata first, then
+    one frame per generated token, then a final frame with timing stats and
+    per-stage spans. The finished reply is recorded before the final frame;
+    a reply cut off because the client went away is recorded when the stream
+    closes.
+    """
+    timings = TurnTimings()
+    turn = await prepare_turn(request, timings)
+    yield {"type": "search", **turn["search"]}
+    yield {"type": "memory", **turn["memory"]}
+
+    cached = await timings.run("cache", lookup_cached, request, turn)
+    stats = StreamStats()
+    if cached is not None:
+        stats.on_token()
+        await timings.run("record", memory_manager.add_message, "assistant", cached, True)
+        yield {"type": "token", "content": cached}
+        yield {"type": "done", "response": cached, "cached": True, "stats": stats.to_dict(), "timings": timings.to_dict()}
+        return
+
+    response_text = ""
+    recorded = False
+    try:
+        async for chunk in llm_scheduler.stream(llm_engine.stream_response, request.message, turn["system_prompt"], turn["turn_context"], priority=Priority.INTERACTIVE):
+            if chunk.startswith("Error:"):
+                yield {"type": "error", "detail": chunk}
+                continue
+            stats.on_token()
+            response_text += chunk
+            yield {"type": "token", "content": chunk}
+        timings.record("generate", stats.started)
+        generation_seconds = time.perf_counter() - stats.started
+        # Recorded before the done frame, so a follow-up turn sees this reply
+        recorded = True
+        await timings.run("record", memory_manager.add_message, "assistant", response_text, True)
+        yield {"type": "done", "response": response_text, "stats": stats.to_dict(), "timings": timings.to_dict()}
+        # Only complete generations are cached, never a reply cut off by a disconnect
+        await run_in_threadpool(store_cached, request, turn, response_text, generation_seconds)
+    except SchedulerQueueFull as e:
+        yield {"type": "error", "detail": str(e)}
+    finally:
+        if response_text and not recorded:
+            # Cut off mid-generation; an await here may be cancelled along with the stream,
+            # so the partial reply is handed to a worker thread without waiting for it
+            asyncio.get_running_loop().run_in_executor(None, memory_manager.add_message, "assistant", response_text, True)
+        logger.info(f"Chat stream finished: {stats.to_dict()}")
+
+@router.post("/stream", dependencies=[Depends(require_model_ready)])
+async def chat_stream(request: ChatRequest):
+    """Server-Sent Events variant of /chat that emits tokens as they are generated."""
+    async def event_source():
+        async for frame in stream_turn(request):
+            yield f"event: {frame['type']}\ndata: {json.dumps(frame, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+@ws_router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """WebSocket variant of /stream. Each received ChatRequest JSON starts a new turn."""
+    api_key = websocket.headers.get(API_KEY_NAME) or websocket.query_params.get("api_key")
+    if not api_key or api_key not in user_manager.get_api_keys():
+        await websocket.close(code=1008, reason=I18N.t("auth_validation_failed"))
+        return
+
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except (ValueError, KeyError):
+                # Malformed JSON or a binary frame; the connection stays open
+                await websocket.send_json({"type": "error", "detail": I18N.t("ws_invalid_frame")})
+                continue
+            try:
+                request = ChatRequest(**data)
+                require_model_ready()
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail, "status_code": e.status_code})
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            async for frame in stream_turn(request):
+                await websocket.send_json(frame)
+    except WebSocketDisconnect:
+        pass
@@ -14,6 +14,8 @@ from server.core.users import user_manager
 from server.core.model_manager import model_manager
 from server.core.monitor import monitor, client_manager, audit_logger, monitor_hub
 from server.core.llm import llm_engine
+from server.core.llm_tuner import llm_tuner
+from server.core.memory.consolidation import memory_consolidator
 from server.core.audio import audio_manager
 from server.middleware.auth import verify_api_key
 from server.core.i18n import I18N
@@ -201,7 +203,7 @@ async def search_huggingface(q: str, limit: int = 10, user: dict = Depends(get_c
 async def load_specific_model(model_name: str, user: dict = Depends(get_current_admin)):
     audit_logger.log("MODEL_LOAD", f"Loading model {model_name}", user["user"])
     if model_manager.load_model(model_name):
-        return {"status": "success", "message": f"Model {model_name} loaded"}
+        return {"status": "success", "message": f"Model {model_name} loading", "model": llm_engine.get_status()}
     else:
         return {"status": "error", "message": "Failed to load model"}
 
@@ -210,10 +212,52 @@ async def reload_model(user: dict = Depends(get_current_admin)):
     audit_logger.log("MODEL_RELOAD", "Manual model reload triggered", user["user"])
     try:
         llm_engine.reload_model()
-        return {"status": "success", "message": "Model reload initiated"}
+        return {"status": "success", "message": "Model reload initiated", "model": llm_engine.get_status()}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@router.get("/model/status")
+async def get_model_status(user: dict = Depends(get_current_admin)):
+    return llm_engine.get_status()
+
+@router.post("/llm/tune")
+async def tune_llm(model_name: Optional[str] = None, apply: bool = True, user: dict = Depends(get_current_admin)):
+    """Start an n_threads / n_batch / n_ctx sweep in the background; poll GET /llm/tune for progress."""
+    model_path = None
+    if model_name:
+        model_path = next((m["path"] for m in model_manager.list_models() if m["name"] == model_name), None)
+        if not model_path:
+            raise HTTPException(status_code=404, detail=f"Model {model_name} not found")
+    if llm_tuner.progress.get("status") == "running":
+        raise HTTPException(status_code=409, detail="A tuning run is already in progress")
+    audit_logger.log("LLM_TUNE", f"Tuning started for {model_name or settings.model_path}", user["user"])
+    llm_tuner.tune_async(model_path, apply=apply)
+    return {"status": "started"}
+
+@router.get("/llm/tune")
+async def get_llm_tuning(user: dict = Depends(get_current_admin)):
+    return {"progress": llm_tuner.progress, "results": llm_tuner.load_results()}
+
+@router.get("/llm/stats")
+async def get_llm_stats(user: dict = Depends(get_current_admin)):
+    return monitor.get_llm_stats()
+
+@router.get("/memory/stats")
+async def get_memory_stats(user: dict = Depends(get_current_admin)):
+    return monitor.get_memory_stats()
+
+@router.post("/memory/consolidate")
+async def run_memory_consolidation(user: dict = Depends(get_current_admin)):
+    if memory_consolidator.is_running():
+        raise HTTPException(status_code=409, detail="Memory consolidation is already running")
+    audit_logger.log("MEMORY_CONSOLIDATE", "Memory consolidation started", user["user"])
+    memory_consolidator.run_async()
+    return {"status": "started"}
+
+@router.get("/memory/consolidation")
+async def get_memory_consolidation(user: dict = Depends(get_current_admin)):
+    return memory_consolidator.get_status()
+
 from server.core.config import settings
 from pydantic import BaseModel
 
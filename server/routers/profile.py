@@ -1,4 +1,7 @@
 from fastapi import APIRouter, HTTPException, Body, Depends
+from fastapi.encoders import jsonable_encoder
+import numpy as np
+from starlette.concurrency import run_in_threadpool
 from server.core.memory import memory_manager, vector_store
 from server.routers.dashboard import get_current_user
 from server.core.i18n import I18N
@@ -7,22 +10,26 @@ router = APIRouter()
 
 from server.core.persona import persona_manager
 
+def encode_memories(data):
+    # Embeddings are loaded as NumPy arrays
+    return jsonable_encoder(data, custom_encoder={np.ndarray: np.ndarray.tolist})
+
 @router.get("/layers/{layer_name}")
 def get_layer_memories(layer_name: str, user: dict = Depends(get_current_user)):
     if layer_name not in ["instinct", "subconscious", "active_recall"]:
         raise HTTPException(status_code=400, detail="Invalid layer name")
     
     memories = vector_store.get_all_memories(layer_name)
-    return {"layer": layer_name, "count": len(memories), "memories": memories}
+    return {"layer": layer_name, "count": len(memories), "memories": encode_memories(memories)}
 
 @router.post("/layers/{layer_name}/search")
 def search_layer(layer_name: str, query: str = Body(..., embed=True), user: dict = Depends(get_current_user)):
     if layer_name == "instinct":
-        return vector_store.search_instinct(query)
+        return encode_memories(vector_store.search_instinct(query))
     elif layer_name == "subconscious":
-        return vector_store.search_subconscious(query)
+        return encode_memories(vector_store.search_subconscious(query))
     elif layer_name == "active_recall":
-        return vector_store.search_active_recall(query)
+        return encode_memories(vector_store.search_active_recall(query))
     else:
         raise HTTPException(status_code=400, detail="Invalid layer name")
 
@@ -34,13 +41,13 @@ def add_memory_to_layer(layer_name: str, data: dict = Body(...), user: dict = De
 
     if layer_name == "instinct":
         trait_type = data.get("trait_type", "general")
-        return vector_store.add_instinct(content, trait_type)
+        return encode_memories(vector_store.add_instinct(content, trait_type))
     elif layer_name == "subconscious":
         keywords = data.get("keywords", "")
-        return vector_store.add_subconscious(content, keywords)
+        return encode_memories(vector_store.add_subconscious(content, keywords))
     elif layer_name == "active_recall":
         role = data.get("role", "user")
-        return vector_store.add_active_recall(content, role)
+        return encode_memories(vector_store.add_active_recall(content, role))
     else:
         raise HTTPException(status_code=400, detail="Invalid layer name")
 
@@ -57,7 +64,7 @@ async def get_persona(user: dict = Depends(get_current_user)):
 
 @router.post("/persona/analyze")
 async def analyze_persona(user: dict = Depends(get_current_user)):
-    persona_manager.analyze_memory()
+    await run_in_threadpool(persona_manager.analyze_memory)
     return {"status": "success", "persona": persona_manager.get_persona()}
 
 @router.get("/")
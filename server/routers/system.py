@@ -31,7 +31,7 @@ def root():
 def get_system_status():
     tts_status = audio_manager.check_tts_health()
     return {
-        "llm": {"status": llm_engine.model is not None, "message": I18N.t("model_loaded") if llm_engine.model else I18N.t("model_missing")},
+        "llm": {"status": llm_engine.model is not None, "message": I18N.t("model_loaded") if llm_engine.model else I18N.t("model_loading" if llm_engine.status == "loading" else "model_missing")},
         "tts": tts_status,
         "asr": {"status": True, "message": I18N.t("asr_ready")} 
     }
@@ -0,0 +1,100 @@
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+# Add project root to path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.memory.ann_index import IVFFlatIndex
+
+def make_corpus(rows: int, dim: int, rng) -> np.ndarray:
+    """Clustered vectors, closer to real sentence embeddings than uniform noise."""
+    centers = rng.standard_normal((max(8, rows // 500), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=rows)
+    return centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+
+def scan_search(json_rows, query, k):
+    """The previous SQLite path: decode every JSON embedding, build a matrix, score and sort."""
+    matrix = np.array([json.loads(r) for r in json_rows])
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1e-10
+    sims = matrix @ query / (norms * np.linalg.norm(query))
+    return sorted(range(len(sims)), key=lambda i: sims[i], reverse=True)[:k]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def measure(index: IVFFlatIndex, ids, corpus, qs, exact, k: int) -> dict:
+    start = time.perf_counter()
+    index.build(ids, corpus)
+    build_s = time.perf_counter() - start
+
+    index_ms, recalls = [], []
+    for q, expected in zip(qs, exact):
+        start = time.perf_counter()
+        hits = index.search(q, k)
+        index_ms.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected & {h[0] for h in hits}) / k)
+
+    return {
+        "build_s": round(build_s, 2),
+        "index_p50_ms": round(statistics.median(index_ms), 2),
+        "index_p95_ms": round(percentile(index_ms, 0.95), 2),
+        f"recall@{k}": round(statistics.mean(recalls), 3),
+        "memory_mb": round(index.memory_bytes() / (1024 * 1024), 2),
+        "lists": index.get_stats()["lists"]
+    }
+
+def run(rows: int, dim: int, queries: int, k: int, nprobe: int, scan_limit: int, quantizations, rerank_factor: int, rng) -> dict:
+    corpus = make_corpus(rows, dim, rng)
+    ids = [str(i) for i in range(rows)]
+    qs = corpus[rng.choice(rows, size=queries, replace=False)] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+
+    normalized = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    exact = [set(np.argsort(-(normalized @ (q / np.linalg.norm(q))))[:k].astype(str)) for q in qs]
+
+    # Quantized indexes keep only codes; re-ranking reads floats from the corpus, as the store reads them from SQLite
+    source = lambda batch: {id_: corpus[int(id_)] for id_ in batch}
+    result = {"rows": rows}
+    for quantization in quantizations:
+        if quantization == "none":
+            index = IVFFlatIndex(nprobe=nprobe)
+        else:
+            index = IVFFlatIndex(nprobe=nprobe, quantization=quantization, rerank_factor=rerank_factor, vector_source=source)
+        result[quantization] = measure(index, ids, corpus, qs, exact, k)
+
+    if rows <= scan_limit:
+        json_rows = [json.dumps(v.tolist()) for v in corpus]
+        scan_ms = []
+        for q in qs[:min(queries, 5)]:
+            start = time.perf_counter()
+            scan_search(json_rows, q, k)
+            scan_ms.append((time.perf_counter() - start) * 1000)
+        result["scan_p50_ms"] = round(statistics.median(scan_ms), 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Query latency, recall and memory of the IVF index (float and quantized) vs. the full-scan SQLite path by row count.")
+    parser.add_argument("--rows", default="1000,10000,50000,100000", help="Comma separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--scan-limit", type=int, default=50000, help="Skip the slow full-scan baseline above this size")
+    parser.add_argument("--quantization", default="none,int8,binary", help="Comma separated index variants: none, int8, binary")
+    parser.add_argument("--rerank-factor", type=int, default=16, help="Exactly re-ranked candidates per result for quantized variants")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    quantizations = args.quantization.split(",")
+    for rows in [int(r) for r in args.rows.split(",")]:
+        print(json.dumps(run(rows, args.dim, args.queries, args.k, args.nprobe, args.scan_limit, quantizations, args.rerank_factor, rng)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+import numpy as np
+import psutil
+
+# Add project root to path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+SENTENCES = [
+    "What did we talk about yesterday evening?",
+    "Remind me to check the deployment logs before the meeting.",
+    "I prefer short answers without too many details.",
+    "The build failed again with the same linker error.",
+    "Thanks, that fixed it. Good morning by the way!",
+    "Can you summarize the last report about memory usage on the server?",
+    "My favourite coffee is a flat white with oat milk.",
+    "Search the web for the latest release notes of the project and compare them with ours."
+]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def run_provider(provider: str, threads: int, batch: int, rounds: int, vectors_path: str) -> dict:
+    """Load one provider the way the server does and time it; runs in its own process for clean RSS."""
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    started = time.perf_counter()
+    from server.core.config import settings
+    settings.embedding_provider = provider
+    settings.onnx_threads = threads
+    from server.core.memory.embedding import embedding_service
+    startup_s = time.perf_counter() - started
+    model = embedding_service.local_model
+    if model is None:
+        raise RuntimeError(f"Provider {provider} did not load, see the log above")
+    rss_loaded = process.memory_info().rss
+
+    # The model directly, bypassing the service's cache
+    model.encode(SENTENCES[:2], batch_size=2)
+    single_ms = []
+    for i in range(rounds):
+        t0 = time.perf_counter()
+        model.encode([SENTENCES[i % len(SENTENCES)]], batch_size=1)
+        single_ms.append((time.perf_counter() - t0) * 1000)
+
+    texts = [f"{SENTENCES[i % len(SENTENCES)]} ({i})" for i in range(batch * 8)]
+    t0 = time.perf_counter()
+    model.encode(texts, batch_size=batch)
+    batch_s = time.perf_counter() - t0
+
+    np.save(vectors_path, np.asarray(model.encode(SENTENCES + texts[:64], batch_size=batch), dtype=np.float32))
+    return {
+        "provider": provider,
+        "startup_s": round(startup_s, 2),
+        "model_rss_mb": round((rss_loaded - rss_before) / (1024 * 1024), 1),
+        "peak_rss_mb": round(process.memory_info().rss / (1024 * 1024), 1),
+        "single_p50_ms": round(statistics.median(single_ms), 2),
+        "single_p99_ms": round(percentile(single_ms, 0.99), 2),
+        f"batch{batch}_texts_per_s": round(len(texts) / batch_s, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup, latency, memory and cosine parity of the PyTorch and ONNX int8 embedding providers.")
+    parser.add_argument("--providers", default="local,onnx")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads (0 = default)")
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_provider(args.single, args.threads, args.batch, args.rounds, args.vectors)))
+        return
+
+    results, vectors = [], {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for provider in args.providers.split(","):
+            path = os.path.join(tmp, f"{provider}.npy")
+            command = [sys.executable, os.path.abspath(__file__), "--single", provider, "--vectors", path,
+                       "--threads", str(args.threads), "--batch", str(args.batch), "--rounds", str(args.rounds)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stderr, file=sys.stderr)
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            vectors[provider] = np.load(path)
+            print(json.dumps(result))
+
+    if len(vectors) > 1:
+        (name_a, a), (name_b, b) = list(vectors.items())[:2]
+        cosine = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+        print(json.dumps({
+            "parity": f"{name_a} vs {name_b}",
+            "mean_cosine": round(float(cosine.mean()), 5),
+            "min_cosine": round(float(cosine.min()), 5)
+        }))
+
+if __name__ == "__main__":
+    main()
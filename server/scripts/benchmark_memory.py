@@ -0,0 +1,391 @@
+"""
+Memory subsystem benchmark on synthetic corpora.
+
+Each corpus size runs in its own process against a fresh SQLite database in a
+temporary directory, so the server's data is never touched and RSS numbers
+don't carry over between sizes. Embeddings come from HashingEncoder, a
+deterministic bag-of-words projection: no model download, and texts that
+share words get similar vectors, so recall and consolidation have real work.
+
+    python server/scripts/benchmark_memory.py --rows 10000,100000
+    python server/scripts/benchmark_memory.py --rows 1000000 --queries 100
+    python server/scripts/benchmark_memory.py --compare server/data/benchmarks/memory-<old>.json
+
+Results (one JSON document with every size) go to --output, by default
+server/data/benchmarks/memory-<commit>.json.
+"""
+import sys
+import os
+import json
+import time
+import zlib
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import psutil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Add project root to path to allow imports
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(ROOT)
+
+from server.core.config import settings, DATA_DIR
+
+LAYER_SHARES = {"instinct": 0.01, "subconscious": 0.09, "active_recall": 0.90}
+
+class HashingEncoder:
+    """Deterministic stand-in for a sentence-transformers model: the normalized sum of per-word random vectors."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._words = {}
+
+    def _vector(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            vector = np.random.default_rng(zlib.crc32(word.encode("utf-8"))).standard_normal(self.dim).astype(np.float32)
+            self._words[word] = vector
+        return vector
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        tokens = [text.lower().split() or [""] for text in texts]
+        stacked = np.stack([self._vector(w) for words in tokens for w in words])
+        offsets = np.cumsum([0] + [len(words) for words in tokens[:-1]])
+        sums = np.add.reduceat(stacked, offsets, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return sums / norms
+
+class Corpus:
+    """
+    Synthetic messages: a few words from one of `topics` topics plus filler
+    words. Every 20th active recall message repeats one of a fixed set of
+    habits with a single word changed, which is what consolidation folds.
+    Queries paraphrase stored messages, as a user recalling something would.
+    """
+
+    def __init__(self, seed: int, topics: int = 500, vocabulary: int = 20000):
+        self.rng = np.random.default_rng(seed)
+        syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "gu", "he", "ji", "wa", "xi"]
+        words = set()
+        while len(words) < vocabulary:
+            words.add("".join(self.rng.choice(syllables, size=self.rng.integers(2, 5))))
+        self.words = np.array(sorted(words))
+        self.topics = self.rng.choice(self.words, size=(topics, 8))
+        # Two variants share 28 of 30 words, cosine ~0.93, above the consolidation threshold
+        self.habits = self.rng.choice(self.words, size=(max(10, topics // 5), 30))
+
+    def message(self) -> str:
+        topic = self.topics[self.rng.integers(len(self.topics))]
+        words = self.rng.choice(topic, size=self.rng.integers(3, 5), replace=False).tolist()
+        words += self.rng.choice(self.words, size=self.rng.integers(4, 9)).tolist()
+        return " ".join(words)
+
+    def habit(self) -> str:
+        words = self.habits[self.rng.integers(len(self.habits))].tolist()
+        words[self.rng.integers(len(words))] = self.words[self.rng.integers(len(self.words))]
+        return " ".join(words)
+
+    def messages(self, count: int, habits: bool = False) -> list:
+        return [self.habit() if habits and i % 20 == 0 else self.message() for i in range(count)]
+
+    def paraphrase(self, text: str) -> str:
+        """Replace about a third of the words."""
+        words = text.split()
+        for i in self.rng.choice(len(words), size=max(1, len(words) // 3), replace=False):
+            words[i] = self.words[self.rng.integers(len(self.words))]
+        return " ".join(words)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def latency(values_ms) -> dict:
+    return {
+        "p50_ms": round(statistics.median(values_ms), 3),
+        "p99_ms": round(percentile(values_ms, 0.99), 3),
+        "mean_ms": round(statistics.mean(values_ms), 3)
+    }
+
+def rss_mb() -> float:
+    return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+
+def peak_rss_mb() -> float:
+    if resource is not None:
+        # ru_maxrss is KB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024), 1)
+    # Peak working set on Windows, current RSS where neither is available
+    info = psutil.Process().memory_info()
+    return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+
+def commit_id() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+# --- One corpus size (runs in a child process) ---
+
+def run_size(rows: int, queries: int, k: int, legacy_rows: int, seed: int, workdir: str) -> dict:
+    # Point the store and the legacy LTM files at scratch before anything opens the real ones
+    settings.database_url = "sqlite:///" + os.path.join(workdir, "memory.db")
+    settings.long_term_memory_path = os.path.join(workdir, "ltm.json")
+    settings.secret_key_path = os.path.join(workdir, "ltm.key")
+    settings.user_profile_path = os.path.join(workdir, "user_profile.json")
+    settings.consolidation_llm_summaries = False
+    # An unknown provider loads nothing at import; the fake encoder is attached below
+    provider = settings.embedding_provider
+    settings.embedding_provider = "benchmark"
+
+    from server.core.database import Base, engine, SessionLocal
+    from server.core.memory import models
+    from server.core.memory.embedding import embedding_service
+    from server.core.memory.vector_store import vector_store, LAYER_MODELS
+    from server.core.memory.ingestion import active_recall_ingestor
+    from server.core.memory.trigger import memory_trigger
+    from server.core.memory import consolidation
+
+    embedding_service.provider = "local"
+    embedding_service.local_model = HashingEncoder(settings.vector_dim)
+    settings.embedding_provider = provider
+    consolidation.STATE_PATH = Path(workdir) / "memory_consolidation.json"
+    Base.metadata.create_all(bind=engine)
+    vector_store.ensure_indexes()
+
+    corpus = Corpus(seed)
+    counts = {layer: max(50, int(rows * share)) for layer, share in LAYER_SHARES.items()}
+    result = {"rows": rows, "layers": counts, "rss_mb": {"start": rss_mb()}}
+
+    # Instinct and subconscious are bulk loaded as setup; active recall goes through the ingestion queue
+    started = time.perf_counter()
+    for layer, model in (("instinct", models.InstinctMemory), ("subconscious", models.SubconsciousMemory)):
+        texts = corpus.messages(counts[layer])
+        for start in range(0, len(texts), 1000):
+            chunk = texts[start:start + 1000]
+            embeddings = embedding_service.get_embeddings(chunk, batch_size=256)
+            with SessionLocal() as db:
+                if model is models.InstinctMemory:
+                    db.add_all([model(content=t, embedding=e, trait_type="habit") for t, e in zip(chunk, embeddings)])
+                else:
+                    db.add_all([model(content=t, embedding=e, keywords=", ".join(t.split()[:3])) for t, e in zip(chunk, embeddings)])
+                db.commit()
+    result["setup_s"] = round(time.perf_counter() - started, 2)
+
+    texts = corpus.messages(counts["active_recall"], habits=True)
+    # Queries are paraphrases of stored messages, so exact neighbours are near but not identical rows
+    query_texts = [corpus.paraphrase(texts[i]) for i in corpus.rng.choice(len(texts), size=queries, replace=False)]
+
+    window = max(1, settings.memory_ingest_queue_size // 2)
+    submit_ms = []
+    started = time.perf_counter()
+    for i, text in enumerate(texts):
+        t0 = time.perf_counter()
+        active_recall_ingestor.submit(text, "user" if i % 2 else "assistant")
+        submit_ms.append((time.perf_counter() - t0) * 1000)
+        # Flush per window so the bulk load never overflows into direct writes
+        if (i + 1) % window == 0:
+            active_recall_ingestor.flush()
+    active_recall_ingestor.flush()
+    elapsed = time.perf_counter() - started
+    result["insert"] = {
+        "rows": counts["active_recall"],
+        "rows_per_s": round(counts["active_recall"] / elapsed, 1),
+        "submit": latency(submit_ms),
+        "direct_writes": active_recall_ingestor.get_stats()["direct_writes"]
+    }
+    del submit_ms, texts
+    result["rss_mb"]["loaded"] = rss_mb()
+
+    query_vectors = np.asarray(embedding_service.get_embeddings(query_texts, batch_size=256), dtype=np.float32)
+
+    result["index_build_s"] = {}
+    for layer, model in LAYER_MODELS.items():
+        started = time.perf_counter()
+        vector_store._get_index(model)
+        result["index_build_s"][layer] = round(time.perf_counter() - started, 2)
+    result["rss_mb"]["indexed"] = rss_mb()
+
+    result["search"] = {}
+    search = {
+        "instinct": vector_store.search_instinct,
+        "subconscious": vector_store.search_subconscious,
+        "active_recall": vector_store.search_active_recall
+    }
+    for layer, model in LAYER_MODELS.items():
+        exact = brute_force_top_k(SessionLocal, model, query_vectors, k)
+        times, recalls = [], []
+        for text, vector, expected in zip(query_texts, query_vectors, exact):
+            t0 = time.perf_counter()
+            search[layer](text, limit=k, embedding=vector)
+            times.append((time.perf_counter() - t0) * 1000)
+            # Recall of the dense path alone (the public search may fuse in lexical hits)
+            hits = vector_store._search_sqlite(model, vector, k)
+            recalls.append(len(expected & {h["memory"].id for h in hits}) / max(1, len(expected)))
+        result["search"][layer] = {**latency(times), f"recall@{k}": round(statistics.mean(recalls), 3)}
+
+    times = []
+    for text in query_texts:
+        t0 = time.perf_counter()
+        memory_trigger.analyze_and_retrieve(text)
+        times.append((time.perf_counter() - t0) * 1000)
+    result["trigger"] = {**latency(times), "layers": memory_trigger.get_stats()}
+    result["rss_mb"]["searched"] = rss_mb()
+
+    if legacy_rows:
+        result["legacy"] = run_legacy(corpus, min(rows, legacy_rows), query_texts, k, workdir)
+
+    # Last, since it deletes most active recall rows
+    started = time.perf_counter()
+    consolidation.memory_consolidator.run_consolidation()
+    last_run = consolidation.memory_consolidator.last_run or {}
+    result["consolidation"] = {
+        "seconds": round(time.perf_counter() - started, 2),
+        "clusters": last_run.get("clusters"),
+        "consolidated": last_run.get("consolidated"),
+        "pruned": last_run.get("pruned"),
+        "timings_ms": last_run.get("timings_ms")
+    }
+
+    result["rss_mb"]["end"] = rss_mb()
+    result["rss_mb"]["peak"] = peak_rss_mb()
+    result["embeddings"] = embedding_service.get_stats()
+    vector_store.save_indexes()
+    return result
+
+def brute_force_top_k(session_factory, model, query_vectors: np.ndarray, k: int, chunk: int = 20000):
+    """Exact top-k ids per query, streamed from the table so the corpus never sits in memory twice."""
+    best_ids = [[] for _ in query_vectors]
+    best_sims = np.full((len(query_vectors), 0), -np.inf, dtype=np.float32)
+    with session_factory() as db:
+        offset = 0
+        while True:
+            rows = db.query(model.id, model.embedding).order_by(model.id).offset(offset).limit(chunk).all()
+            if not rows:
+                break
+            offset += len(rows)
+            ids = [r[0] for r in rows]
+            matrix = np.stack([r[1] for r in rows]).astype(np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-10)
+            sims = np.concatenate([best_sims, query_vectors @ matrix.T], axis=1)
+            top = np.argsort(-sims, axis=1)[:, :k]
+            best_ids = [[(best_ids[q] + ids)[i] for i in top[q]] for q in range(len(query_vectors))]
+            best_sims = np.take_along_axis(sims, top, axis=1)
+    return [set(ids) for ids in best_ids]
+
+def run_legacy(corpus: Corpus, rows: int, query_texts, k: int, workdir: str) -> dict:
+    """Legacy LTM: add_message (journaled, encrypted) and columnar retrieve, on scratch storage."""
+    from server.core import memory_legacy
+
+    manager = memory_legacy.MemoryManager(
+        ltm_file=os.path.join(workdir, "legacy_ltm.json"),
+        key_file=os.path.join(workdir, "legacy_ltm.key"),
+        profile_path=os.path.join(workdir, "legacy_profile.json")
+    )
+
+    started = time.perf_counter()
+    for i, text in enumerate(corpus.messages(rows)):
+        manager.add_message("user" if i % 2 else "assistant", text)
+    manager.flush_ltm()
+    insert_s = time.perf_counter() - started
+
+    times = []
+    for text in query_texts:
+        t0 = time.perf_counter()
+        manager.retrieve(text, limit=k)
+        times.append((time.perf_counter() - t0) * 1000)
+    manager.flush_ltm()
+    return {"rows": rows, "insert_rows_per_s": round(rows / insert_s, 1), "retrieve": latency(times)}
+
+# --- Driver ---
+
+def compare(old: dict, new: dict):
+    """Print metrics that differ between two result files, per size."""
+    def flatten(prefix, value, out):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                flatten(f"{prefix}.{key}" if prefix else key, item, out)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[prefix] = value
+        return out
+
+    old_sizes = {r["rows"]: r for r in old["results"]}
+    for result in new["results"]:
+        base = old_sizes.get(result["rows"])
+        if base is None:
+            continue
+        print(f"rows={result['rows']} ({old['commit']} -> {new['commit']})")
+        before, after = flatten("", base, {}), flatten("", result, {})
+        for key in sorted(before.keys() & after.keys()):
+            if before[key] != after[key]:
+                change = f"{(after[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else ""
+                print(f"  {key}: {before[key]} -> {after[key]} {change}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert, search, consolidation and RSS benchmarks of the memory layers on synthetic corpora.")
+    parser.add_argument("--rows", default="10000,100000", help="Comma separated corpus sizes (all layers together)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--legacy-rows", type=int, default=20000, help="Cap on legacy LTM nodes per size, 0 skips it")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result file (default server/data/benchmarks/memory-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to diff the new results against")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Child process: one size, result as JSON on the last stdout line
+        with tempfile.TemporaryDirectory(prefix="memory-bench-") as workdir:
+            result = run_size(int(args.rows), args.queries, args.k, args.legacy_rows, args.seed, workdir)
+        print(json.dumps(result))
+        return
+
+    commit = commit_id()
+    results = []
+    for rows in [int(r) for r in args.rows.split(",")]:
+        command = [sys.executable, os.path.abspath(__file__), "--single", "--rows", str(rows), "--queries", str(args.queries),
+                   "-k", str(args.k), "--legacy-rows", str(args.legacy_rows), "--seed", str(args.seed)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(f"Benchmark for {rows} rows failed")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(json.dumps(result))
+
+    report = {
+        "commit": commit,
+        "created_at": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            key: getattr(settings, key) for key in (
+                "vector_dim", "ann_index_enabled", "ann_nprobe", "ann_min_train_rows", "ann_quantization",
+                "ann_rerank_factor", "hybrid_search_enabled", "memory_ingest_batch_size", "embedding_storage_dtype"
+            )
+        },
+        "results": results
+    }
+    output = args.output or str(DATA_DIR / "benchmarks" / f"memory-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
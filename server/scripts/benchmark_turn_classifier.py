@@ -0,0 +1,160 @@
+import sys
+import os
+import re
+import json
+import time
+import argparse
+import statistics
+
+# Add project root to path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.search_engine import ai_search
+from server.core.llm import llm_engine
+from server.core.turn_classifier import TurnClassifier
+
+# (text, needs_search, is_recall) - held out from the classifier exemplars
+EVAL_SET = [
+    ("What's the exchange rate of euro to dollar today?", True, False),
+    ("Any breaking news in Tokyo?", True, False),
+    ("Will it rain this weekend in London?", True, False),
+    ("How did the Lakers do in their last game?", True, False),
+    ("Current price of gold per ounce", True, False),
+    ("明天上海会下雨吗", True, False),
+    ("Who is the president of France?", True, False),
+    ("What is the tallest building in the world?", True, False),
+    ("Explain how photosynthesis works in detail", True, False),
+    ("Who invented the telephone?", True, False),
+    ("Search for cheap flights to Rome", True, False),
+    ("Look up the opening hours of the city library", True, False),
+    ("Hi there!", False, False),
+    ("You're awesome, thank you", False, False),
+    ("Can you write a haiku about autumn?", False, False),
+    ("Sort this list of numbers for me: 5, 3, 9", False, False),
+    ("Refactor this function to use a dictionary", False, False),
+    ("How are you feeling today, Eliza?", False, False),
+    ("Let's continue with the story", False, False),
+    ("晚上好", False, False),
+    ("What did I say my dog's name was?", False, True),
+    ("Remember the plan we made for the trip?", False, True),
+    ("Which movie did I recommend to you before?", False, True),
+    ("Last time you gave me a recipe, what was it?", False, True),
+    ("What was my answer when you asked about my job?", False, True),
+    ("Did I ever tell you where I grew up?", False, True),
+    ("你记得我上次说的那本书吗", False, True),
+    ("Go back to what we discussed about my thesis", False, True),
+]
+
+LEGACY_INTENT_PROMPT = """
+Analyze the following user query and determine if it requires an internet search to answer.
+Query: "{query}"
+
+Respond ONLY with a JSON object in this format:
+{{
+    "needs_search": true/false,
+    "search_type": "realtime" | "factual" | "none",
+    "search_query": "optimized search keywords or operators"
+}}
+
+Rules:
+- "realtime": Weather, stocks, news, current events (2024-2025).
+- "factual": Specific entities, definitions not in general knowledge.
+- "none": Greetings, logic, coding, general knowledge.
+- If unsure, set needs_search to false.
+"""
+
+LEGACY_RECALL_PROMPT = """
+Analyze if the user is asking to recall a past memory, conversation, or fact from history.
+Respond ONLY with a JSON object: {"is_recall": true} or {"is_recall": false}.
+"""
+
+def legacy_search_intent(text: str) -> dict:
+    """The search layer's original LLM intent call: free-form generation, JSON cut out with a regex."""
+    try:
+        response = llm_engine.generate_response(text, LEGACY_INTENT_PROMPT.format(query=text))
+        match = re.search(r"\{.*\}", response, re.DOTALL)
+        if match:
+            data = json.loads(match.group(0))
+            return {
+                "needs_search": data.get("needs_search", False),
+                "search_type": data.get("search_type", "none"),
+                "keywords": data.get("search_query", text)
+            }
+    except Exception:
+        pass
+    return ai_search._analyze_heuristic(text)
+
+def legacy_classify(text: str, counters: dict) -> dict:
+    """The pre-classifier path: search heuristic -> LLM, then recall regex -> LLM."""
+    intent = ai_search._analyze_heuristic(text)
+    definite = intent["needs_search"] and intent["search_type"] in ["realtime", "explicit"]
+    if not definite and llm_engine.status == "ready":
+        counters["llm_calls"] += 1
+        intent = legacy_search_intent(text)
+
+    is_recall = bool(re.search(r"remember|recall|what did i say|history|last time|yesterday|before|mentioned", text, re.IGNORECASE))
+    if not is_recall and llm_engine.status == "ready":
+        counters["llm_calls"] += 1
+        response = llm_engine.generate_response(text, LEGACY_RECALL_PROMPT)
+        match = re.search(r"\{.*\}", response, re.DOTALL)
+        if match:
+            try:
+                is_recall = bool(json.loads(match.group(0)).get("is_recall", False))
+            except Exception:
+                pass
+    intent["is_recall"] = is_recall
+    return intent
+
+def run(name: str, fn) -> dict:
+    counters = {"llm_calls": 0}
+    latencies = []
+    search_ok = recall_ok = 0
+    for text, needs_search, is_recall in EVAL_SET:
+        start = time.perf_counter()
+        result = fn(text, counters)
+        latencies.append((time.perf_counter() - start) * 1000)
+        search_ok += int(bool(result["needs_search"]) == needs_search)
+        recall_ok += int(bool(result["is_recall"]) == is_recall)
+
+    n = len(EVAL_SET)
+    latencies.sort()
+    return {
+        "path": name,
+        "search_accuracy": round(search_ok / n, 3),
+        "recall_accuracy": round(recall_ok / n, 3),
+        "llm_calls": counters["llm_calls"],
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "p50_ms": round(latencies[n // 2], 1),
+        "p95_ms": round(latencies[min(n - 1, int(n * 0.95))], 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the turn classifier against the legacy intent path.")
+    parser.add_argument("--no-llm", action="store_true", help="Disable the classifier's LLM fallback")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only benchmark the new classifier")
+    args = parser.parse_args()
+
+    print(f"LLM status: {llm_engine.status} | eval set: {len(EVAL_SET)} turns")
+    classifier = TurnClassifier()
+    # Build the exemplar matrix outside the timed loop
+    classifier._exemplar_matrix()
+
+    def classify(text, counters):
+        # Every LLM request, including ones that failed and fell back
+        before = classifier.stats["llm_calls"]
+        result = classifier.classify(text, use_llm=not args.no_llm)
+        counters["llm_calls"] += classifier.stats["llm_calls"] - before
+        return result
+
+    results = [run("turn_classifier", classify)]
+    if not args.skip_legacy:
+        results.append(run("legacy", legacy_classify))
+
+    for r in results:
+        print(json.dumps(r))
+    if len(results) == 2:
+        saved = results[1]["mean_ms"] - results[0]["mean_ms"]
+        print(f"Mean latency saved per turn: {saved:.1f} ms, LLM calls saved: {results[1]['llm_calls'] - results[0]['llm_calls']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import sys
+import os
+import argparse
+
+# Add project root to path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.memory.onnx_embedding import export_onnx
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the local sentence-transformers embedding model to int8 ONNX for embedding_provider='onnx'.")
+    parser.add_argument("--model", default=settings.local_embedding_model)
+    parser.add_argument("--output", default=settings.onnx_embedding_dir)
+    args = parser.parse_args()
+
+    output = export_onnx(args.model, args.output)
+    print(f"Exported {args.model} to {output}")
+    print("Set embedding_provider to 'onnx' in settings to use it.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import sys
+import os
+import json
+import argparse
+
+# Add project root to path to allow imports
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.llm_tuner import llm_tuner
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep n_threads / n_batch / n_ctx for a GGUF model on this host.")
+    parser.add_argument("--model", default=None, help="GGUF path (default: configured model)")
+    parser.add_argument("--prompt-tokens", type=int, default=512, help="Prompt length for the prompt-eval measurement")
+    parser.add_argument("--gen-tokens", type=int, default=64, help="Tokens decoded for the generation measurement")
+    parser.add_argument("--no-apply", action="store_true", help="Only store the results, don't update config/settings.json")
+    args = parser.parse_args()
+
+    model_path = args.model or settings.model_path
+    print(f"Tuning {model_path}")
+    print(f"Threads: {llm_tuner.thread_candidates()} | batches: {llm_tuner.batch_candidates()} | contexts: {llm_tuner.context_candidates()}")
+
+    result = llm_tuner.tune(model_path, apply=not args.no_apply, prompt_tokens=args.prompt_tokens, gen_tokens=args.gen_tokens)
+    for run in result["runs"]:
+        print(json.dumps(run))
+    print(f"Best: {json.dumps(result['best'])}")
+    print("Applied to config/settings.json" if result["applied"] else "Settings not changed")
+    if result["reload_required"]:
+        print("Restart the server (or reload the model) to use them")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import tempfile
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+def temp_sessionmaker(test, *models):
+    """A sessionmaker over a throwaway SQLite file holding the tables of `models`, removed after `test`."""
+    tmp = tempfile.TemporaryDirectory()
+    engine = create_engine(f"sqlite:///{os.path.join(tmp.name, 'memory.db')}")
+    for model in models:
+        model.__table__.create(engine)
+    test.addCleanup(tmp.cleanup)
+    test.addCleanup(engine.dispose)
+    return sessionmaker(bind=engine)
+
+def fake_embeddings(texts, batch_size=32, dim=8):
+    """Deterministic unit vectors per text, standing in for the embedding service."""
+    vectors = []
+    for text in texts:
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        v = rng.standard_normal(dim).astype(np.float32)
+        vectors.append((v / np.linalg.norm(v)).tolist())
+    return vectors
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.memory.ann_index import IVFFlatIndex, id_fingerprint
+
+def make_corpus(rows, dim, rng):
+    centers = rng.standard_normal((max(8, rows // 200), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), size=rows)
+    return centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+
+class TestQuantizedIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.corpus = make_corpus(3000, 64, rng)
+        self.ids = [str(i) for i in range(len(self.corpus))]
+        self.queries = self.corpus[rng.choice(len(self.corpus), size=20, replace=False)] \
+            + 0.3 * rng.standard_normal((20, 64)).astype(np.float32)
+        self.normalized = self.corpus / np.linalg.norm(self.corpus, axis=1, keepdims=True)
+        self.fetched = []
+
+    def source(self, ids):
+        self.fetched.append(len(ids))
+        return {id_: self.corpus[int(id_)] for id_ in ids}
+
+    def exact(self, query, k):
+        sims = self.normalized @ (query / np.linalg.norm(query))
+        return [str(i) for i in np.argsort(-sims)[:k]]
+
+    def recall(self, index, k=10):
+        hits = [{h[0] for h in index.search(q, k)} for q in self.queries]
+        return np.mean([len(h & set(self.exact(q, k))) / k for h, q in zip(hits, self.queries)])
+
+    def test_reranked_scores_are_exact(self):
+        for quantization in ("int8", "binary"):
+            index = IVFFlatIndex(min_train_rows=10**6, quantization=quantization, vector_source=self.source)
+            index.build(self.ids, self.corpus)
+            for query in self.queries[:5]:
+                q = query / np.linalg.norm(query)
+                for id_, sim in index.search(query, 5):
+                    self.assertAlmostEqual(sim, float(self.normalized[int(id_)] @ q), places=5)
+            self.assertTrue(self.fetched and max(self.fetched) <= 5 * index.rerank_factor)
+
+    def test_recall_against_exact_search(self):
+        for quantization, minimum in (("int8", 0.95), ("binary", 0.9)):
+            index = IVFFlatIndex(min_train_rows=10**6, quantization=quantization, vector_source=self.source)
+            index.build(self.ids, self.corpus)
+            self.assertGreaterEqual(self.recall(index), minimum, quantization)
+
+    def test_codes_replace_float_vectors(self):
+        flat = IVFFlatIndex()
+        flat.build(self.ids, self.corpus)
+        int8 = IVFFlatIndex(quantization="int8", vector_source=self.source)
+        int8.build(self.ids, self.corpus)
+        binary = IVFFlatIndex(quantization="binary", vector_source=self.source)
+        binary.build(self.ids, self.corpus)
+        self.assertEqual(int8.memory_bytes() * 4, flat.memory_bytes())
+        self.assertEqual(binary.memory_bytes() * 32, flat.memory_bytes())
+
+    def test_save_load_and_add(self):
+        index = IVFFlatIndex(min_train_rows=1000, quantization="binary", vector_source=self.source)
+        index.build(self.ids[:2500], self.corpus[:2500])
+        for id_ in self.ids[2500:]:
+            index.add(id_, self.corpus[int(id_)])
+        index.remove("0")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            saved = index.save(path)
+            loaded, fingerprint = IVFFlatIndex.load(path, min_train_rows=1000, quantization="binary", vector_source=self.source)
+            with self.assertRaises(ValueError):
+                IVFFlatIndex.load(path, quantization="int8", vector_source=self.source)
+            with self.assertRaises(ValueError):
+                IVFFlatIndex.load(path)
+        self.assertEqual(fingerprint, saved)
+        self.assertEqual(fingerprint, id_fingerprint(reversed(self.ids[1:])))
+        self.assertEqual(len(loaded), len(self.ids) - 1)
+        query = self.corpus[2900]
+        self.assertEqual(loaded.search(query, 1)[0][0], "2900")
+        self.assertNotIn("0", [h[0] for h in loaded.search(self.corpus[0], 5)])
+
+    def test_training_on_fewer_rows_than_lists(self):
+        index = IVFFlatIndex(min_train_rows=1)
+        index.build(self.ids[:5], self.corpus[:5])
+        index.search(self.corpus[3], 1)
+        self.assertLessEqual(len(index.centroids), 5)
+        self.assertEqual(index.search(self.corpus[3], 1)[0][0], "3")
+
+if __name__ == '__main__':
+    unittest.main()
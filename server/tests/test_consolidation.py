@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+import json
+import datetime
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.memory import consolidation
+from server.core.memory.models import ActiveRecallMemory
+from server.tests.support import temp_sessionmaker, fake_embeddings
+
+def unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestCluster(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        centers = rng.standard_normal((3, 16))
+        # Rows 0-3 and 4-6 are tight groups, 7-9 are unrelated, 10-11 a pair below min_cluster_size
+        rows = [centers[0] + 0.01 * rng.standard_normal(16) for _ in range(4)] \
+            + [centers[1] + 0.01 * rng.standard_normal(16) for _ in range(3)] \
+            + list(rng.standard_normal((3, 16))) \
+            + [centers[2] + 0.01 * rng.standard_normal(16) for _ in range(2)]
+        self.matrix = unit(rows)
+        self.consolidator = consolidation.MemoryConsolidator()
+
+    def test_groups_near_duplicates(self):
+        clusters = self.consolidator._cluster(self.matrix, list(range(len(self.matrix))))
+        self.assertEqual([sorted(c) for c in clusters], [[0, 1, 2, 3], [4, 5, 6]])
+        self.assertEqual(clusters[0][0], 0)
+
+    def test_only_leaders_start_clusters(self):
+        clusters = self.consolidator._cluster(self.matrix, [5])
+        self.assertEqual(clusters, [[5, 4, 6]])
+
+    def test_blocked_matches_unblocked(self):
+        leaders = list(range(len(self.matrix)))
+        expected = self.consolidator._cluster(self.matrix, leaders)
+        self.consolidator.block_elements = len(self.matrix)  # One leader per block
+        self.assertEqual(self.consolidator._cluster(self.matrix, leaders), expected)
+
+class TestConsolidationRun(unittest.TestCase):
+    def setUp(self):
+        self.Session = temp_sessionmaker(self, ActiveRecallMemory)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_path = Path(tmp.name) / "memory_consolidation.json"
+        self.add_subconscious = mock.Mock()
+        patches = [
+            mock.patch.object(consolidation, "SessionLocal", self.Session),
+            mock.patch.object(consolidation, "STATE_PATH", self.state_path),
+            mock.patch.object(consolidation.active_recall_ingestor, "flush", lambda *args, **kwargs: True),
+            mock.patch.object(consolidation.embedding_service, "get_embeddings", fake_embeddings),
+            mock.patch.object(consolidation.vector_store, "add_subconscious", self.add_subconscious),
+            mock.patch.object(consolidation.vector_store, "index_remove", lambda *args: None),
+            mock.patch.object(settings, "consolidation_llm_summaries", False)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.consolidator = consolidation.MemoryConsolidator()
+        self.now = datetime.datetime.utcnow().replace(microsecond=0)
+
+    def insert(self, rows):
+        """rows: (id, embedding, minutes ago)."""
+        with self.Session() as db:
+            db.add_all([
+                ActiveRecallMemory(id=id_, content=f"message {id_}", embedding=list(map(float, embedding)), role="user",
+                                   timestamp=self.now - datetime.timedelta(minutes=ago), context_metadata={})
+                for id_, embedding, ago in rows
+            ])
+            db.commit()
+
+    def remaining(self):
+        with self.Session() as db:
+            return sorted(r[0] for r in db.query(ActiveRecallMemory.id).all())
+
+    def watermark(self):
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)["watermark"]
+
+    def test_cluster_is_consolidated_and_watermark_saved(self):
+        rng = np.random.default_rng(5)
+        habit = rng.standard_normal(8)
+        self.insert([(f"h{i}", habit + 0.001 * rng.standard_normal(8), 10 + i) for i in range(3)]
+                    + [(f"o{i}", rng.standard_normal(8), 20 + i) for i in range(3)])
+        self.consolidator.run_consolidation()
+        self.assertEqual(self.consolidator.progress["status"], "completed")
+        self.assertEqual(self.consolidator.last_run["clusters"], 1)
+        self.assertEqual(self.add_subconscious.call_count, 1)
+        self.assertEqual(self.remaining(), ["o0", "o1", "o2"])
+        self.assertEqual(self.watermark(), (self.now - datetime.timedelta(minutes=10)).isoformat())
+
+    def test_leader_cap_takes_oldest_first(self):
+        rng = np.random.default_rng(6)
+        self.insert([(f"r{i}", rng.standard_normal(8), i) for i in range(10)])
+        with mock.patch.object(settings, "consolidation_max_leaders", 4):
+            self.consolidator.run_consolidation()
+            self.assertEqual(self.consolidator.last_run["new_memories"], 10)
+            self.assertEqual(self.consolidator.last_run["leaders"], 4)
+            # r9..r6 were processed, the watermark stops at the newest of them
+            self.assertEqual(self.watermark(), (self.now - datetime.timedelta(minutes=6)).isoformat())
+            self.consolidator.run_consolidation()
+            # The watermark is inclusive, so r6 leads again along with r5..r3
+            self.assertEqual(self.consolidator.last_run["new_memories"], 7)
+            self.assertEqual(self.watermark(), (self.now - datetime.timedelta(minutes=3)).isoformat())
+
+    def test_prune_drops_expired_and_excess(self):
+        rng = np.random.default_rng(7)
+        self.insert([("old", rng.standard_normal(8), 60 * 24 * 40)]
+                    + [(f"m{i}", rng.standard_normal(8), i) for i in range(5)])
+        self.consolidator.max_active_memories = 3
+        self.assertEqual(self.consolidator._prune_weak_memories(), 3)
+        self.assertEqual(self.remaining(), ["m0", "m1", "m2"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.context_budget import ContextAssembler, MESSAGE_OVERHEAD
+
+class FakeModel:
+    """One token per word."""
+
+    def __init__(self, n_ctx=300, model_path="fake.gguf"):
+        self._n_ctx = n_ctx
+        self.model_path = model_path
+        self.tokenize_calls = 0
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def tokenize(self, data, add_bos=False, special=True):
+        self.tokenize_calls += 1
+        return data.decode("utf-8").split()
+
+    def detokenize(self, tokens):
+        return " ".join(tokens).encode("utf-8")
+
+def words(prefix, n):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+class TestContextAssembler(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(settings, "context_response_reserve", 100),
+            mock.patch.object(settings, "context_budgets", {"persona": 0.1, "search": 0.1, "memory": 0.1})
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.assembler = ContextAssembler()
+        self.model = FakeModel()  # 200 prompt tokens: persona 20, turn context 40
+
+    def history(self, n, size=10):
+        return [{"role": "user" if i % 2 == 0 else "assistant", "content": words(f"m{i}_", size)} for i in range(n)]
+
+    def tokens(self, messages):
+        return sum(self.assembler.count_message(self.model, m) for m in messages)
+
+    def test_user_turn_is_always_kept(self):
+        user_input = words("u", 500)
+        messages = self.assembler.assemble_chat(self.model, words("p", 500), self.history(20), words("c", 500), user_input)
+        self.assertEqual(messages[-1]["role"], "user")
+        self.assertTrue(user_input.startswith(messages[-1]["content"]))
+        self.assertEqual(self.assembler.count(self.model, messages[-1]["content"]), 100)
+
+    def test_history_is_dropped_oldest_first(self):
+        history = self.history(20)
+        messages = self.assembler.assemble_chat(self.model, "persona", history, None, "question")
+        kept = messages[1:-1]
+        self.assertGreater(len(kept), 0)
+        self.assertLess(len(kept), len(history))
+        self.assertEqual(kept, history[-len(kept):])
+        self.assertEqual(self.assembler.get_stats()["dropped_messages"], len(history) - len(kept))
+        self.assertLessEqual(self.tokens(messages), self.assembler.prompt_budget(self.model))
+
+    def test_duplicated_trailing_user_turn_is_removed(self):
+        history = self.history(2) + [{"role": "user", "content": "question"}]
+        messages = self.assembler.assemble_chat(self.model, "persona", history, None, "question")
+        self.assertEqual([m["content"] for m in messages].count("question"), 1)
+        self.assertEqual(messages[1:-1], history[:2])
+
+    def test_each_source_stays_within_its_budget(self):
+        messages = self.assembler.assemble_chat(self.model, words("p", 100), self.history(20), words("c", 100), "question")
+        persona, turn_context = messages[0], messages[-2]
+        self.assertEqual(turn_context["role"], "system")
+        self.assertLessEqual(self.assembler.count(self.model, persona["content"]), self.assembler.budget("persona", self.model))
+        self.assertLessEqual(self.assembler.count(self.model, turn_context["content"]),
+                             self.assembler.budget("search", self.model) + self.assembler.budget("memory", self.model))
+        self.assertLessEqual(self.tokens(messages), self.assembler.prompt_budget(self.model))
+
+    def test_fit_keeps_head_or_tail(self):
+        text = words("w", 10)
+        self.assertEqual(self.assembler.fit(self.model, text, 3), "w0 w1 w2")
+        self.assertEqual(self.assembler.fit(self.model, text, 3, keep="tail"), "w7 w8 w9")
+        self.assertEqual(self.assembler.fit(self.model, text, 0), "")
+        self.assertEqual(self.assembler.fit(self.model, text, 10), text)
+
+    def test_fit_entries_shares_budget(self):
+        entries = [words("a", 30), words("b", 5)]
+        fitted = self.assembler.fit_entries(self.model, entries, 20)
+        self.assertEqual([self.assembler.count(self.model, e) for e in fitted], [10, 5])
+        self.assertIs(self.assembler.fit_entries(self.model, entries, 35), entries)
+
+    def test_counts_are_cached_per_model_file(self):
+        self.assembler.count(self.model, "a b c")
+        # A reload of the same file reuses the counts; another file does not
+        self.assertEqual(self.assembler.count(FakeModel(), "a b c"), 3)
+        other = FakeModel(model_path="other.gguf")
+        self.assertEqual(self.assembler.count(other, "a b c"), 3)
+        self.assertEqual((self.model.tokenize_calls, other.tokenize_calls), (1, 1))
+        self.assertEqual(self.assembler.get_stats()["cache_hits"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+import importlib
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.memory.models import SubconsciousMemory
+from server.tests.support import temp_sessionmaker
+
+# The package re-exports the singleton under the module's name
+store_module = importlib.import_module("server.core.memory.vector_store")
+
+def direction(*weights, dim=8):
+    v = np.zeros(dim, dtype=np.float32)
+    v[:len(weights)] = weights
+    return (v / np.linalg.norm(v)).tolist()
+
+class TestHybridSearch(unittest.TestCase):
+    def setUp(self):
+        self.Session = temp_sessionmaker(self, SubconsciousMemory)
+        patches = [
+            mock.patch.object(store_module, "SessionLocal", self.Session),
+            mock.patch.object(store_module, "engine", self.Session.kw["bind"]),
+            mock.patch.object(settings, "hybrid_search_enabled", True),
+            mock.patch.object(settings, "hybrid_search_layers", ["subconscious"]),
+            mock.patch.object(settings, "ann_index_enabled", False)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store = store_module.VectorStore()
+        self.query = direction(1.0)
+
+    def insert(self, rows):
+        """rows: (content, embedding)."""
+        with self.Session() as db:
+            memories = [SubconsciousMemory(content=content, keywords="", embedding=embedding) for content, embedding in rows]
+            db.add_all(memories)
+            db.commit()
+            return [m.id for m in memories]
+
+    def search(self, text, threshold=0.7):
+        return self.store.search_subconscious(text, limit=5, threshold=threshold, embedding=self.query)
+
+    def test_common_word_does_not_bypass_threshold(self):
+        weather, _ = self.insert([
+            ("the weather is sunny and warm", direction(0.9, 0.1)),
+            ("the cat sat on the mat", direction(0.0, 1.0))
+        ])
+        results = self.search("what is the weather")
+        self.assertEqual([r["memory"].id for r in results], [weather])
+
+    def test_unrelated_lexical_match_is_dropped(self):
+        self.insert([("the weather station is offline", direction(0.1, 1.0))])
+        self.assertEqual(self.search("what is the weather"), [])
+
+    def test_lexical_match_lifts_rank(self):
+        close, keyword = self.insert([
+            ("a note about the garden", direction(0.95, 0.3)),
+            ("the weather was rainy", direction(0.9, 0.4))
+        ])
+        results = self.search("weather")
+        self.assertEqual([r["memory"].id for r in results], [keyword, close])
+        self.assertIsNotNone(results[0]["bm25"])
+        self.assertIsNone(results[1]["bm25"])
+
+    def test_match_expression_skips_stopwords_and_short_tokens(self):
+        self.assertEqual(self.store._fts_query("What is the weather in a X city?"), '"weather" OR "city"')
+        self.assertEqual(self.store._fts_query("is it?"), "")
+
+if __name__ == '__main__':
+    unittest.main()
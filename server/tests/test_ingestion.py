@@ -0,0 +1,139 @@
+import unittest
+import sys
+import os
+import importlib
+import threading
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.memory import ingestion
+from server.core.memory.models import ActiveRecallMemory
+from server.tests.support import temp_sessionmaker, fake_embeddings
+
+store_module = importlib.import_module("server.core.memory.vector_store")
+
+class TestActiveRecallIngestor(unittest.TestCase):
+    def setUp(self):
+        self.Session = temp_sessionmaker(self, ActiveRecallMemory)
+        self.embed = mock.Mock(side_effect=fake_embeddings)
+        patches = [
+            mock.patch.object(ingestion, "SessionLocal", self.Session),
+            mock.patch.object(ingestion.embedding_service, "get_embeddings", self.embed),
+            mock.patch.object(ingestion.vector_store, "_index_add", lambda *args: None),
+            mock.patch.object(settings, "memory_ingest_flush_seconds", 0.05)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.ingestor = ingestion.ActiveRecallIngestor()
+
+    def tearDown(self):
+        self.ingestor.stop(timeout=5)
+
+    def stored(self) -> int:
+        with self.Session() as db:
+            return db.query(ActiveRecallMemory).count()
+
+    def test_flush_writes_everything_submitted(self):
+        for i in range(25):
+            self.ingestor.submit(f"message {i}", "user")
+        self.assertTrue(self.ingestor.flush(timeout=5))
+        self.assertEqual(self.stored(), 25)
+        stats = self.ingestor.get_stats()
+        self.assertEqual(stats["inflight"], 0)
+        self.assertEqual(stats["pending"], 0)
+
+    def test_flush_waits_for_batch_held_by_worker(self):
+        entered, release = threading.Event(), threading.Event()
+
+        def slow_embeddings(texts, batch_size=32):
+            entered.set()
+            release.wait(5)
+            return fake_embeddings(texts)
+
+        self.embed.side_effect = slow_embeddings
+        self.ingestor.submit("held by the worker", "user")
+        self.assertTrue(entered.wait(5))
+        # The queue is empty now, only the worker's batch is outstanding
+        self.assertFalse(self.ingestor.flush(timeout=0.2))
+        threading.Timer(0.2, release.set).start()
+        self.assertTrue(self.ingestor.flush(timeout=5))
+        self.assertEqual(self.stored(), 1)
+
+    def test_pending_rows_are_searchable(self):
+        entered, release = threading.Event(), threading.Event()
+
+        def blocked_embeddings(texts, batch_size=32):
+            # Only the worker's write blocks, the overlay search embeds on this thread
+            if threading.current_thread().name == "memory-ingest":
+                entered.set()
+                release.wait(5)
+            return fake_embeddings(texts)
+
+        self.embed.side_effect = blocked_embeddings
+        memory = self.ingestor.submit("the deploy failed with a linker error", "user")
+        self.assertTrue(entered.wait(5))
+        query = fake_embeddings([memory.content])[0]
+        hits = self.ingestor.search_pending(query, limit=5)
+        self.assertEqual([h["memory"].id for h in hits], [memory.id])
+        self.assertEqual(self.ingestor.search_pending(query, limit=5, role="assistant"), [])
+        release.set()
+        self.assertTrue(self.ingestor.flush(timeout=5))
+        self.assertEqual(self.ingestor.search_pending(query, limit=5), [])
+
+    def test_failed_batch_is_kept_and_retried(self):
+        self.embed.side_effect = [RuntimeError("encoder crashed"), fake_embeddings(["retry me"])]
+        memory = self.ingestor.submit("retry me", "user")
+        self.assertTrue(self.ingestor.flush(timeout=5))
+        self.assertEqual(self.stored(), 1)
+        stats = self.ingestor.get_stats()
+        self.assertEqual(stats["failed_batches"], 1)
+        self.assertEqual(stats["retried"], 1)
+        self.assertEqual(stats["pending"], 0)
+        with self.Session() as db:
+            self.assertIsNotNone(db.get(ActiveRecallMemory, memory.id))
+
+class TestMetadataFilters(unittest.TestCase):
+    """Committed rows and rows still queued must match the same metadata filters."""
+
+    VALUES = {"flag": True, "count": 3, "ratio": 0.5, "source": "voice"}
+
+    def setUp(self):
+        self.Session = temp_sessionmaker(self, ActiveRecallMemory)
+        patches = [
+            mock.patch.object(ingestion, "SessionLocal", self.Session),
+            mock.patch.object(store_module, "SessionLocal", self.Session),
+            mock.patch.object(ingestion.embedding_service, "get_embeddings", fake_embeddings),
+            mock.patch.object(ingestion.vector_store, "_index_add", lambda *args: None),
+            mock.patch.object(settings, "ann_index_enabled", False)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.ingestor = ingestion.ActiveRecallIngestor()
+        self.addCleanup(self.ingestor.stop, 5)
+        patch = mock.patch.object(ingestion, "active_recall_ingestor", self.ingestor)
+        patch.start()
+        self.addCleanup(patch.stop)
+        # Both rows hold the query text, so only the filters decide what is returned
+        self.query = fake_embeddings(["remember this"])[0]
+
+    def test_typed_values_match_committed_and_pending_rows(self):
+        committed = self.ingestor.submit("remember this", "user", dict(self.VALUES))
+        self.assertTrue(self.ingestor.flush(timeout=5))
+        with mock.patch.object(self.ingestor, "_pending", {}) as pending:
+            queued = ingestion.ActiveRecallMemory(id="queued", content="remember this", role="user", context_metadata=dict(self.VALUES))
+            queued.timestamp = committed.timestamp
+            pending["queued"] = queued
+            for key, value in list(self.VALUES.items()) + [("count", 3.0)]:
+                results = store_module.vector_store.search_active_recall("q", metadata={key: value}, embedding=self.query)
+                self.assertEqual(sorted(r["memory"].id for r in results), sorted([committed.id, "queued"]), key)
+            for key, value in [("flag", False), ("flag", "True"), ("flag", 1), ("count", "3"), ("source", "text"), ("missing", 1)]:
+                results = store_module.vector_store.search_active_recall("q", metadata={key: value}, embedding=self.query)
+                self.assertEqual(results, [], (key, value))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.llm_cache import PrefixStateCache
+
+class FakeState:
+    """Stands in for a LlamaState; only its size matters to the cache."""
+
+    def __init__(self, name, size=100):
+        self.name = name
+        self.llama_state_size = size
+
+def tokens(*runs):
+    """tokens((0, 8), (100, 4)) -> [0..7, 100..103]"""
+    return [t for start, n in runs for t in range(start, start + n)]
+
+class TestPrefixStateCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = PrefixStateCache(capacity_bytes=300, block_size=4)
+
+    def lookup(self, key):
+        before = self.cache.reused_tokens
+        state = self.cache[key]
+        return state.name, self.cache.reused_tokens - before
+
+    def test_longest_prefix_across_blocks(self):
+        self.cache[tokens((0, 12))] = FakeState("long")
+        self.cache[tokens((0, 4), (100, 8))] = FakeState("branch")
+
+        self.assertEqual(self.lookup(tokens((0, 12), (500, 3))), ("long", 12))
+        self.assertEqual(self.lookup(tokens((0, 6), (900, 2))), ("branch", 4))  # Newest entry owns the shared block
+        self.assertEqual(self.lookup(tokens((0, 4), (100, 4), (7, 1))), ("branch", 8))
+
+        self.assertNotIn(tokens((7, 8)), self.cache)
+        with self.assertRaises(KeyError):
+            self.cache[tokens((7, 8))]
+        self.assertEqual((self.cache.hits, self.cache.misses), (3, 1))
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        for name, start in (("a", 0), ("b", 10), ("c", 20)):
+            self.cache[tokens((start, 4))] = FakeState(name)
+        self.lookup(tokens((0, 4)))
+        self.cache[tokens((30, 4))] = FakeState("d")
+
+        self.assertNotIn(tokens((10, 4)), self.cache)
+        self.assertEqual(sorted(s.name for s in self.cache._entries.values()), ["a", "c", "d"])
+        self.assertEqual(self.cache.size_bytes, 300)
+
+    def test_oversized_and_short_states_are_skipped(self):
+        self.cache[tokens((0, 4))] = FakeState("kept")
+        self.cache[tokens((10, 8))] = FakeState("huge", size=301)
+        self.cache[tokens((20, 3))] = FakeState("short")
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.size_bytes, 100)
+        self.assertEqual(self.lookup(tokens((0, 4))), ("kept", 4))
+        self.assertTrue(PrefixStateCache(capacity_bytes=0))  # Empty cache stays truthy for Llama
+
+    def test_removed_entry_leaves_prefix_index(self):
+        self.cache[tokens((0, 8))] = FakeState("old")
+        self.cache[tokens((0, 4), (50, 4))] = FakeState("new")
+        self.cache[tokens((0, 8))] = FakeState("replaced")  # Same key: replaced, not counted twice
+        self.assertEqual((len(self.cache), self.cache.size_bytes), (2, 200))
+
+        self.cache[tokens((60, 4))] = FakeState("x")
+        self.cache[tokens((70, 4))] = FakeState("y")  # Evicts "new"
+
+        self.assertLessEqual(set(self.cache._prefix_index.values()), set(self.cache._entries))
+        self.assertEqual(len(self.cache._prefix_index), sum(len(b) for b in self.cache._entry_blocks.values()))
+        # Only the block shared with a live entry still matches
+        self.assertEqual(self.lookup(tokens((0, 4), (50, 4))), ("replaced", 4))
+        self.assertEqual(self.lookup(tokens((0, 8))), ("replaced", 8))
+
+        self.cache.clear()
+        self.assertEqual((len(self.cache), self.cache.size_bytes, self.cache._prefix_index), (0, 0, {}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core import llm_pool as pool_module
+from server.core.llm_pool import LLMPool
+
+class FakeEngine:
+    fail = False
+
+    def __init__(self, model_path=None, model_name=None, background=False):
+        self.model_path = self.loaded_path = model_path
+        self.model = None if self.fail else object()
+        self.status = "error" if self.fail else "ready"
+        self.last_error = "load failed" if self.fail else None
+
+    def unload(self):
+        self.model = None
+        self.status = "unloaded"
+
+class TestLLMPool(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.paths = {}
+        for name in ("a", "b", "c"):
+            path = os.path.join(tmp.name, f"{name}.gguf")
+            with open(path, "wb") as f:
+                f.truncate(1024 * 1024)  # 1 MB each
+            self.paths[name] = path
+
+        self.busy = set()
+        self.constructed = mock.Mock(side_effect=FakeEngine)
+        patches = [
+            mock.patch.object(pool_module, "LLMEngine", self.constructed),
+            mock.patch.object(pool_module.llm_scheduler, "in_use", lambda engine: engine.model_path in self.busy),
+            mock.patch.object(settings, "llm_pool_ram_mb", 2),
+            mock.patch.object(FakeEngine, "fail", False)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.default = FakeEngine(model_path=os.path.join(tmp.name, "default.gguf"))
+        self.default.model = None  # Not counted against the budget
+        self.pool = LLMPool(self.default)
+        self.pool.resolve_path = lambda name: self.paths.get(name)
+
+    def test_evicts_least_recently_used(self):
+        a, b = self.pool.get("a"), self.pool.get("b")
+        self.pool.get("a")
+        self.pool.get("c")
+        self.assertIsNone(b.model)
+        self.assertIsNotNone(a.model)
+        self.assertEqual(self.pool.evictions, 1)
+
+    def test_busy_engine_is_not_evicted(self):
+        a, b = self.pool.get("a"), self.pool.get("b")
+        self.busy.add(self.paths["a"])
+        self.pool.get("c")
+        self.assertIsNotNone(a.model)
+        self.assertIsNone(b.model)
+
+    def test_over_budget_when_every_engine_is_busy(self):
+        a, b = self.pool.get("a"), self.pool.get("b")
+        self.busy.update([self.paths["a"], self.paths["b"]])
+        c = self.pool.get("c")
+        self.assertEqual([e.model is not None for e in (a, b, c)], [True, True, True])
+        self.assertEqual(self.pool.evictions, 0)
+
+    def test_failed_load_is_remembered(self):
+        FakeEngine.fail = True
+        self.assertIs(self.pool.get("a"), self.default)
+        self.assertIs(self.pool.get("a"), self.default)
+        self.assertEqual(self.constructed.call_count, 1)
+        self.assertEqual(self.pool._loading, {})
+
+        # Retried once the failure is older than the TTL
+        FakeEngine.fail = False
+        self.pool.failure_ttl = 0
+        self.assertIsNot(self.pool.get("a"), self.default)
+        self.assertEqual(self.constructed.call_count, 2)
+
+    def test_loading_entry_is_dropped_when_load_raises(self):
+        self.constructed.side_effect = RuntimeError("boom")
+        with self.assertRaises(RuntimeError):
+            self.pool.get("a")
+        self.assertEqual(self.pool._loading, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+import sys
+import os
+import time
+import asyncio
+import threading
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.llm_scheduler import LLMScheduler, Priority, SchedulerQueueFull
+
+class FakeEngine:
+    """Stands in for an LLMEngine: records calls and how many ran at once."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate(self, label, hold: threading.Event = None, started: threading.Event = None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if started is not None:
+                started.set()
+            if hold is not None:
+                hold.wait(5)
+            else:
+                time.sleep(0.01)
+            self.calls.append(label)
+            return label
+        finally:
+            with self._lock:
+                self.active -= 1
+
+def lanes(interactive=1, classification=1, background=1):
+    return {"interactive": interactive, "classification": classification, "background": background}
+
+class TestLLMScheduler(unittest.TestCase):
+    def start(self, scheduler, engine, label, priority, **kwargs):
+        thread = threading.Thread(target=scheduler.run_sync, args=(engine.generate, label),
+                                  kwargs=dict(priority=priority, **kwargs))
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def wait_queued(self, scheduler, depth):
+        deadline = time.time() + 5
+        while scheduler.get_stats()["queue_depth"] < depth:
+            self.assertLess(time.time(), deadline, "requests were not queued in time")
+            time.sleep(0.005)
+
+    def test_higher_lane_is_served_first(self):
+        scheduler = LLMScheduler(max_queue=8, lane_limits=lanes())
+        engine = FakeEngine("a")
+        hold, started = threading.Event(), threading.Event()
+        self.start(scheduler, engine, "first", Priority.BACKGROUND, hold=hold, started=started)
+        self.assertTrue(started.wait(5))
+
+        threads = [self.start(scheduler, engine, "background", Priority.BACKGROUND)]
+        self.wait_queued(scheduler, 1)
+        threads.append(self.start(scheduler, engine, "classification", Priority.CLASSIFICATION))
+        self.wait_queued(scheduler, 2)
+        threads.append(self.start(scheduler, engine, "interactive", Priority.INTERACTIVE))
+        self.wait_queued(scheduler, 3)
+
+        hold.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(engine.calls, ["first", "interactive", "classification", "background"])
+
+    def test_rejects_when_queue_is_full(self):
+        scheduler = LLMScheduler(max_queue=1, lane_limits=lanes())
+        engine = FakeEngine("a")
+        hold, started = threading.Event(), threading.Event()
+        self.start(scheduler, engine, "running", Priority.INTERACTIVE, hold=hold, started=started)
+        self.assertTrue(started.wait(5))
+        self.start(scheduler, engine, "waiting", Priority.INTERACTIVE)
+        self.wait_queued(scheduler, 1)
+
+        with self.assertRaises(SchedulerQueueFull):
+            scheduler.run_sync(engine.generate, "rejected", priority=Priority.INTERACTIVE)
+        self.assertEqual(scheduler.get_stats()["lanes"]["interactive"]["rejected"], 1)
+        hold.set()
+
+    def test_one_job_per_engine(self):
+        scheduler = LLMScheduler(max_queue=16, lane_limits=lanes(background=4))
+        a, b = FakeEngine("a"), FakeEngine("b")
+        threads = [self.start(scheduler, engine, i, Priority.BACKGROUND) for i in range(4) for engine in (a, b)]
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((len(a.calls), len(b.calls)), (4, 4))
+        self.assertEqual((a.max_active, b.max_active), (1, 1))
+
+    def test_different_engines_run_in_parallel(self):
+        scheduler = LLMScheduler(max_queue=4, lane_limits=lanes(background=2))
+        a, b = FakeEngine("a"), FakeEngine("b")
+        hold = threading.Event()
+        started = [threading.Event(), threading.Event()]
+        self.start(scheduler, a, "a", Priority.BACKGROUND, hold=hold, started=started[0])
+        self.start(scheduler, b, "b", Priority.BACKGROUND, hold=hold, started=started[1])
+        self.assertTrue(all(event.wait(5) for event in started))
+        hold.set()
+
+    def test_nested_call_on_same_engine_runs_inline(self):
+        scheduler = LLMScheduler(max_queue=4, lane_limits=lanes())
+        engine = FakeEngine("a")
+
+        def outer():
+            return scheduler.run_sync(engine.generate, "inner", priority=Priority.CLASSIFICATION)
+
+        outer.__self__ = engine  # Locks the engine like one of its bound methods
+        result = []
+        thread = threading.Thread(target=lambda: result.append(scheduler.run_sync(outer, priority=Priority.BACKGROUND)))
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), "nested call on the held engine deadlocked")
+        self.assertEqual(result, ["inner"])
+
+    def test_nested_call_does_not_wait_for_own_lane(self):
+        scheduler = LLMScheduler(max_queue=4, lane_limits=lanes(background=1))
+        a, b = FakeEngine("a"), FakeEngine("b")
+
+        def outer():
+            return scheduler.run_sync(b.generate, "on b", priority=Priority.BACKGROUND)
+
+        outer.__self__ = a
+        thread = threading.Thread(target=scheduler.run_sync, args=(outer,), kwargs={"priority": Priority.BACKGROUND})
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), "nested call waited for the lane slot its caller holds")
+        self.assertEqual(b.calls, ["on b"])
+
+    def test_cancelled_submit_leaves_the_queue(self):
+        scheduler = LLMScheduler(max_queue=4, lane_limits=lanes())
+        engine = FakeEngine("a")
+        hold, started = threading.Event(), threading.Event()
+        self.start(scheduler, engine, "running", Priority.INTERACTIVE, hold=hold, started=started)
+        self.assertTrue(started.wait(5))
+
+        async def cancel_waiting():
+            task = asyncio.ensure_future(scheduler.submit(engine.generate, "withdrawn", priority=Priority.INTERACTIVE))
+            while scheduler.get_stats()["queue_depth"] == 0:
+                await asyncio.sleep(0.005)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            while scheduler.get_stats()["queue_depth"]:
+                await asyncio.sleep(0.005)
+
+        asyncio.run(asyncio.wait_for(cancel_waiting(), 5))
+        hold.set()
+        self.assertNotIn("withdrawn", engine.calls)
+        self.assertEqual(scheduler.get_stats()["lanes"]["interactive"]["cancelled"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
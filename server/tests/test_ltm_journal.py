@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.memory_legacy import MemoryNode, JournaledEncryptedStorage
+
+class TestJournaledStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.ltm = os.path.join(self.tmp.name, "ltm.json")
+        self.key = os.path.join(self.tmp.name, "ltm.key")
+
+    def storage(self, **kwargs) -> JournaledEncryptedStorage:
+        storage = JournaledEncryptedStorage(self.ltm, self.key, **kwargs)
+        self.addCleanup(storage.close)
+        return storage
+
+    def nodes(self, n, prefix="m"):
+        return [MemoryNode(f"{prefix} {i}", "user") for i in range(n)]
+
+    def test_torn_last_record_is_skipped(self):
+        storage = self.storage()
+        nodes = self.nodes(3)
+        storage.append(nodes)
+        storage.close()
+        with open(storage.journal_path, "ab") as f:
+            f.write(b"half-written recor")
+        loaded = {n.id for n in self.storage().load()}
+        self.assertEqual(loaded, {n.id for n in nodes})
+
+    def test_corrupt_middle_record_stops_replay_and_keeps_copy(self):
+        storage = self.storage()
+        first, last = self.nodes(1, "first"), self.nodes(1, "last")
+        storage.append(first)
+        storage._append_bytes(b"not a record\n", 1)
+        storage.append(last)
+        storage.close()
+        loaded = {n.id for n in self.storage().load()}
+        self.assertEqual(loaded, {first[0].id})
+        self.assertTrue(os.path.exists(storage.journal_path + ".corrupt"))
+
+    def test_appends_during_compaction_survive(self):
+        storage = self.storage()
+        before = self.nodes(5, "before")
+        storage.append(before)
+        during = self.nodes(2, "during")
+        encrypt = storage._encrypt_record
+        appended = []
+
+        def encrypt_and_append(payload):
+            # An append made while the snapshot is being written goes to the new journal
+            if not appended:
+                appended.append(True)
+                storage.append(during)
+            return encrypt(payload)
+
+        with mock.patch.object(storage, "_encrypt_record", side_effect=encrypt_and_append):
+            storage.save(before)
+        self.assertFalse(os.path.exists(storage.rotated_path))
+        storage.close()
+        loaded = {n.id for n in self.storage().load()}
+        self.assertEqual(loaded, {n.id for n in before + during})
+
+    def test_snapshot_is_taken_under_the_lock(self):
+        storage = self.storage()
+        nodes = self.nodes(3)
+        nodes[0].associations = {nodes[1].id: 0.8}
+        encrypt = storage._encrypt_record
+
+        def encrypt_while_linking(payload):
+            # A request thread linking nodes while the snapshot is encrypted
+            nodes[0].associations[f"new {len(nodes[0].associations)}"] = 0.5
+            return encrypt(payload)
+
+        with mock.patch.object(storage, "_encrypt_record", side_effect=encrypt_while_linking):
+            storage.save(nodes)
+        storage.close()
+        loaded = {n.id: n for n in self.storage().load()}
+        self.assertEqual(loaded[nodes[0].id].associations, {nodes[1].id: 0.8})
+
+    def test_rotated_journal_left_by_a_crash(self):
+        storage = self.storage()
+        nodes = self.nodes(3)
+        storage.append(nodes)
+        storage.close()
+        shutil.copy(storage.journal_path, self.ltm + ".journal.copy")
+
+        # Crash after rotating, before the snapshot was written: the rotated journal is replayed
+        os.replace(storage.journal_path, storage.rotated_path)
+        self.assertEqual({n.id for n in self.storage().load()}, {n.id for n in nodes})
+
+        # Crash after the snapshot was written, before the rotated journal was removed:
+        # the snapshot is newer, replaying the rotated journal would roll nodes back
+        nodes[0].access_count = 7
+        compacting = self.storage()
+        compacting.save(nodes)
+        compacting.close()
+        os.replace(self.ltm + ".journal.copy", storage.rotated_path)
+        loaded = {n.id: n for n in self.storage().load()}
+        self.assertEqual(loaded[nodes[0].id].access_count, 7)
+        self.assertFalse(os.path.exists(storage.rotated_path))
+
+if __name__ == '__main__':
+    unittest.main()
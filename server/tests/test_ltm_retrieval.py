@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import random
+import re
+import time
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.memory_legacy import MemoryNode, LTMIndex
+
+WORDS = ["status", "report", "coffee", "deploy", "error", "server", "morning", "thanks", "good", "fail",
+         "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "memory", "search", "model", "night"]
+WEIGHTS = {"w_sem": 0.6, "w_rec": 0.3, "w_pri": 0.2, "w_em": 0.2, "w_str": 0.3}
+
+def reference_retrieve(nodes, query, limit, weights):
+    """The per-node scan LTMIndex replaces, kept here as the ranking oracle."""
+    candidates = []
+    query_tokens = set(re.findall(r'\w+', query.lower()))
+    current_time = time.time()
+    for node in nodes:
+        strength = node.get_current_strength()
+        node_tokens = set(re.findall(r'\w+', node.content.lower()))
+        overlap = len(query_tokens.intersection(node_tokens))
+        semantic_score = overlap / (len(query_tokens) + 1) if query_tokens else 0
+        emotion_boost = sum(v for k, v in node.emotion.items() if k != "neutral") * weights["w_em"]
+        recency = max(0.0, 1.0 - ((current_time - node.timestamp) / (3600 * 48)))
+        primacy = 1.0 / (1.0 + node.access_count)
+        activation = (strength * weights["w_str"]) + (semantic_score * weights["w_sem"]) + (recency * weights["w_rec"]) + (primacy * weights["w_pri"]) + emotion_boost
+        if activation > 0.1:
+            candidates.append((activation, node))
+    candidates.sort(key=lambda x: x[0], reverse=True)
+    return [node for _, node in candidates[:limit]]
+
+def random_node(rng, now):
+    content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+    emotion = rng.choice([{"neutral": 1.0}, {"frustration": 0.8}, {"joy": 0.6}, {"joy": 0.3, "surprise": 0.4}])
+    node = MemoryNode(content, rng.choice(["user", "assistant"]), rng.choice([0.4, 0.6, rng.random()]), emotion)
+    node.timestamp = now - rng.uniform(0, 3600 * 96)
+    node.last_accessed = node.timestamp + rng.uniform(0, now - node.timestamp)
+    node.access_count = rng.randint(1, 20)
+    node.decay_rate = rng.choice([0.05, 0.001, 0.2, rng.uniform(0.001, 0.2)])
+    return node
+
+class TestLTMRetrievalParity(unittest.TestCase):
+    def setUp(self):
+        self.now = 1_700_000_000.0
+        patcher = mock.patch("time.time", return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_same_ranking(self, nodes, index, query, limit):
+        expected = reference_retrieve(nodes, query, limit, WEIGHTS)
+        actual = index.top_k(query, limit, time.time(), **WEIGHTS)
+        self.assertEqual([n.id for n in actual], [n.id for n in expected], f"query={query!r} limit={limit}")
+
+    def test_random_queries(self):
+        rng = random.Random(7)
+        nodes = [random_node(rng, self.now) for _ in range(2000)]
+        index = LTMIndex(nodes)
+        for _ in range(200):
+            query = " ".join(rng.choice(WORDS + ["unknown", "Status?", "ERROR!"]) for _ in range(rng.randint(0, 6)))
+            self.assert_same_ranking(nodes, index, query, rng.choice([1, 3, 5, 50, 5000]))
+
+    def test_ties_keep_insertion_order(self):
+        nodes = []
+        for i in range(30):
+            node = MemoryNode("same words here", "user", 0.6)
+            node.id = f"node-{i}"
+            node.timestamp = node.last_accessed = self.now
+            nodes.append(node)
+        index = LTMIndex(nodes)
+        for limit in (1, 7, 30, 40):
+            self.assert_same_ranking(nodes, index, "same words", limit)
+
+    def test_incremental_updates(self):
+        rng = random.Random(11)
+        nodes = []
+        index = LTMIndex()
+        for i in range(300):
+            node = random_node(rng, self.now)
+            nodes.append(node)
+            index.add(node)
+            if i % 25 == 0:
+                # Retrieval bumps access stats, the index must follow
+                for hit in index.top_k("status report error", 3, time.time(), **WEIGHTS):
+                    hit.update_access()
+                    index.update(hit)
+                self.assert_same_ranking(nodes, index, "status report error", 5)
+        self.assert_same_ranking(nodes, index, "coffee morning thanks", 10)
+
+    def test_empty(self):
+        self.assertEqual(LTMIndex().top_k("anything", 5, time.time(), **WEIGHTS), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.memory.onnx_embedding import mean_pool, l2_normalize, OnnxSentenceEncoder, export_onnx
+
+def installed(*modules) -> bool:
+    try:
+        for module in modules:
+            __import__(module)
+    except ImportError:
+        return False
+    return True
+
+SENTENCES = [
+    "What did we talk about yesterday?",
+    "Remind me to check the deployment logs.",
+    "I prefer short answers.",
+    "The build failed again with the same linker error, and I have no idea why it keeps happening after the last update.",
+    "Good morning!",
+    "记得昨天我们聊了什么吗？"
+]
+
+class TestPooling(unittest.TestCase):
+    def test_mean_pool_ignores_padding(self):
+        hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+        mask = np.array([[1, 1, 0]])
+        np.testing.assert_allclose(mean_pool(hidden, mask), [[2.0, 3.0]])
+
+    def test_empty_mask_does_not_divide_by_zero(self):
+        hidden = np.ones((1, 2, 3), dtype=np.float32)
+        self.assertTrue(np.isfinite(mean_pool(hidden, np.zeros((1, 2), dtype=np.int64))).all())
+
+    def test_l2_normalize(self):
+        vectors = l2_normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+        np.testing.assert_allclose(vectors[0], [0.6, 0.8])
+        np.testing.assert_allclose(vectors[1], [0.0, 0.0])
+
+@unittest.skipUnless(installed("onnxruntime", "tokenizers", "torch", "sentence_transformers", "onnx"),
+                     "ONNX export needs onnxruntime, tokenizers, torch, onnx and sentence-transformers")
+class TestOnnxParity(unittest.TestCase):
+    """The int8 ONNX encoder against the PyTorch model it was exported from."""
+
+    MODEL = "all-MiniLM-L6-v2"
+
+    @classmethod
+    def setUpClass(cls):
+        from sentence_transformers import SentenceTransformer
+        cls.tmp = tempfile.TemporaryDirectory()
+        try:
+            cls.reference = SentenceTransformer(cls.MODEL, device="cpu")
+            export_onnx(cls.MODEL, cls.tmp.name)
+        except OSError as e:
+            cls.tmp.cleanup()
+            raise unittest.SkipTest(f"{cls.MODEL} is not available offline: {e}")
+        cls.encoder = OnnxSentenceEncoder(cls.tmp.name, threads=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_cosine_parity(self):
+        expected = self.reference.encode(SENTENCES)
+        actual = self.encoder.encode(SENTENCES, batch_size=4)
+        self.assertEqual(actual.shape, expected.shape)
+        cosine = np.sum(actual * expected, axis=1) / (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+        self.assertGreater(cosine.min(), 0.97)
+        self.assertGreater(cosine.mean(), 0.99)
+
+    def test_batching_does_not_change_vectors(self):
+        batched = self.encoder.encode(SENTENCES, batch_size=len(SENTENCES))
+        single = np.stack([self.encoder.encode([s], batch_size=1)[0] for s in SENTENCES])
+        # Dynamic quantization scales activations per run, so padding may shift values slightly
+        self.assertGreater(np.sum(batched * single, axis=1).min(), 0.999)
+
+    def test_same_ranking_as_reference(self):
+        query = "what did we discuss yesterday"
+        expected = self.reference.encode(SENTENCES) @ self.reference.encode(query)
+        actual = self.encoder.encode(SENTENCES) @ self.encoder.encode(query)
+        self.assertEqual(int(np.argmax(actual)), int(np.argmax(expected)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+import importlib
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core import response_cache as cache_module
+from server.core.models import ResponseCacheEntry
+from server.tests.support import temp_sessionmaker
+
+store_module = importlib.import_module("server.core.memory.vector_store")
+
+def direction(*weights, dim=8):
+    v = np.zeros(dim, dtype=np.float32)
+    v[:len(weights)] = weights
+    return (v / np.linalg.norm(v)).tolist()
+
+# Normalized turn -> embedding; cosine to "capital of france" is given per entry
+EMBEDDINGS = {
+    "capital of france": direction(1.0),
+    "what is the capital of france": direction(1.0, 0.2),  # 0.98
+    "capital city of france please": direction(1.0, 0.5),  # 0.89
+    "tell me a joke": direction(0.0, 1.0),
+    "yes": direction(0.0, 0.0, 1.0)
+}
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.Session = temp_sessionmaker(self, ResponseCacheEntry)
+        patches = [
+            mock.patch.object(cache_module, "SessionLocal", self.Session),
+            mock.patch.object(store_module, "SessionLocal", self.Session),
+            mock.patch.object(cache_module.embedding_service, "get_embedding", lambda text: EMBEDDINGS[text]),
+            mock.patch.object(settings, "enable_response_cache", True),
+            mock.patch.object(settings, "response_cache_threshold", 0.95),
+            mock.patch.object(settings, "response_cache_ttl_seconds", 3600),
+            mock.patch.object(settings, "response_cache_max_entries", 100)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.cache = cache_module.ResponseCache()
+
+    def store(self, text, response, previous_reply=""):
+        self.cache.store(text, "system", "model.gguf", response, 1.5, previous_reply)
+
+    def lookup(self, text, previous_reply=""):
+        return self.cache.lookup(text, "system", "model.gguf", previous_reply)
+
+    def entries(self):
+        with self.Session() as db:
+            return sorted(e.query for e in db.query(ResponseCacheEntry).all())
+
+    def test_hit_needs_similarity_above_threshold(self):
+        self.store("Capital of France?", "Paris.")
+        self.assertEqual(self.lookup("What is the capital of France"), "Paris.")
+        self.assertIsNone(self.lookup("Capital city of France please"))
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+        self.assertEqual(self.cache.get_stats()["misses"], 1)
+
+    def test_scope_includes_previous_reply(self):
+        self.store("yes", "Here is the recipe.", previous_reply="Do you want the recipe?")
+        self.assertIsNone(self.lookup("yes", previous_reply="Should I delete the file?"))
+        self.assertIsNone(self.lookup("yes"))
+        self.assertEqual(self.lookup("yes", previous_reply="Do you want the recipe?"), "Here is the recipe.")
+
+    def test_expired_entries_miss_and_are_dropped(self):
+        self.store("capital of france", "Paris.")
+        with self.Session() as db:
+            db.query(ResponseCacheEntry).update({"created_at": datetime.utcnow() - timedelta(hours=2)})
+            db.commit()
+        self.assertIsNone(self.lookup("capital of france"))
+        self.store("tell me a joke", "No.")
+        self.assertEqual(self.entries(), ["tell me a joke"])
+
+    def test_trims_least_recently_used(self):
+        settings.response_cache_max_entries = 2
+        self.store("capital of france", "Paris.")
+        self.store("tell me a joke", "No.")
+        self.assertEqual(self.lookup("capital of france"), "Paris.")
+        self.store("yes", "Sure.")
+        self.assertEqual(self.entries(), ["capital of france", "yes"])
+
+if __name__ == '__main__':
+    unittest.main()
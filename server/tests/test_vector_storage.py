@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+import json
+import importlib
+from unittest import mock
+
+import numpy as np
+from sqlalchemy import text
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from server.core.config import settings
+from server.core.memory.models import (
+    VECTOR_HEADER, ActiveRecallMemory, SubconsciousMemory, encode_vector, decode_vector
+)
+from server.tests.support import temp_sessionmaker
+
+store_module = importlib.import_module("server.core.memory.vector_store")
+
+class TestVectorEncoding(unittest.TestCase):
+    def setUp(self):
+        self.vector = np.random.default_rng(1).standard_normal(384).astype(np.float32)
+
+    def test_float32_round_trip_is_exact(self):
+        blob = encode_vector(self.vector, "float32")
+        self.assertEqual(len(blob), VECTOR_HEADER.size + 4 * 384)
+        np.testing.assert_array_equal(decode_vector(blob), self.vector)
+
+    def test_float16_round_trip(self):
+        blob = encode_vector(self.vector, "float16")
+        self.assertEqual(len(blob), VECTOR_HEADER.size + 2 * 384)
+        decoded = decode_vector(blob)
+        self.assertEqual(decoded.dtype, np.float32)
+        np.testing.assert_allclose(decoded, self.vector, rtol=1e-3, atol=1e-3)
+
+    def test_int8_round_trip(self):
+        blob = encode_vector(self.vector, "int8")
+        self.assertEqual(len(blob), VECTOR_HEADER.size + 4 + 384)
+        decoded = decode_vector(blob)
+        # One quantization step of the per-vector scale at most
+        step = np.abs(self.vector).max() / 127
+        self.assertLessEqual(np.abs(decoded - self.vector).max(), step / 2 + 1e-6)
+        cosine = decoded @ self.vector / (np.linalg.norm(decoded) * np.linalg.norm(self.vector))
+        self.assertGreater(cosine, 0.999)
+
+    def test_zero_and_empty_vectors(self):
+        np.testing.assert_array_equal(decode_vector(encode_vector(np.zeros(4), "int8")), np.zeros(4))
+        self.assertEqual(len(decode_vector(encode_vector([], "float32"))), 0)
+
+    def test_legacy_json_text_decodes(self):
+        decoded = decode_vector(json.dumps([0.5, -1.0, 2.0]))
+        self.assertEqual(decoded.dtype, np.float32)
+        np.testing.assert_array_equal(decoded, [0.5, -1.0, 2.0])
+
+    def test_unknown_version_is_rejected(self):
+        blob = bytearray(encode_vector(self.vector))
+        blob[0] = 99
+        with self.assertRaises(ValueError):
+            decode_vector(bytes(blob))
+
+class TestEmbeddingMigration(unittest.TestCase):
+    def setUp(self):
+        self.Session = temp_sessionmaker(self, SubconsciousMemory, ActiveRecallMemory)
+        self.engine = self.Session.kw["bind"]
+        patches = [
+            mock.patch.object(store_module, "engine", self.engine),
+            mock.patch.object(store_module, "SessionLocal", self.Session),
+            mock.patch.object(settings, "embedding_storage_dtype", "float16")
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.store = store_module.VectorStore()
+
+    def insert_raw(self, id_, embedding):
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO memory_subconscious (id, content, embedding, keywords, association_count, last_accessed) "
+                "VALUES (:id, :content, :embedding, '', 0, CURRENT_TIMESTAMP)"
+            ), {"id": id_, "content": f"memory {id_}", "embedding": embedding})
+
+    def typeof(self, id_):
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT typeof(embedding) FROM memory_subconscious WHERE id = :id"), {"id": id_}).scalar()
+
+    def test_text_rows_are_converted(self):
+        for i in range(5):
+            self.insert_raw(f"json{i}", json.dumps([float(i), 1.0, -1.0]))
+        self.insert_raw("blob", encode_vector([3.0, 4.0], "float32"))
+
+        self.assertEqual(self.store.migrate_embeddings(batch_size=2), 5)
+        self.assertEqual(self.typeof("json3"), "blob")
+        with self.Session() as db:
+            np.testing.assert_allclose(db.get(SubconsciousMemory, "json3").embedding, [3.0, 1.0, -1.0])
+            # Binary rows are left as they were, in their own dtype
+            np.testing.assert_array_equal(db.get(SubconsciousMemory, "blob").embedding, [3.0, 4.0])
+        self.assertEqual(self.store.migrate_embeddings(), 0)
+
+    def test_unreadable_rows_are_cleared(self):
+        self.insert_raw("broken", "not a vector")
+        self.insert_raw("ok", json.dumps([1.0, 0.0]))
+        self.assertEqual(self.store.migrate_embeddings(), 2)
+        with self.Session() as db:
+            self.assertEqual(len(db.get(SubconsciousMemory, "broken").embedding), 0)
+            np.testing.assert_array_equal(db.get(SubconsciousMemory, "ok").embedding, [1.0, 0.0])
+        # Cleared rows are skipped by searches and left out of the index fingerprint
+        self.assertEqual(self.store._fingerprint(SubconsciousMemory)["count"], 1)
+        results = self.store._search_scan(SubconsciousMemory, [1.0, 0.0], 5)
+        self.assertEqual([r["memory"].id for r in results], ["ok"])
+
+if __name__ == '__main__':
+    unittest.main()